@@ -0,0 +1,78 @@
+"""
+Parser ÚNICO da string de demandas de `records.demands`.
+
+    "AN Entrou, C (10:00-12:30), AI"  →
+        (Demand("AN Entrou", "AN", "Entrou", None, None),
+         Demand("C (10:00-12:30)", "C", None, "10:00", "12:30"),
+         Demand("AI", "AI", None, None, None))
+
+Todo o resto (record_demands, abas do dia, métricas, filtros, edição)
+lê daqui. O resultado é uma tupla imutável e memoizada: a mesma string
+devolve sempre o MESMO objeto, e códigos/variantes são `sys.intern`.
+"""
+import re
+import sys
+from functools import lru_cache
+from typing import NamedTuple
+
+# intervalo de convivência escrito no token: "C (10:00-12:30)"
+_INTERVAL_RE = re.compile(r"\(?\s*(\d{1,2}:\d{2})\s*-\s*(\d{1,2}:\d{2})\s*\)?")
+
+# demandas que geram clone arquivado (archived_ai) quando removidas
+ARCHIVE_CODES = frozenset({"AI", "REA"})
+
+# strings distintas de demandas num banco real ficam na casa das centenas
+PARSE_CACHE_SIZE = 4096
+
+
+class Demand(NamedTuple):
+    token: str                  # como digitado: "C (10:00-12:30)"
+    code: str                   # "C", "AN", "AI"…
+    variant: str | None         # "Entrou" / "Saiu" (AN) ou texto livre
+    start: str | None           # "10:00" (só no intervalo de C)
+    end: str | None
+
+    @property
+    def key(self) -> str:
+        """Chave do filtro de demandas: "AN Entrou" separado, o resto pelo código."""
+        if self.code == "AN" and self.variant:
+            return f"{self.code} {self.variant}"
+        return self.code
+
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def parse_demands(demands: str | None) -> tuple:
+    """Quebra `demands` em Demand(token, code, variant, start, end)."""
+    out = []
+    for tok in (demands or "").split(","):
+        tok = tok.strip()
+        if not tok:
+            continue
+        code, _, rest = tok.partition(" ")
+        rest = rest.strip()
+        start = end = None
+        m = _INTERVAL_RE.fullmatch(rest)
+        if m:
+            start, end = m.groups()
+            rest = ""
+        out.append(Demand(
+            sys.intern(tok), sys.intern(code),
+            sys.intern(rest) if rest else None, start, end,
+        ))
+    return tuple(out)
+
+
+def demand_keys(demands: str | None) -> tuple:
+    """Chaves distintas (ordem de escrita) — as opções do filtro de demandas."""
+    return tuple(dict.fromkeys(d.key for d in parse_demands(demands)))
+
+
+def demand_matches(tokens, wanted: str) -> bool:
+    """
+    `tokens` (de parse_demands) tem a demanda `wanted`?
+      • 'C', 'AN', 'A' …  → pelo código (qualquer intervalo/variante)
+      • 'AN Entrou'       → código + variante
+    """
+    if " " in wanted:
+        return any(d.key == wanted for d in tokens)
+    return any(d.code == wanted for d in tokens)
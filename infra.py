@@ -1,25 +1,469 @@
 import json
 import logging
+import re
 import shutil
 import sqlite3
+import threading
+import time
+import unicodedata
+from contextlib import contextmanager
 from datetime import datetime
+from functools import cache
 from pathlib import Path
-from typing import Optional
 
 from PyQt5.QtWidgets import QMessageBox, QInputDialog
 
+from demands import parse_demands
+
 DB_PATH = Path(__file__).with_name("patients.db")
 CONFIG_FILE = Path(__file__).with_name("settings.json")
 
+# Data canônica (AAAA-MM-DD) derivada de `records.date` (dd/MM/yyyy).
+# Bancos antigos podem ter linhas já em ISO, gravadas pelo importador.
+DATE_ISO_EXPR = (
+    "CASE WHEN date GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]' THEN date "
+    "ELSE substr(date,7,4)||'-'||substr(date,4,2)||'-'||substr(date,1,2) END"
+)
+
+# Minutos desde 00:00 de um horário "HH:mm" (NULL se vazio ou inválido,
+# como QTime.fromString). Base das colunas geradas *_min de `records`.
+TIME_MIN_EXPR = (
+    "CASE WHEN {col} GLOB '[01][0-9]:[0-5][0-9]' OR {col} GLOB '2[0-3]:[0-5][0-9]' "
+    "THEN substr({col},1,2)*60 + substr({col},4,2) END"
+)
+_TIME_RE = re.compile(r"([01][0-9]|2[0-3]):([0-5][0-9])")
+
+
+def time_minutes(text: str | None) -> int | None:
+    """Mesma conversão de TIME_MIN_EXPR, em Python (None se vazio/inválido)."""
+    m = _TIME_RE.fullmatch(text or "")
+    return int(m[1]) * 60 + int(m[2]) if m else None
+
+
+TIME_MIN_COLS = {
+    "enter_sys": "enter_sys_min", "enter_inf": "enter_inf_min",
+    "left_sys": "left_sys_min", "left_inf": "left_inf_min",
+    "start_time": "start_min", "end_time": "end_min",
+}
+
+
+# ------------------------------------------------------------
+#  Perfil de desempenho do SQLite (settings.json → "sqlite")
+#  {"profile": "ssd"} escolhe o preset; outras chaves sobrescrevem.
+# ------------------------------------------------------------
+SQLITE_PROFILES = {
+    # PC da recepção com HD mecânico: páginas maiores e cache grande poupam
+    # seeks; mmap pequeno (page faults num disco lento custam caro).
+    "hdd": {
+        "cache_size": -32768,            # KiB (negativo) → 32 MiB
+        "mmap_size": 64 * 1024 * 1024,
+        "synchronous": "NORMAL",
+        "temp_store": "MEMORY",
+        "page_size": 8192,
+    },
+    # SSD: leitura aleatória barata; mmap cobre o banco inteiro.
+    "ssd": {
+        "cache_size": -16384,
+        "mmap_size": 256 * 1024 * 1024,
+        "synchronous": "NORMAL",
+        "temp_store": "MEMORY",
+        "page_size": 4096,
+    },
+}
+DEFAULT_SQLITE_PROFILE = "hdd"
+
+
+def _profile_value(key: str, value):
+    """
+    Valor de settings.json pronto para o PRAGMA `key`, ou None se inválido.
+    Vai direto para a f-string do PRAGMA: só inteiros e as palavras que o
+    SQLite conhece passam (um erro aqui impediria o app de abrir).
+    """
+    if key == "synchronous":
+        word = str(value).strip().upper()
+        return word if word in _SYNCHRONOUS.values() else None
+    if key == "temp_store":
+        word = str(value).strip().upper()
+        return word if word in _TEMP_STORE.values() else None
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        return None
+    try:
+        n = int(value)
+    except ValueError:
+        return None
+    if key == "mmap_size" and n < 0:
+        return None
+    if key == "page_size" and (n < 512 or n > 65536 or n & (n - 1)):
+        return None
+    return n
+
+
+def sqlite_profile() -> dict:
+    cfg = _load_cfg().get("sqlite") or {}
+    name = cfg.get("profile", DEFAULT_SQLITE_PROFILE)
+    if name not in SQLITE_PROFILES:
+        logging.getLogger(__name__).warning("Perfil SQLite desconhecido: %s", name)
+        name = DEFAULT_SQLITE_PROFILE
+    prof = {"profile": name, **SQLITE_PROFILES[name]}
+    for key, value in cfg.items():
+        if key not in SQLITE_PROFILES[name]:
+            continue
+        clean = _profile_value(key, value)
+        if clean is None:
+            logging.getLogger(__name__).warning(
+                "settings.json: sqlite.%s=%r inválido; usando %r do perfil %s",
+                key, value, prof[key], name,
+            )
+        else:
+            prof[key] = clean
+    return prof
+
 
-def get_conn(timeout: int = 30) -> sqlite3.Connection:
-    conn = sqlite3.connect(DB_PATH, timeout=timeout)
-    conn.execute("PRAGMA journal_mode=WAL")
+def get_conn(
+    timeout: int = 30,
+    check_same_thread: bool = True,
+    profile: dict | None = None,
+) -> sqlite3.Connection:
+    prof = profile or sqlite_profile()
+    conn = sqlite3.connect(DB_PATH, timeout=timeout, check_same_thread=check_same_thread)
+    # auto_vacuum/page_size só em arquivo novo (antes do WAL): num banco
+    # existente o PRAGMA auto_vacuum regrava o cabeçalho e as outras conexões
+    # veem uma "escrita" (data_version). Banco antigo: enable_incremental_vacuum.
+    if conn.execute("PRAGMA page_count").fetchone()[0] == 0:
+        conn.execute(f"PRAGMA page_size={int(prof['page_size'])}")   # antes do auto_vacuum
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    wal = conn.execute("PRAGMA journal_mode=WAL").fetchone()[0].lower() == "wal"
     busy_ms = int(timeout * 1000)
     conn.execute(f"PRAGMA busy_timeout={busy_ms}")
+    conn.execute(f"PRAGMA cache_size={int(prof['cache_size'])}")
+    conn.execute(f"PRAGMA mmap_size={int(prof['mmap_size'])}")
+    conn.execute(f"PRAGMA temp_store={prof['temp_store']}")
+    if wal:   # NORMAL sem WAL arrisca o banco numa queda de energia
+        conn.execute(f"PRAGMA synchronous={prof['synchronous']}")
     return conn
 
 
+_SYNCHRONOUS = {0: "OFF", 1: "NORMAL", 2: "FULL", 3: "EXTRA"}
+_TEMP_STORE = {0: "DEFAULT", 1: "FILE", 2: "MEMORY"}
+
+
+def sqlite_diagnostics() -> dict:
+    """Valores efetivos na conexão atual (o que o SQLite aceitou de fato)."""
+    conn = connection()
+
+    def pragma(name):
+        return conn.execute(f"PRAGMA {name}").fetchone()[0]
+
+    wal = Path(f"{DB_PATH}-wal")
+    return {
+        "profile": sqlite_profile()["profile"],
+        "sqlite_version": sqlite3.sqlite_version,
+        "journal_mode": pragma("journal_mode"),
+        "synchronous": _SYNCHRONOUS.get(pragma("synchronous"), "?"),
+        "temp_store": _TEMP_STORE.get(pragma("temp_store"), "?"),
+        "cache_size": pragma("cache_size"),
+        "mmap_size": pragma("mmap_size"),
+        "page_size": pragma("page_size"),
+        "page_count": pragma("page_count"),
+        "freelist_count": pragma("freelist_count"),
+        "auto_vacuum": pragma("auto_vacuum"),
+        "user_version": pragma("user_version"),
+        "db_mb": round(DB_PATH.stat().st_size / 2**20, 2) if DB_PATH.exists() else 0,
+        "wal_mb": round(wal.stat().st_size / 2**20, 2) if wal.exists() else 0,
+    }
+
+
+class ConnectionManager:
+    """
+    Mantém UMA conexão por thread, aberta sob demanda e reaproveitada
+    (PRAGMAs aplicados só na abertura). Se DB_PATH mudar, reabre.
+    A chave é o ident da thread, não threading.local: threads do
+    QThreadPool perdem o threading.local entre uma tarefa e outra.
+    """
+
+    def __init__(self, timeout: int = 30):
+        self.timeout = timeout
+        self._conns: dict[int, tuple] = {}     # ident → (conexão, DB_PATH)
+        self._hooks: dict[int, list] = {}      # ident → on_commit da transação aberta
+        self._lock = threading.Lock()
+        self._open: list[sqlite3.Connection] = []
+        self.writes = 0                 # transações confirmadas neste processo
+
+    def connection(self) -> sqlite3.Connection:
+        ident = threading.get_ident()
+        conn, path = self._conns.get(ident, (None, None))
+        if conn is not None and path == DB_PATH:
+            return conn
+        if conn is not None:                       # banco trocado (ex.: testes)
+            self._discard(conn)
+        # check_same_thread=False só para permitir o close() no encerramento;
+        # cada conexão continua sendo usada apenas pela thread dona.
+        conn = get_conn(self.timeout, check_same_thread=False)
+        with self._lock:
+            self._conns[ident] = (conn, DB_PATH)
+            self._open.append(conn)
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        """
+        BEGIN IMMEDIATE … COMMIT (ou ROLLBACK se algo der errado).
+        Dentro de outra transação vira SAVEPOINT. O que foi agendado com
+        on_commit() roda depois do COMMIT e é descartado no ROLLBACK.
+        """
+        conn = self.connection()
+        ident = threading.get_ident()
+        if conn.in_transaction:
+            hooks = self._hooks.setdefault(ident, [])
+            mark = len(hooks)
+            conn.execute("SAVEPOINT nested")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK TO nested")
+                conn.execute("RELEASE nested")
+                del hooks[mark:]
+                raise
+            conn.execute("RELEASE nested")
+            return
+
+        hooks = self._hooks[ident] = []
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+            conn.commit()
+        except BaseException:
+            self._hooks.pop(ident, None)
+            conn.rollback()
+            raise
+        self._hooks.pop(ident, None)
+        with self._lock:
+            self.writes += 1
+        for fn in hooks:
+            fn()
+
+    def on_commit(self, fn) -> None:
+        """
+        fn() depois do COMMIT da transação aberta nesta thread (ex.: limpar
+        caches — antes disso outra thread ainda leria o dado antigo).
+        Sem transação aberta, roda na hora.
+        """
+        hooks = self._hooks.get(threading.get_ident())
+        if hooks is None:
+            fn()
+        else:
+            hooks.append(fn)
+
+    def change_stamp(self) -> tuple:
+        """
+        (banco, PRAGMA data_version, escritas deste processo). data_version
+        só muda quando OUTRA conexão confirma algo (outro PC, outra thread);
+        o contador cobre as escritas feitas por esta. Carimbo igual = nada mudou.
+        """
+        version, = self.connection().execute("PRAGMA data_version").fetchone()
+        return DB_PATH, version, self.writes
+
+    def checkpoint(self) -> None:
+        """Descarrega o WAL no arquivo principal (antes de copiar o .db)."""
+        conn, path = self._conns.get(threading.get_ident(), (None, None))
+        if conn is not None and path == DB_PATH:
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def close_all(self) -> None:
+        with self._lock:
+            conns, self._open = self._open, []
+            self._conns = {}
+        for conn in conns:
+            try:
+                conn.close()
+            except sqlite3.Error as exc:
+                logging.getLogger(__name__).warning(
+                    "Falha ao fechar conexão: %s", exc
+                )
+
+    def _discard(self, conn: sqlite3.Connection) -> None:
+        with self._lock:
+            if conn in self._open:
+                self._open.remove(conn)
+        conn.close()
+
+
+_manager = ConnectionManager()
+connection = _manager.connection
+transaction = _manager.transaction
+on_commit = _manager.on_commit
+change_stamp = _manager.change_stamp
+close_connections = _manager.close_all
+
+
+# ------------------------------------------------------------
+#  Linhas como objetos compactos (__slots__) nomeados pelo SELECT
+#      rows = c.cursor(RecordCursor).execute("SELECT id, lunch …").fetchall()
+#      rows[0].lunch
+# ------------------------------------------------------------
+class Record:
+    """Base das linhas de RecordCursor: um atributo por coluna projetada."""
+
+    __slots__ = ()
+    _fields: tuple = ()
+
+    def __init__(self, *values):
+        for name, value in zip(self._fields, values):
+            setattr(self, name, value)
+
+    # ainda se comporta como a tupla de antes (tabelas, testes)
+    def __iter__(self):
+        return (getattr(self, name) for name in self._fields)
+
+    def __len__(self):
+        return len(self._fields)
+
+    def __getitem__(self, index):
+        return tuple(self)[index]
+
+    def __eq__(self, other):
+        if isinstance(other, (Record, tuple)):
+            return tuple(self) == tuple(other)
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return "Record(" + ", ".join(f"{n}={getattr(self, n)!r}" for n in self._fields) + ")"
+
+
+@cache
+def record_type(fields: tuple) -> type:
+    """Uma classe por conjunto de colunas (as consultas do app são fixas)."""
+    return type("Record", (Record,), {"__slots__": fields, "_fields": fields})
+
+
+class RecordCursor(sqlite3.Cursor):
+    """Cursor cujo row_factory devolve Record em vez de tupla."""
+
+    def __init__(self, conn):
+        super().__init__(conn)
+        self._desc = self._type = None
+        self.row_factory = RecordCursor._make
+
+    @staticmethod
+    def _make(cursor, row):
+        if cursor.description is not cursor._desc:      # nova consulta
+            cursor._desc = cursor.description
+            cursor._type = record_type(tuple(d[0] for d in cursor._desc))
+        return cursor._type(*row)
+
+
+def sync_demands(c, record_id: int, demands: str | None) -> None:
+    """Regrava as linhas de record_demands de um registro (conn ou cursor)."""
+    c.execute("DELETE FROM record_demands WHERE record_id=?", (record_id,))
+    c.executemany(
+        """
+        INSERT INTO record_demands
+               (record_id, pos, token, code, variant, start_time, end_time)
+        VALUES (?,?,?,?,?,?,?)
+        """,
+        [(record_id, pos, *tok) for pos, tok in enumerate(parse_demands(demands))],
+    )
+
+
+def name_key(name: str | None) -> str | None:
+    """Chave de identidade do paciente: sem acento, sem caixa, espaços únicos."""
+    text = unicodedata.normalize("NFKD", name or "")
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return " ".join(text.casefold().split()) or None
+
+
+def patient_id_for(c, name: str | None) -> int | None:
+    """id em patients para `name` (cria se preciso); None para nome vazio."""
+    key = name_key(name)
+    if key is None:
+        return None
+    c.execute(
+        "INSERT OR IGNORE INTO patients (name, name_key) VALUES (?,?)",
+        (" ".join(name.split()), key),
+    )
+    return c.execute("SELECT id FROM patients WHERE name_key=?", (key,)).fetchone()[0]
+
+
+def update_daily_metrics(c, days) -> None:
+    """
+    Recalcula daily_metrics dos dias `days` (AAAA-MM-DD) a partir de records.
+    Custa o tamanho de um dia, não do histórico; chamado pelas rotinas de escrita.
+    Datas ilegíveis (date_iso NULL) ficam agrupadas sob a chave ''.
+    """
+    for day in set(days):
+        key_day = day or ""
+        c.execute("DELETE FROM daily_metrics WHERE date_iso=?", (key_day,))
+        total, desj, alm, lan, jan = c.execute("""
+            SELECT COUNT(*), SUM(desjejum), SUM(lunch), SUM(snack), SUM(dinner)
+              FROM records WHERE date_iso IS ? AND archived_ai=0
+        """, (day,)).fetchone()
+        rows = [
+            ("base", "total de Pacientes", total),
+            ("base", "desj", desj or 0), ("base", "alm", alm or 0),
+            ("base", "lan", lan or 0),   ("base", "jan", jan or 0),
+        ]
+        rows += [("enc", enc, n) for enc, n in c.execute("""
+            SELECT TRIM(encaminhamento), COUNT(*)
+              FROM records
+             WHERE date_iso IS ? AND archived_ai=0
+               AND TRIM(COALESCE(encaminhamento, '')) <> ''
+             GROUP BY 1
+        """, (day,))]
+        rows += [("dmd", code, n) for code, n in c.execute("""
+            SELECT d.code, COUNT(DISTINCT d.record_id)
+              FROM records r JOIN record_demands d ON d.record_id = r.id
+             WHERE r.date_iso IS ? AND r.archived_ai=0
+               AND NOT (d.code = 'AN' AND d.variant IS 'Saiu')
+             GROUP BY d.code
+        """, (day,))]
+        c.executemany(
+            "INSERT INTO daily_metrics (date_iso, kind, key, n) VALUES (?,?,?,?)",
+            [(key_day, kind, key, n) for kind, key, n in rows if n],
+        )
+
+
+def update_daily_metrics_for(c, ids) -> None:
+    """Atalho: recalcula os dias dos registros `ids`."""
+    ids = list(ids)
+    qs = ",".join("?" * len(ids))
+    update_daily_metrics(c, [d for (d,) in c.execute(
+        f"SELECT DISTINCT date_iso FROM records WHERE id IN ({qs})", ids
+    )])
+
+
+def rebuild_daily_metrics(c=None) -> None:
+    """Refaz daily_metrics do zero (bancos existentes / reparo)."""
+    if c is None:
+        with transaction() as conn:
+            return rebuild_daily_metrics(conn)
+    c.execute("DELETE FROM daily_metrics")
+    update_daily_metrics(c, [d for (d,) in c.execute(
+        "SELECT DISTINCT date_iso FROM records"
+    )])
+
+
+def covered_meals(start: str | None, end: str | None) -> tuple:
+    """
+    (desjejum, lunch, snack, dinner) cobertos pelo intervalo de convivência
+    start–end, em 0/1. A conversão é a mesma das colunas *_min, mas sem ir
+    ao banco: roda a cada clique nas caixas de refeição.
+    """
+    s, e = time_minutes(start), time_minutes(end)
+    if s is None or e is None:
+        return (0, 0, 0, 0)
+    return tuple(int(s <= m <= e) for m in MEAL_MINUTES.values())
+
+
+def to_iso_date(value: str) -> str:
+    """Converte 'dd/MM/yyyy' (ou já 'AAAA-MM-DD') para 'AAAA-MM-DD'."""
+    value = (value or "").strip()
+    if len(value) == 10 and value[4] == "-" and value[7] == "-":
+        return value
+    return f"{value[6:10]}-{value[3:5]}-{value[0:2]}"
+
+
 def _load_cfg(parent=None) -> dict:
     if CONFIG_FILE.exists():
         try:
@@ -57,7 +501,7 @@ def _save_cfg(data: dict) -> None:
     CONFIG_FILE.write_text(json.dumps(data, indent=2), encoding="utf-8")
 
 
-def get_backup_root(parent=None) -> Optional[Path]:
+def get_backup_root(parent=None) -> Path | None:
     """Retorna um diretório de backup gravável dentro do Google Drive."""
     logger = logging.getLogger(__name__)
     cfg = _load_cfg()
@@ -102,7 +546,7 @@ def get_backup_root(parent=None) -> Optional[Path]:
             raise
 
 
-def backup_now(parent=None, now: Optional[datetime] = None) -> None:
+def backup_now(parent=None, now: datetime | None = None) -> None:
     """
     Copia patients.db para:
         <pasta-backup>\\AAAA-MM\\<DD>\\patients_HH-MM-SS.db
@@ -118,6 +562,7 @@ def backup_now(parent=None, now: Optional[datetime] = None) -> None:
         day_dir.mkdir(parents=True, exist_ok=True)
 
         dest = day_dir / f"patients_{now.strftime('%H-%M-%S')}.db"
+        _manager.checkpoint()          # conexões longas deixam dados no -wal
         shutil.copy2(DB_PATH, dest)
 
         if parent:
@@ -132,61 +577,362 @@ def backup_now(parent=None, now: Optional[datetime] = None) -> None:
             raise
 
 
-def init_db():
-    with get_conn() as c:
-        # tabela principal
-        c.execute("""
-        CREATE TABLE IF NOT EXISTS records(
-          id INTEGER PRIMARY KEY AUTOINCREMENT,
-          patient_name TEXT, demands TEXT, reference_prof TEXT,
-          date TEXT,
-          enter_sys TEXT, enter_inf TEXT,
-          left_sys  TEXT, left_inf  TEXT,
-          observations TEXT, encaminhamento TEXT,
-          desjejum INTEGER DEFAULT 0, lunch INTEGER DEFAULT 0,
-          snack INTEGER DEFAULT 0, dinner INTEGER DEFAULT 0,
-          start_time TEXT, end_time TEXT
-        )
-        """)
-        # tabela de log
-        c.execute("""
-        CREATE TABLE IF NOT EXISTS meal_log(
-          log_id INTEGER PRIMARY KEY AUTOINCREMENT,
-          record_id INTEGER, ts TEXT,
-          old_b INTEGER, old_l INTEGER, old_s INTEGER, old_d INTEGER,
-          new_b INTEGER, new_l INTEGER, new_s INTEGER, new_d INTEGER
+# ------------------------------------------------------------
+#  Manutenção do banco (Main._maint_timer, com a recepção parada)
+#  Sobrescreva qualquer chave em settings.json → "maintenance".
+# ------------------------------------------------------------
+MAINTENANCE_DEFAULTS = {
+    "enabled": True,
+    "interval_min": 10,       # de quanto em quanto tempo tenta rodar
+    "idle_sec": 120,          # só roda após esse tempo sem teclado/mouse
+    "analyze_hours": 24,      # ANALYZE completo no máximo 1x por período
+    "wal_truncate_mb": 16,    # -wal acima disso → checkpoint TRUNCATE
+    "vacuum_pages": 256,      # páginas livres devolvidas por rodada (0 = nunca)
+}
+
+
+def maintenance_cfg() -> dict:
+    cfg = _load_cfg().get("maintenance") or {}
+    return {**MAINTENANCE_DEFAULTS,
+            **{k: v for k, v in cfg.items() if k in MAINTENANCE_DEFAULTS}}
+
+
+def run_maintenance(cfg: dict | None = None, *, analyze: bool = False) -> dict:
+    """
+    PRAGMA optimize, checkpoint do WAL (PASSIVE; TRUNCATE se o -wal cresceu),
+    incremental_vacuum e, se `analyze`, ANALYZE. Devolve {passo: ms} e loga.
+    Banco antigo sem auto_vacuum=INCREMENTAL pula o vacuum: a conversão
+    reescreve o arquivo inteiro e fica para enable_incremental_vacuum().
+    """
+    cfg = cfg or maintenance_cfg()
+    conn = connection()
+    timings = {}
+
+    def step(name, sql):
+        t0 = time.perf_counter()
+        conn.execute(sql).fetchall()
+        timings[name] = round((time.perf_counter() - t0) * 1000, 1)
+
+    if analyze:
+        step("analyze", "ANALYZE")
+    step("optimize", "PRAGMA optimize")
+
+    wal = Path(f"{DB_PATH}-wal")
+    if wal.exists() and wal.stat().st_size > cfg["wal_truncate_mb"] * 1024 * 1024:
+        step("checkpoint_truncate", "PRAGMA wal_checkpoint(TRUNCATE)")
+    else:
+        step("checkpoint_passive", "PRAGMA wal_checkpoint(PASSIVE)")
+
+    if cfg["vacuum_pages"] and conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+        step("incremental_vacuum", f"PRAGMA incremental_vacuum({int(cfg['vacuum_pages'])})")
+
+    logging.getLogger(__name__).info(
+        "Manutenção do banco: %s",
+        ", ".join(f"{name} {ms} ms" for name, ms in timings.items()),
+    )
+    return timings
+
+
+def enable_incremental_vacuum() -> None:
+    """
+    Converte um banco antigo para auto_vacuum=INCREMENTAL com um VACUUM
+    completo (reescreve o arquivo; pode levar minutos). Ação explícita do
+    Diagnóstico, rodada fora da thread da tela.
+    """
+    conn = connection()
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    conn.execute("VACUUM")
+
+
+# ------------------------------------------------------------
+#  Migrações de esquema (PRAGMA user_version = nº da última aplicada)
+#  Cada passo roda uma única vez, na sua própria transação. Bancos
+#  antigos (user_version 0) podem já ter parte do esquema, por isso
+#  os passos conferem o que existe antes de alterar.
+# ------------------------------------------------------------
+def _m001_base_tables(c) -> None:
+    # tabela principal
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS records(
+      id INTEGER PRIMARY KEY AUTOINCREMENT,
+      patient_name TEXT, demands TEXT, reference_prof TEXT,
+      date TEXT,
+      enter_sys TEXT, enter_inf TEXT,
+      left_sys  TEXT, left_inf  TEXT,
+      observations TEXT, encaminhamento TEXT,
+      desjejum INTEGER DEFAULT 0, lunch INTEGER DEFAULT 0,
+      snack INTEGER DEFAULT 0, dinner INTEGER DEFAULT 0,
+      start_time TEXT, end_time TEXT
+    )
+    """)
+    # tabela de log
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS meal_log(
+      log_id INTEGER PRIMARY KEY AUTOINCREMENT,
+      record_id INTEGER, ts TEXT,
+      old_b INTEGER, old_l INTEGER, old_s INTEGER, old_d INTEGER,
+      new_b INTEGER, new_l INTEGER, new_s INTEGER, new_d INTEGER
+    )
+    """)
+
+    # log de mudanças de demandas
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS demand_log (
+      log_id      INTEGER PRIMARY KEY AUTOINCREMENT,
+      record_id   INTEGER,
+      ts          TEXT,
+      old_demands TEXT,
+      new_demands TEXT
+    )
+    """)
+
+    # migração de colunas faltantes (table_xinfo também lista colunas geradas)
+    existing = [r[1] for r in c.execute("PRAGMA table_xinfo(records)")]
+    for col in ["enter_sys", "enter_inf", "left_sys", "left_inf", "desjejum"]:
+        if col not in existing:
+            c.execute(
+                f"ALTER TABLE records ADD COLUMN {col} "
+                f"{'INTEGER DEFAULT 0' if col=='desjejum' else 'TEXT'}"
+            )
+    # migra coluna 'time' antiga
+    if "time" in existing and "enter_sys" in existing:
+        c.execute("UPDATE records SET enter_sys=time WHERE enter_sys IS NULL OR enter_sys=''" )
+
+    # antes de date_iso: bancos novos mantêm a ordem de colunas dos antigos
+    if "archived_ai" not in existing:
+        c.execute("ALTER TABLE records ADD COLUMN archived_ai INTEGER DEFAULT 0")
+
+
+def _m002_log_indexes(c) -> None:
+    # histórico por registro (marcador 🖊️ e duplo-clique)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_meal_log_record ON meal_log(record_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_demand_log_record ON demand_log(record_id)")
+
+
+def _m003_date_iso(c) -> None:
+    # linhas importadas em AAAA-MM-DD não apareciam nas abas do dia
+    c.execute("""
+        UPDATE records
+           SET date = substr(date,9,2)||'/'||substr(date,6,2)||'/'||substr(date,1,4)
+         WHERE date GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]'
+    """)
+
+    # data ordenável e indexada para filtros por dia/intervalo
+    existing = [r[1] for r in c.execute("PRAGMA table_xinfo(records)")]
+    if "date_iso" not in existing:
+        c.execute(
+            "ALTER TABLE records ADD COLUMN date_iso TEXT "
+            f"GENERATED ALWAYS AS ({DATE_ISO_EXPR}) VIRTUAL"
         )
-        """)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_records_date_iso ON records(date_iso)")
+
+
+def _m004_record_demands(c) -> None:
+    # uma linha por demanda de cada registro (substitui split(",") em Python)
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS record_demands(
+      record_id  INTEGER NOT NULL,
+      pos        INTEGER NOT NULL,
+      token      TEXT NOT NULL,
+      code       TEXT NOT NULL,
+      variant    TEXT,
+      start_time TEXT, end_time TEXT
+    )
+    """)
+    c.execute(
+        "CREATE INDEX IF NOT EXISTS idx_record_demands_record "
+        "ON record_demands(record_id)"
+    )
+    c.execute(
+        "CREATE INDEX IF NOT EXISTS idx_record_demands_code "
+        "ON record_demands(code, variant, record_id)"
+    )
+    for rid, demands in c.execute("SELECT id, demands FROM records").fetchall():
+        sync_demands(c, rid, demands)
+
+
+def _m005_rollover(c) -> None:
+    # rollover de AN / _get_or_create: “paciente X já existe no dia Y?”
+    c.execute(
+        "CREATE INDEX IF NOT EXISTS idx_records_name_date "
+        "ON records(patient_name, date_iso)"
+    )
+    # dias em que o rollover de AN já rodou (uma vez por data)
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS rollover_log(
+      date_iso TEXT PRIMARY KEY,
+      ts       TEXT
+    )
+    """)
+
+
+def _m006_daily_metrics(c) -> None:
+    # contadores por dia/código para o “Consolidado (geral)”
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS daily_metrics(
+      date_iso TEXT NOT NULL,
+      kind     TEXT NOT NULL,      -- base | dmd | enc
+      key      TEXT NOT NULL,
+      n        INTEGER NOT NULL,
+      PRIMARY KEY (date_iso, kind, key)
+    ) WITHOUT ROWID
+    """)
+    rebuild_daily_metrics(c)
+
+
+def _m007_records_fts(c) -> None:
+    # busca textual (nome / profissional / observações) sem varrer records:
+    # tokens sem acento e sem caixa ("jose" acha "José"), prefixos de 2-3 letras
+    c.execute("""
+    CREATE VIRTUAL TABLE IF NOT EXISTS records_fts USING fts5(
+      patient_name, reference_prof, observations,
+      content='records', content_rowid='id',
+      tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    """)
+    # índice externo: os gatilhos mantêm em dia qualquer rotina de escrita
+    # (um execute por gatilho: executescript faria COMMIT no meio da migração)
+    add = """
+      INSERT INTO records_fts(rowid, patient_name, reference_prof, observations)
+      VALUES (new.id, new.patient_name, new.reference_prof, new.observations);
+    """
+    drop = """
+      INSERT INTO records_fts(records_fts, rowid, patient_name, reference_prof, observations)
+      VALUES ('delete', old.id, old.patient_name, old.reference_prof, old.observations);
+    """
+    c.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS records_fts_ai AFTER INSERT ON records
+    BEGIN {add} END
+    """)
+    c.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS records_fts_ad AFTER DELETE ON records
+    BEGIN {drop} END
+    """)
+    c.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS records_fts_au
+    AFTER UPDATE OF patient_name, reference_prof, observations ON records
+    BEGIN {drop} {add} END
+    """)
+    c.execute("INSERT INTO records_fts(records_fts) VALUES ('rebuild')")
 
-        # log de mudanças de demandas
-        c.execute("""
-        CREATE TABLE IF NOT EXISTS demand_log (
-          log_id      INTEGER PRIMARY KEY AUTOINCREMENT,
-          record_id   INTEGER,
-          ts          TEXT,
-          old_demands TEXT,
-          new_demands TEXT
+
+def _m008_patients(c) -> None:
+    # identidade do paciente por chave normalizada, não pela string do nome
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS patients(
+      id       INTEGER PRIMARY KEY AUTOINCREMENT,
+      name     TEXT NOT NULL,
+      name_key TEXT NOT NULL
+    )
+    """)
+    c.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_patients_name_key ON patients(name_key)"
+    )
+    existing = [r[1] for r in c.execute("PRAGMA table_xinfo(records)")]
+    if "patient_id" not in existing:
+        c.execute(
+            "ALTER TABLE records ADD COLUMN patient_id INTEGER REFERENCES patients(id)"
+        )
+    for (name,) in c.execute(
+        "SELECT DISTINCT patient_name FROM records WHERE patient_name IS NOT NULL"
+    ).fetchall():
+        c.execute(
+            "UPDATE records SET patient_id=? WHERE patient_name=?",
+            (patient_id_for(c, name), name),
         )
+    # histórico por paciente / “já existe no dia?” (rollover, importação)
+    c.execute(
+        "CREATE INDEX IF NOT EXISTS idx_records_patient_date "
+        "ON records(patient_id, date_iso)"
+    )
+    c.execute("DROP INDEX IF EXISTS idx_records_name_date")
+
+
+# refeições com índice próprio: coluna → nome curto do índice
+MEAL_COLS = {"desjejum": "desj", "lunch": "lunch", "snack": "snack", "dinner": "dinner"}
+
+# horário de cada refeição (minutos desde 00:00): 09:00, 12:00, 15:00, 18:00
+MEAL_MINUTES = {"desjejum": 540, "lunch": 720, "snack": 900, "dinner": 1080}
+
+
+def _m009_day_indexes(c) -> None:
+    # índices parciais: só entram os registros ativos (sem saída, não arquivados),
+    # então cada aba lê poucas páginas mesmo com anos de histórico.
+    # archived_ai/left_sys repetidos na chave: com 3 igualdades o planejador
+    # prefere estes ao idx_records_date_iso mesmo sem ANALYZE.
+    # (date_iso é coluna virtual: no SQLite 3.40 nenhum deles vira “covering”)
+    # fetch(ativos)
+    c.execute("""
+        CREATE INDEX IF NOT EXISTS idx_records_active_day
+            ON records(date_iso, archived_ai, left_sys)
+         WHERE left_sys IS NULL AND archived_ai = 0
+    """)
+    # _copy_meal / meal_rows(): já na ordem de patient_name (sem sort)
+    for col, short in MEAL_COLS.items():
+        c.execute(f"""
+            CREATE INDEX IF NOT EXISTS idx_records_{short}_day
+                ON records(date_iso, archived_ai, left_sys, patient_name)
+             WHERE {col} = 1 AND left_sys IS NULL AND archived_ai = 0
         """)
+    # subconsultas “1º código / token C” (ORDER BY pos) sem sort por registro
+    c.execute("DROP INDEX IF EXISTS idx_record_demands_record")
+    c.execute(
+        "CREATE INDEX idx_record_demands_record ON record_demands(record_id, pos)"
+    )
+    # _fetch_acolh(): ativos com encaminhamento (ORDER BY id vem do rowid)
+    c.execute("""
+        CREATE INDEX IF NOT EXISTS idx_records_acolh_day
+            ON records(date_iso, archived_ai, left_sys)
+         WHERE encaminhamento IS NOT NULL AND left_sys IS NULL AND archived_ai = 0
+    """)
 
-        # migração de colunas faltantes
-        existing = [r[1] for r in c.execute("PRAGMA table_info(records)")]
-        for col in ["enter_sys", "enter_inf", "left_sys", "left_inf", "desjejum"]:
-            if col not in existing:
-                c.execute(
-                    f"ALTER TABLE records ADD COLUMN {col} "
-                    f"{'INTEGER DEFAULT 0' if col=='desjejum' else 'TEXT'}"
-                )
-        # migra coluna 'time' antiga
-        if "time" in existing and "enter_sys" in existing:
-            c.execute("UPDATE records SET enter_sys=time WHERE enter_sys IS NULL OR enter_sys=''" )
-        c.commit()
-        if "archived_ai" not in existing:
-            c.execute("ALTER TABLE records ADD COLUMN archived_ai INTEGER DEFAULT 0")
+
+def _m010_time_minutes(c) -> None:
+    # horários como inteiros (minutos desde 00:00): validação, ordenação do
+    # “C” e cobertura das refeições comparam números, sem ler "HH:mm".
+    # VIRTUAL como date_iso: o SQLite recalcula a cada escrita e as linhas
+    # antigas já saem preenchidas (ALTER TABLE não aceita STORED).
+    existing = [r[1] for r in c.execute("PRAGMA table_xinfo(records)")]
+    for col, min_col in TIME_MIN_COLS.items():
+        if min_col not in existing:
+            c.execute(
+                f"ALTER TABLE records ADD COLUMN {min_col} INTEGER "
+                f"GENERATED ALWAYS AS ({TIME_MIN_EXPR.format(col=col)}) VIRTUAL"
+            )
+
+
+# ordem importa: a posição (1, 2, …) é o user_version depois do passo
+MIGRATIONS = [
+    _m001_base_tables,
+    _m002_log_indexes,
+    _m003_date_iso,
+    _m004_record_demands,
+    _m005_rollover,
+    _m006_daily_metrics,
+    _m007_records_fts,
+    _m008_patients,
+    _m009_day_indexes,
+    _m010_time_minutes,
+]
+
+
+def schema_version(c=None) -> int:
+    if c is None:
+        return schema_version(connection())
+    return c.execute("PRAGMA user_version").fetchone()[0]
+
+
+def init_db():
+    """Aplica as migrações pendentes; banco em dia custa uma leitura de pragma."""
+    version = schema_version()
+    for number, step in enumerate(MIGRATIONS[version:], start=version + 1):
+        with transaction() as c:
+            step(c)
+            c.execute(f"PRAGMA user_version = {number}")
 
 
 def _fix_old_imports(parent=None):
-    with get_conn() as conn:
+    with transaction() as conn:
         cur = conn.cursor()
         cur.execute("""
             UPDATE records
@@ -202,6 +948,6 @@ def _fix_old_imports(parent=None):
                AND enter_inf LIKE '09:%'
         """)
         n2 = cur.rowcount
-        conn.commit()
+        rebuild_daily_metrics(conn)
     QMessageBox.information(parent, "Reparo concluído",
                             f"{n1} horários corrigidos\n{n2} desjejuns marcados")
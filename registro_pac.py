@@ -11,26 +11,48 @@ Registro de Pacientes – v3.5 😎
 Requisito único: PyQt5
 """
 import logging
+import re
+import string
 import sys
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime
+from functools import lru_cache, partial
+from operator import attrgetter
 from pathlib import Path
 
-from PyQt5.QtCore  import Qt, QTime, QDate, QTimer
+from PyQt5.QtCore  import Qt, QTime, QDate, QTimer, QEvent
 from PyQt5.QtGui   import QPixmap, QGuiApplication
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QLabel, QLineEdit, QPushButton, QMessageBox,
     QVBoxLayout, QWidget, QHBoxLayout, QCheckBox, QDialog, QFormLayout,
     QTimeEdit, QComboBox, QTableWidget, QTableWidgetItem, QHeaderView,
-    QDateEdit, QTabWidget, QFileDialog, QProgressDialog, QInputDialog,
+    QDateEdit, QTabWidget, QFileDialog, QProgressDialog, QInputDialog, QMenu,
 )
 
+import infra
 from infra import (
     CONFIG_FILE,
+    RecordCursor,
     _load_cfg,
     _save_cfg,
     backup_now,
-    get_conn,
+    change_stamp,
+    close_connections,
+    connection,
+    covered_meals,
     init_db,
+    maintenance_cfg,
+    name_key,
+    on_commit,
+    patient_id_for,
+    run_maintenance,
+    sync_demands,
+    update_daily_metrics,
+    update_daily_metrics_for,
+    to_iso_date,
+    transaction,
     _fix_old_imports,
 )
 from importlib import util as importlib_util
@@ -71,21 +93,29 @@ def _pandas_ready(parent):
         "Instale com: pip install pandas xlsxwriter" + details,
     )
     return False
+from demands import ARCHIVE_CODES, demand_keys, demand_matches, parse_demands
 from ui.dialogs import (
+    DiagnosticsDialog,
     EncaminhamentoDialog,
     SearchDialog,
     SimpleTimeDialog,
     TimeIntervalDialog,
 )
-from ui.widgets import MyLineEdit
+from ui.executor import QueryExecutor
+from ui.models import ROW_ID_ROLE, RowFilterProxy, RowTableModel
+from ui.widgets import MyLineEdit, RowTableView
 
-# ─────────────────────────────────────── Constantes de horário
-HORARIOS = {
-    "desjejum": QTime.fromString("09:00", "HH:mm"),
-    "almoco":   QTime.fromString("12:00", "HH:mm"),
-    "lanche":   QTime.fromString("15:00", "HH:mm"),
-    "janta":    QTime.fromString("18:00", "HH:mm"),
-}
+# Rollover de AN: máximo de dias sem uso preenchidos de uma vez
+ROLLOVER_MAX_GAP = 14
+
+# de quanto em quanto tempo olha se outro PC gravou no banco compartilhado
+CHANGE_POLL_MS = 3000
+
+# Códigos de demanda exibidos nos consolidados
+METRIC_CODES = [
+    "A", "R", "M", "C", "RM",
+    "Grupos/Eventos", "Outros", "AI", "REA", "AN",
+]
 
 # Todos os códigos de demanda conhecidos
 DEMAND_LIST = [
@@ -116,15 +146,28 @@ def add_record(row: dict):
             (f"; extras {', '.join(extra)}" if extra else "")
         )
 
-    cols = ", ".join(EXPECTED_COLS)
-    qs = ", ".join("?" * len(EXPECTED_COLS))
+    cols = ", ".join(EXPECTED_COLS + ["patient_id"])
+    qs = ", ".join("?" * (len(EXPECTED_COLS) + 1))
     values = tuple(row[c] for c in EXPECTED_COLS)
-    with get_conn() as c:
-        c.execute(f"INSERT INTO records ({cols}) VALUES ({qs})", values)
-        c.commit()
+    with transaction() as c:
+        values += (patient_id_for(c, row["patient_name"]),)
+        cur = c.execute(f"INSERT INTO records ({cols}) VALUES ({qs})", values)
+        sync_demands(c, cur.lastrowid, row["demands"])
+        update_daily_metrics_for(c, [cur.lastrowid])
+        invalidate_records(c, [cur.lastrowid])
+        return changed_records(c, [cur.lastrowid])
+
+def update_record_fields(c, pid, fields: dict) -> None:
+    """UPDATE records SET <campos> WHERE id=? — só colunas de EXPECTED_COLS."""
+    unknown = [col for col in fields if col not in EXPECTED_COLS]
+    if unknown:
+        raise ValueError(f"Campos inválidos: {', '.join(unknown)}")
+    sets = ", ".join(f"{col}=?" for col in fields)
+    c.execute(f"UPDATE records SET {sets} WHERE id=?", (*fields.values(), pid))
+
 
 def update_meals(pid, new_b, new_l, new_s, new_d):
-    with get_conn() as c:
+    with transaction() as c:
         row = c.execute(
             "SELECT desjejum,lunch,snack,dinner,left_sys,archived_ai FROM records WHERE id=?",
             (pid,),
@@ -142,12 +185,14 @@ def update_meals(pid, new_b, new_l, new_s, new_d):
             raise ValueError("Este registro é um clone arquivado e não pode ser editado.")
 
         if (old_b, old_l, old_s, old_d) == (new_b, new_l, new_s, new_d):
-            return  # nada mudou
+            return []  # nada mudou
 
         c.execute("""
             UPDATE records SET desjejum=?, lunch=?, snack=?, dinner=?
             WHERE id=?
         """, (new_b, new_l, new_s, new_d, pid))
+        update_daily_metrics_for(c, [pid])
+        invalidate_records(c, [pid])
 
         # ⚠️	AGORA são 10 placeholders (record_id + 9 valores) 👇
         c.execute("""
@@ -163,14 +208,7 @@ def update_meals(pid, new_b, new_l, new_s, new_d):
             old_b, old_l, old_s, old_d,
             new_b, new_l, new_s, new_d
         ))
-        c.commit()
-
-def _covers_interval(qt, start_t, end_t):
-    if not (start_t and end_t):
-        return False
-    t0 = QTime.fromString(start_t, "HH:mm")
-    t1 = QTime.fromString(end_t, "HH:mm")
-    return t0 <= qt <= t1
+        return changed_records(c, [pid])
 
 def update_demands(pid, new_demands, new_start=None, new_end=None, new_enc=None):
     """
@@ -184,35 +222,24 @@ def update_demands(pid, new_demands, new_start=None, new_end=None, new_enc=None)
             "corrija o intervalo antes de salvar."
         )
 
-    if new_start is not None:
-        start_qt = QTime.fromString(new_start, "HH:mm")
-        end_qt   = QTime.fromString(new_end,   "HH:mm")
-        if not (start_qt.isValid() and end_qt.isValid()):
-            raise ValueError(
-                "Horário inválido; use o formato HH:mm e corrija o intervalo antes de salvar."
-            )
-        if end_qt < start_qt:
-            raise ValueError(
-                "Horário final não pode anteceder o inicial; ajuste o intervalo antes de salvar."
-            )
-
-    with get_conn() as c:
+    with transaction() as c:
         cur = c.cursor()
         row = cur.execute(
-            "SELECT demands,start_time,end_time,encaminhamento,"
-            "       desjejum||','||lunch||','||snack||','||dinner "
-            "FROM records WHERE id=?", (pid,)
+            "SELECT demands FROM records WHERE id=?", (pid,)
         ).fetchone()
 
         if row is None:
             raise RuntimeError("ID não encontrado.")
 
-        (old_dem, old_start, old_end, old_enc, old_vals) = row
+        (old_dem,) = row
 
         # ---------- 1) eventualmente cria o clone ------------------
-        old_tokens = [t.strip() for t in (old_dem or "").split(",") if t.strip()]
-        old_ai     = [t for t in old_tokens if t.startswith(("AI", "REA"))]
-        new_ai     = [t for t in (new_demands or "").split(",") if t.strip().startswith(("AI", "REA"))]
+        ids = [pid]
+        old_ai = [tok for (tok,) in cur.execute(
+            "SELECT token FROM record_demands "
+            "WHERE record_id=? AND code IN ('AI','REA') ORDER BY pos", (pid,)
+        )]
+        new_ai = [t for t in parse_demands(new_demands) if t.code in ARCHIVE_CODES]
 
         if old_ai and not new_ai:
             # houve remoção total de AI/REA  →  clonar
@@ -226,15 +253,17 @@ def update_demands(pid, new_demands, new_start=None, new_end=None, new_enc=None)
                     observations, encaminhamento,
                     desjejum, lunch, snack, dinner,
                     start_time, end_time,
-                    archived_ai
+                    archived_ai, patient_id
                 )
                 SELECT patient_name, ?, reference_prof, date,
                        enter_sys, ?, observations, encaminhamento,
                        ?, ?, ?, ?,
                        start_time, end_time,
-                       1
+                       1, patient_id
                   FROM records WHERE id=?
             """, (", ".join(old_ai), now, d_b, d_l, d_s, d_d, pid))
+            ids.append(cur.lastrowid)
+            sync_demands(cur, cur.lastrowid, ", ".join(old_ai))
 
         # ---------- 2) log + UPDATE normal -------------------------
         cur.execute("""
@@ -248,47 +277,74 @@ def update_demands(pid, new_demands, new_start=None, new_end=None, new_enc=None)
              WHERE id=?
         """, (new_demands, new_start, new_end, new_enc, pid))
 
+        # intervalo validado pelas colunas geradas (erro → ROLLBACK de tudo)
+        if new_start is not None:
+            start_min, end_min = cur.execute(
+                "SELECT start_min, end_min FROM records WHERE id=?", (pid,)
+            ).fetchone()
+            if start_min is None or end_min is None:
+                raise ValueError(
+                    "Horário inválido; use o formato HH:mm e corrija o intervalo antes de salvar."
+                )
+            if end_min < start_min:
+                raise ValueError(
+                    "Horário final não pode anteceder o inicial; ajuste o intervalo antes de salvar."
+                )
+        sync_demands(cur, pid, new_demands)
+        update_daily_metrics_for(cur, [pid])
+        invalidate_records(cur, [pid])
+        return changed_records(c, ids)
 
-        c.commit()
         
 def has_edit_log(pid):
-    with get_conn() as c:
-        return (
-            c.execute("SELECT 1 FROM meal_log   WHERE record_id=? LIMIT 1", (pid,)).fetchone()
-            or c.execute("SELECT 1 FROM demand_log WHERE record_id=? LIMIT 1", (pid,)).fetchone()
-        ) is not None
-        
+    return pid in edited_ids([pid])
+
+
+def edited_ids(ids) -> set:
+    """IDs (dentre `ids`) com alteração em meal_log ou demand_log."""
+    ids = list(ids)
+    found = set()
+    c = connection()
+    for i in range(0, len(ids), 500):          # limite de parâmetros do SQLite
+        chunk = ids[i:i + 500]
+        qs = ",".join("?" * len(chunk))
+        found.update(rid for (rid,) in c.execute(f"""
+            SELECT record_id FROM meal_log   WHERE record_id IN ({qs})
+            UNION
+            SELECT record_id FROM demand_log WHERE record_id IN ({qs})
+        """, chunk + chunk))
+    return found
 
 
 def leave_record(pid, left_sys, left_inf):
-    with get_conn() as c:
+    with transaction() as c:
         row = c.execute(
-            "SELECT enter_inf,left_sys FROM records WHERE id=?",
+            "SELECT left_sys FROM records WHERE id=?",
             (pid,),
         ).fetchone()
 
         if row is None:
             raise RuntimeError("ID não encontrado.")
 
-        enter_inf, already_left = row
+        already_left, = row
 
         if already_left:
             raise ValueError("Paciente já está na aba “Saíram”.")
 
-        enter_time = QTime.fromString(enter_inf, "HH:mm")
-        left_time  = QTime.fromString(left_inf,  "HH:mm")
-
-        if enter_time.isValid() and left_time.isValid() and left_time < enter_time:
-            raise ValueError("Horário de saída não pode ser anterior ao horário de entrada.")
-
         c.execute(
             "UPDATE records SET left_sys=?,left_inf=? WHERE id=?",
             (left_sys, left_inf, pid),
         )
-        c.commit()
+        # comparação em minutos (NULL se algum horário for inválido → passa)
+        if c.execute(
+            "SELECT left_inf_min < enter_inf_min FROM records WHERE id=?", (pid,)
+        ).fetchone()[0]:
+            raise ValueError("Horário de saída não pode ser anterior ao horário de entrada.")
+        invalidate_records(c, [pid])
+        return changed_records(c, [pid])
 
 def reactivate_from(pid, enter_sys, enter_inf):
-    with get_conn() as c:
+    with transaction() as c:
         row = c.execute("SELECT left_sys FROM records WHERE id=?", (pid,)).fetchone()
         if row is None:
             raise RuntimeError("ID não encontrado.")
@@ -305,143 +361,302 @@ def reactivate_from(pid, enter_sys, enter_inf):
             """,
             (enter_sys, enter_inf, pid),
         )
-        c.commit()
-        return pid
+        update_daily_metrics_for(c, [pid])
+        invalidate_records(c, [pid])
+        return changed_records(c, [pid])
 
-def has_meal_log(pid)->bool:
-    with get_conn() as c:
-        return c.execute("SELECT 1 FROM meal_log WHERE record_id=? LIMIT 1",(pid,)).fetchone() is not None
-
-
-
-
-def counts(date_iso):
-    with get_conn() as c:
-        dj,al,la,ja,total,acolh=c.execute("""
-        SELECT SUM(desjejum),SUM(lunch),SUM(snack),SUM(dinner),
-               COUNT(*),
-               SUM(CASE WHEN encaminhamento IS NOT NULL THEN 1 ELSE 0 END)
-        FROM records WHERE date=? AND left_sys IS NULL AND archived_ai=0""",(date_iso,)).fetchone()
-    return {"desj":dj or 0,"lunch":al or 0,"snack":la or 0,
-            "dinner":ja or 0,"total de Pacientes":total or 0,"acolh":acolh or 0}
-
-
-# ───────────────────────────────────────────── Busca Avançada
-class SearchDialog(QDialog):
-    """Diálogo de pesquisa avançada com listas DINÂMICAS de Demanda e Encaminhamento,
-       baseadas no intervalo de datas escolhido pelo usuário."""
-    def __init__(self, parent=None):
-        super().__init__(parent)
-        self.setWindowTitle("Buscar registros 🔍")
-        lay = QFormLayout(self)
-
-        # —— texto livre (nome / profissional) ————————————————
-        self.txt_name = QLineEdit()
-        self.txt_prof = QLineEdit()
-        lay.addRow("Nome do paciente contém:", self.txt_name)
-        lay.addRow("Profissional contém:",     self.txt_prof)
-
-        # —— combos vazios (serão populados mais abaixo) ————————
-        self.cmb_dmd = QComboBox()
-        self.cmb_enc = QComboBox()
-
-        # —— intervalo de datas ——————————————————————————————
-        self.d_ini = QDateEdit(calendarPopup=True, displayFormat="dd/MM/yyyy")
-        self.d_end = QDateEdit(calendarPopup=True, displayFormat="dd/MM/yyyy")
-        self.d_ini.setDate(QDate.currentDate().addMonths(-1))
-        self.d_end.setDate(QDate.currentDate())
-
-        # quando mudar qualquer data → recarrega listas
-        self.d_ini.dateChanged.connect(lambda _: self._populate_combos())
-        self.d_end.dateChanged.connect(lambda _: self._populate_combos())
-
-        lay.addRow("Tipo de atendimento:",     self.cmb_dmd)
-        lay.addRow("Tipo de encaminhamento:",  self.cmb_enc)
-        lay.addRow("De:", self.d_ini)
-        lay.addRow("Até:", self.d_end)
-
-        # —— check-boxes de refeições ————————————————————————
-        self.chk_b = QCheckBox("Fez Desjejum 🥞")
-        self.chk_l = QCheckBox("Fez Almoço 🥗")
-        self.chk_s = QCheckBox("Fez Lanche 🥪")
-        self.chk_d = QCheckBox("Fez Janta 🍛")
-        for w in (self.chk_b, self.chk_l, self.chk_s, self.chk_d):
-            lay.addRow(w)
-
-        # —— modo avançado (tokenizar texto) ————————————————
-        self.chk_adv = QCheckBox("Busca avançada (tokenizar nome/prof.)")
-        lay.addRow(self.chk_adv)
-
-        lay.addRow("", QPushButton("Buscar ✅", clicked=self.accept))
-
-        # primeira carga das listas
-        self._populate_combos()
-
-    # ---------- helpers dinâmicos ----------------------------------
-
-    def _date_iso_range(self):
-        to_iso = lambda qdate: qdate.toString("yyyyMMdd")
-        return to_iso(self.d_ini.date()), to_iso(self.d_end.date())
-
-    def _populate_combos(self):
-        """Recarrega opções de demanda/encaminhamento segundo intervalo de datas."""
-        d0, d1 = self._date_iso_range()
-
-        # ----- Demanda ------------------------------------------------
-        self.cmb_dmd.blockSignals(True)
-        self.cmb_dmd.clear()
-        self.cmb_dmd.addItem("— Qualquer —", "")
-
-        seen = set()
-        with get_conn() as c:
-            for (demands,) in c.execute("""
-                 SELECT DISTINCT demands FROM records
-                  WHERE (substr(date,7,4)||substr(date,4,2)||substr(date,1,2))
-                        BETWEEN ? AND ? AND demands IS NOT NULL
-            """, (d0, d1)):
-                for tok in demands.split(","):
-                    tok = tok.strip()
-                    if not tok:
-                        continue
-                    code = tok.split(" ")[0]      # pega só “C”, “AN”, “AI”… (1ª palavra)
-                    seen.add(code)
 
-        for code in sorted(seen):
-            self.cmb_dmd.addItem(code, code)
-        self.cmb_dmd.blockSignals(False)
-
-
-        # — Encaminhamento —
-        self.cmb_enc.blockSignals(True)
-        self.cmb_enc.clear()
-        self.cmb_enc.addItem("— Qualquer —", "")
-        with get_conn() as c:
-            encs = [e for (e,) in c.execute("""
-                    SELECT DISTINCT encaminhamento FROM records
-                     WHERE encaminhamento IS NOT NULL
-                       AND (substr(date,7,4)||substr(date,4,2)||substr(date,1,2))
-                           BETWEEN ? AND ?
-            """, (d0, d1))]
-        for enc in sorted(encs):
-            self.cmb_enc.addItem(enc, enc)
-        self.cmb_enc.blockSignals(False)
-
-    # ---------- devolve filtros escolhidos --------------------------
-
-    def filters(self):
-        return dict(
-            name  = self.txt_name.text().strip(),
-            prof  = self.txt_prof.text().strip(),
-            dmd   = self.cmb_dmd.currentData(),   # "" se “Qualquer”
-            enc   = self.cmb_enc.currentData(),
-            d_ini = self.d_ini.date().toString("dd/MM/yyyy"),
-            d_end = self.d_end.date().toString("dd/MM/yyyy"),
-            b   = self.chk_b.isChecked(),
-            l   = self.chk_l.isChecked(),
-            s   = self.chk_s.isChecked(),
-            d   = self.chk_d.isChecked(),
-            adv = self.chk_adv.isChecked(),
-        )
+def meal_rows(date_iso, col_name: str) -> list:
+    """
+    Ativos do dia marcados na refeição `col_name` (desjejum, lunch…), por nome:
+    (patient_name, 1º código, token C, start_time, end_time, enter_inf).
+    Lê o índice parcial idx_records_<refeição>_day.
+    """
+    if col_name not in infra.MEAL_COLS:
+        raise ValueError(f"Refeição inválida: {col_name}")
+    c = connection()
+    return c.execute(f"""
+        SELECT patient_name,
+               (SELECT d.code FROM record_demands d
+                 WHERE d.record_id = records.id ORDER BY d.pos LIMIT 1),
+               (SELECT d.token FROM record_demands d
+                 WHERE d.record_id = records.id AND d.code = 'C'
+                 ORDER BY d.pos LIMIT 1),
+               start_time, end_time,
+               enter_inf
+          FROM records
+         WHERE date_iso=? AND {col_name}=1 AND left_sys IS NULL
+           AND archived_ai = 0
+         ORDER BY patient_name
+    """, (to_iso_date(date_iso),)).fetchall()
+
+
+# Projeção usada pelas abas do dia e pelos consolidados:
+#   0 id | 1 paciente | 2 demandas | 3 prof. | 4..7 entrou/saiu (sys/≈)
+#   8 encaminhamento | 9 archived_ai | 10..13 refeições | 14..15 intervalo C
+#   16..17 intervalo C em minutos (ordenação) | 18 date_iso
+DAY_COLS = (
+    "id", "patient_name", "demands", "reference_prof",
+    "enter_sys", "enter_inf", "left_sys", "left_inf",
+    "encaminhamento", "archived_ai",
+    "desjejum", "lunch", "snack", "dinner",
+    "start_time", "end_time",
+    "start_min", "end_min",
+    "date_iso",
+)
+
+# colunas exibidas nas abas do dia / na aba Acolhimentos (ordem das tabelas)
+TAB_COLS = (
+    "id", "patient_name", "demands", "reference_prof",
+    "enter_sys", "enter_inf", "left_sys", "left_inf",
+)
+ACOLH_COLS = (
+    "id", "patient_name", "demands", "reference_prof",
+    "encaminhamento", "archived_ai",
+    "enter_sys", "enter_inf", "left_sys", "left_inf",
+)
+TAB_ROW = attrgetter(*TAB_COLS)
+ACOLH_ROW = attrgetter(*ACOLH_COLS)
+
+# chave exibida no filtro de demandas: “C”, “AN”, “AN Entrou”, “AI”…
+DEMAND_KEY_SQL = (
+    "d.code || CASE WHEN d.code = 'AN' AND d.variant IS NOT NULL "
+    "THEN ' ' || d.variant ELSE '' END"
+)
+
+
+def day_rows(date_iso) -> list:
+    """
+    Todos os registros do dia (inclusive clones e quem saiu) numa única
+    consulta, como Record com os atributos de DAY_COLS; as demandas são
+    lidas com demands.parse_demands, memoizado.
+    """
+    sql = f"""
+        SELECT {', '.join(DAY_COLS)}
+          FROM records
+         WHERE date_iso = ?
+         ORDER BY id
+    """
+    c = connection()
+    return c.cursor(RecordCursor).execute(sql, (to_iso_date(date_iso),)).fetchall()
+
+
+# ------------------------------------------------------------
+#  Cache dos dias já exibidos (LRU por date_iso)
+#  Dias passados quase nunca mudam: voltar a um dia não toca o banco.
+#  Toda rotina de escrita invalida só a(s) data(s) que alterou.
+# ------------------------------------------------------------
+DAY_CACHE_SIZE = 31
+
+
+class DayCache:
+    """
+    date_iso → dados prontos do refresh() (linhas, partição, métricas,
+    chaves do combo de demandas, ids editados). totals() guarda o
+    consolidado geral, que muda com qualquer escrita.
+    Trocar de banco (DB_PATH) esvazia tudo. O rollover invalida dias de
+    dentro do executor, por isso o lock (inclusive em totals(): uma
+    invalidação no meio do cálculo não pode ser sobrescrita por ele).
+    """
+
+    def __init__(self, maxsize: int = DAY_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._days = OrderedDict()
+        self._totals = None
+        self._db = None
+        self._lock = threading.RLock()
+
+    def _check_db(self) -> None:
+        if self._db != infra.DB_PATH:
+            self.clear()
+            self._db = infra.DB_PATH
+
+    def __contains__(self, day):
+        with self._lock:
+            self._check_db()
+            return day in self._days
+
+    def __len__(self):
+        with self._lock:
+            return len(self._days)
+
+    def get(self, day):
+        with self._lock:
+            self._check_db()
+            data = self._days.get(day)
+            if data is not None:
+                self._days.move_to_end(day)
+            return data
+
+    def put(self, day, data) -> None:
+        with self._lock:
+            self._check_db()
+            self._days[day] = data
+            self._days.move_to_end(day)
+            while len(self._days) > self.maxsize:
+                self._days.popitem(last=False)
+
+    def totals(self) -> dict:
+        with self._lock:
+            self._check_db()
+            if self._totals is None:
+                self._totals = consolidated_metrics()
+            return self._totals
+
+    def invalidate(self, days) -> None:
+        with self._lock:
+            for day in days:
+                self._days.pop(day, None)
+            self._totals = None
+
+    def clear(self) -> None:
+        with self._lock:
+            self._days.clear()
+            self._totals = None
+
+
+day_cache = DayCache()
+
+
+def changed_records(c, ids) -> list:
+    """
+    Records (DAY_COLS) de `ids` lidos na própria escrita: é o que as funções
+    de gravação devolvem para a tela se atualizar sem reler o dia.
+    """
+    ids = list(ids)
+    qs = ",".join("?" * len(ids))
+    return c.cursor(RecordCursor).execute(
+        f"SELECT {', '.join(DAY_COLS)} FROM records WHERE id IN ({qs}) ORDER BY id", ids
+    ).fetchall()
+
+
+def invalidate_records(c, ids) -> None:
+    """
+    Tira do cache os dias dos registros `ids`. Chamar dentro da escrita:
+    os dias são lidos agora e saem do cache só depois do COMMIT.
+    """
+    ids = list(ids)
+    qs = ",".join("?" * len(ids))
+    days = [d for (d,) in c.execute(
+        f"SELECT DISTINCT date_iso FROM records WHERE id IN ({qs})", ids
+    )]
+    on_commit(partial(day_cache.invalidate, days))
+
+
+_ASCII_FOLD = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+
+def _nocase(value):
+    """Chave de ordenação equivalente a COLLATE NOCASE (NULL primeiro)."""
+    return (0, "") if value is None else (1, value.translate(_ASCII_FOLD))
+
+
+def _nulls_first(value):
+    return (0, 0) if value is None else (1, value)
+
+
+def day_sort_key(wanted: str, order_idx: int):
+    """Chave com a mesma ordem do ORDER BY de Main.fetch(), para uso em memória."""
+    if wanted == "C":                         # Convivência → por horário
+        return lambda r: (_nulls_first(r.start_min), _nulls_first(r.end_min),
+                          _nocase(r.patient_name))
+    if order_idx == 1:
+        return lambda r: _nocase(r.patient_name)
+    if order_idx == 2:
+        return lambda r: _nocase(r.reference_prof)
+    return lambda r: -r.id
+
+
+def sort_day_rows(rows, wanted: str, order_idx: int) -> list:
+    return sorted(rows, key=day_sort_key(wanted, order_idx))
+
+
+@lru_cache(maxsize=4096)
+def _quick_text(*fields) -> str:
+    """Texto do filtro rápido: campos juntos, sem acento e sem caixa."""
+    return name_key(" ".join(f for f in fields if f)) or ""
+
+
+def day_row_filter(wanted: str, text: str = ""):
+    """
+    Predicado das abas do dia (None → mostra tudo):
+      • `wanted`: demanda exata, como no combo (“A” não engole “AN”)
+      • `text`  : filtro rápido em paciente / profissional / demandas
+    Só lê a linha já carregada; parse_demands é memoizado.
+    """
+    needle = name_key(text)
+    if not wanted and not needle:
+        return None
+
+    def accept(r):
+        if wanted and not demand_matches(parse_demands(r.demands), wanted):
+            return False
+        return not needle or needle in _quick_text(r.patient_name, r.reference_prof, r.demands)
+    return accept
+
+
+def patient_history(name: str) -> list:
+    """
+    Todos os registros (não arquivados) do paciente, do mais recente ao mais
+    antigo: (id, date, demands, reference_prof, enter_sys, left_sys).
+    Busca pela chave normalizada → índice (patient_id, date_iso).
+    """
+    c = connection()
+    return c.execute("""
+        SELECT r.id, r.date, r.demands, r.reference_prof, r.enter_sys, r.left_sys
+          FROM patients p JOIN records r ON r.patient_id = p.id
+         WHERE p.name_key = ? AND r.archived_ai = 0
+         ORDER BY r.date_iso DESC, r.id DESC
+    """, (name_key(name),)).fetchall()
+
+
+def consolidated_metrics() -> dict:
+    """
+    Mesmo resultado de Main._metrics() sobre todo o histórico não arquivado,
+    somando daily_metrics (uma linha por dia/código) em vez de varrer records.
+    """
+    data = {"total de Pacientes": 0, "acolh": 0,
+            "desj": 0, "alm": 0, "lan": 0, "jan": 0}
+    data.update({c: 0 for c in METRIC_CODES})
+    c = connection()
+    for kind, key, n in c.execute(
+        "SELECT kind, key, SUM(n) FROM daily_metrics GROUP BY kind, key"
+    ):
+        if kind == "base":
+            data[key] = n
+        elif kind == "dmd":
+            if key in METRIC_CODES:
+                data[key] = n
+        else:                                   # encaminhamentos
+            data["acolh"] += n
+            data[key] = data.get(key, 0) + n
+    return data
+
+
+def demand_filter(wanted: str, table: str = "records"):
+    """
+    Fragmento SQL (+ parâmetros) que restringe `table` aos registros com a
+    demanda `wanted`:
+      • 'C', 'AN', 'A' …  → pelo código (qualquer intervalo/variante)
+      • 'AN Entrou'       → código + variante
+    """
+    want, = parse_demands(wanted)
+    sql = (" AND EXISTS (SELECT 1 FROM record_demands d"
+           f" WHERE d.record_id = {table}.id AND d.code = ?")
+    params = [want.code]
+    if want.variant:
+        sql += " AND d.variant = ?"
+        params.append(want.variant)
+    return sql + ")", params
+
+
+def fts_match(column: str, text: str) -> str:
+    """
+    Expressão MATCH de records_fts: cada palavra de `text` vira prefixo
+    ("jo da sil" → jo* da* sil*), todas obrigatórias, só na coluna `column`.
+    """
+    words = re.findall(r"\w+", text)
+    return f"{column} : (" + " ".join(f'"{w}"*' for w in words) + ")" if words else ""
 
 
 # ───────────────────────────────────────────── GUI
@@ -453,6 +668,11 @@ class Main(QMainWindow):
         self.setWindowTitle("Registro de Pacientes da recepção - Caps AD III Paulo da Portela v3.5 🗒️")
         self.resize(800, 780)
         self.start_time = self.end_time = self.enc = None
+        self._stamp = self._view = None     # carimbo do banco / dia do último refresh
+        self._filters = None                # demanda / ordem / texto aplicados às abas
+        self._data, self._dirty = None, set()   # dados do dia / abas a preencher
+        self._loading = None                # (dia, carimbo) da leitura em andamento
+        self.queries = QueryExecutor(self)  # leituras fora da thread da tela
 
         # ─── 1. Central widget + foto de fundo ─────────────────────────
         import os, sys
@@ -507,10 +727,14 @@ class Main(QMainWindow):
         row_date.addWidget(QLabel("Data 📅:"))
         self.date = QDateEdit(QDate.currentDate(), calendarPopup=True,
                               displayFormat="dd/MM/yyyy")
-        self.date.dateChanged.connect(lambda _: (self._update_demand_filter_combo(),
-                                                 self.refresh()))
+        self.date.dateChanged.connect(lambda _: self.refresh())
 
-        row_date.addWidget(self.date); row_date.addStretch()
+        # indicador de leitura em andamento (não bloqueia a tela)
+        self.lbl_loading = QLabel("⏳ Carregando…", visible=False)
+        self.queries.busy.connect(self.lbl_loading.setVisible)
+
+        row_date.addWidget(self.date); row_date.addWidget(self.lbl_loading)
+        row_date.addStretch()
 
         # ─── 4. Formulário ────────────────────────────────────────────
         form = QVBoxLayout(); outer.addLayout(form)
@@ -636,9 +860,13 @@ class Main(QMainWindow):
         ])
         row_filtro.addWidget(self.cmb_order)
 
-        btn_aplicar = QPushButton("Aplicar filtro 🔄")
-        row_filtro.addWidget(btn_aplicar); row_filtro.addStretch()
-        btn_aplicar.clicked.connect(self.refresh)  # refresh já usa os filtros
+        # filtro rápido: só a tela, sem consultar o banco
+        self.txt_quick = QLineEdit(placeholderText="Filtrar paciente / prof. / demanda 🔎")
+        self.txt_quick.setClearButtonEnabled(True)
+        row_filtro.addWidget(self.txt_quick); row_filtro.addStretch()
+        self.cmb_dmd_filter.currentIndexChanged.connect(self._apply_view_filters)
+        self.cmb_order.currentIndexChanged.connect(self._apply_view_filters)
+        self.txt_quick.textChanged.connect(self._apply_view_filters)
         self.btn_export_dia = QPushButton("Exportar dia 📤")
         row_filtro.addWidget(self.btn_export_dia)
         self.btn_export_dia.clicked.connect(self.exportar_dia)
@@ -655,8 +883,9 @@ class Main(QMainWindow):
             headers=[
                 "ID", "Paciente", "Demanda", "Prof.", "Enc.", "Clone?",
                 "Entrou", "≈Entrou", "Saiu", "≈Saiu"
-            ]
-
+            ],
+            columns=ACOLH_ROW,
+            muted_col=5,                      # archived_ai → linha cinza
         )
 
         self.tbl_left   = self._tbl("Saíram ⚪")
@@ -668,6 +897,10 @@ class Main(QMainWindow):
             self.tbl_all, self.tbl_break, self.tbl_lunch, self.tbl_snack,
             self.tbl_dinner, self.tbl_acolh, self.tbl_left,
         ]
+        self.meal_tables = {
+            self.tbl_break: "desjejum", self.tbl_lunch: "lunch",
+            self.tbl_snack: "snack", self.tbl_dinner: "dinner",
+        }
 
         # ─── 7. Botões de ação ───────────────────────────────────────
         row_btn = QHBoxLayout(); outer.addLayout(row_btn)
@@ -682,23 +915,75 @@ class Main(QMainWindow):
         row_btn.addWidget(QPushButton("Observações 🔍",      clicked=self._show_observations))
         row_btn.addWidget(QPushButton("Backup ☁️",
                               clicked=lambda: backup_now(self)))
+        row_btn.addWidget(QPushButton("Diagnóstico 🩺",
+                              clicked=lambda: DiagnosticsDialog(self.queries, self).exec_()))
 
 
 
 
 
         self.tabs.currentChanged.connect(self._update_leave_button_state)
+        self.tabs.currentChanged.connect(lambda i: self._fill_tab(self.tabs.widget(i)))
         self._update_leave_button_state()
         row_btn.addStretch()
 
         # ─── 8. Primeira atualização ─────────────────────────────────
         self.refresh()
 
+        # ---------- escrita de outro PC no mesmo arquivo ------------
+        self._poll_timer = QTimer(self)
+        self._poll_timer.timeout.connect(self._poll_changes)
+        self._poll_timer.start(CHANGE_POLL_MS)
+
         # ---------- backup automático a cada 2 horas -----------------
         self._bk_timer = QTimer(self)
         self._bk_timer.timeout.connect(lambda: backup_now(self))
         self._bk_timer.start(2 * 60 * 60 * 1000)      # 2 h em milissegundos
 
+        # ---------- manutenção do banco quando ninguém está usando ----
+        self._maint_cfg = maintenance_cfg()
+        self._last_input = time.monotonic()
+        self._last_analyze = None
+        # só a janela principal (QWindow): vê o teclado/mouse dela antes dos
+        # widgets, sem pagar um eventFilter Python por evento do aplicativo
+        self.winId()
+        self.windowHandle().installEventFilter(self)
+        self._maint_timer = QTimer(self)
+        self._maint_timer.timeout.connect(self._idle_maintenance)
+        if self._maint_cfg["enabled"]:
+            self._maint_timer.start(int(self._maint_cfg["interval_min"] * 60 * 1000))
+
+    # ───────────────────────────────────────────────
+    #  MANUTENÇÃO DO BANCO EM SEGUNDO PLANO
+    # ───────────────────────────────────────────────
+    def eventFilter(self, obj, ev):
+        """Marca a hora do último teclado/mouse (ociosidade da manutenção)."""
+        if ev.type() in (QEvent.KeyPress, QEvent.MouseButtonPress, QEvent.Wheel):
+            self._last_input = time.monotonic()
+        return super().eventFilter(obj, ev)
+
+    def _idle_maintenance(self):
+        cfg = self._maint_cfg
+        now = time.monotonic()
+        if (now - self._last_input < cfg["idle_sec"]
+                or QApplication.activeModalWidget() is not None
+                or self.queries.pending("maintenance")):
+            return                       # recepção em uso: tenta na próxima volta
+        analyze = (self._last_analyze is None
+                   or now - self._last_analyze >= cfg["analyze_hours"] * 3600)
+        # no executor: com o banco travado por outro PC / backup, a espera
+        # (até o busy_timeout) não congela a janela
+        self.queries.submit(
+            "maintenance", partial(run_maintenance, cfg, analyze=analyze),
+            on_result=lambda _timings: self._maintenance_done(now, analyze),
+            on_error=lambda exc: logging.getLogger(__name__).warning(
+                "Manutenção do banco falhou: %s", exc),
+        )
+
+    def _maintenance_done(self, started: float, analyzed: bool) -> None:
+        if analyzed:
+            self._last_analyze = started
+
     # ───────────────────────────────────────────────
     #  BACKUP AO FECHAR O APLICATIVO
     # ───────────────────────────────────────────────
@@ -711,6 +996,9 @@ class Main(QMainWindow):
             backup_now(self)        # faz o backup na hora do fechamento
         except Exception as exc:    # mostra erro mas não impede o encerramento
             QMessageBox.critical(self, "Falha no backup", str(exc))
+        self.queries.cancel_all()   # interrompe leituras em andamento
+        self.queries.wait()
+        close_connections()         # fecha as conexões SQLite reaproveitadas
         super().closeEvent(ev)      # continua o fluxo normal
 
 
@@ -729,17 +1017,17 @@ class Main(QMainWindow):
         cols_main = ["ID","Paciente","Demanda","Profissional",
                      "Entrou≈", "Saiu≈"]
         main_rows = [
-            [id_, nome, dmd, prof, enter_inf, left_inf]
-            for (id_, nome, dmd, prof, enter_sys, enter_inf,
-                 left_sys, left_inf) in pacientes
+            [p.id, p.patient_name, p.demands, p.reference_prof, p.enter_inf, p.left_inf]
+            for p in pacientes
         ]
 
         cols_ai  = ["ID","Paciente","Demanda","Profissional",
                     "Encaminhamento", "Entrou≈", "Saiu≈"]
-        ai_rows = []
-        for (id_, nome, dmd, prof, enc, _arc,   # _arc = archived_ai
-             enter_sys, enter_inf, left_sys, left_inf) in acolh:
-            ai_rows.append([id_, nome, dmd, prof, enc, enter_inf, left_inf])
+        ai_rows = [
+            [a.id, a.patient_name, a.demands, a.reference_prof,
+             a.encaminhamento, a.enter_inf, a.left_inf]
+            for a in acolh
+        ]
 
 
         # ------------------------------------------------------------
@@ -783,59 +1071,44 @@ class Main(QMainWindow):
     # -------- executa o script de reparo -----------------------------
     def _run_fix(self):
         _fix_old_imports(self)
+        day_cache.clear()          # o reparo pode mexer em qualquer dia
         self.refresh()       
 
 
     # ------------------------------------------------------------
     #  MÉTRICAS CONSOLIDADAS (inclui encaminhamentos)
     # ------------------------------------------------------------
-    def _metrics(self, rows):
+    def _metrics(self, rows, dmd_counts):
         """
-        Recebe uma lista de registros (SELECT * FROM records)
-        e devolve contagens:
+        Recebe uma lista de registros (Record de day_rows) e as
+        contagens por código de demanda; devolve:
           • Demanda (A, R, M, …, AN)
           • Refeições (desj, alm, lan, jan)
-          • Encaminhamentos (cada tipo recebido em r[10])
+          • Encaminhamentos (cada tipo recebido em r[8])
         """
-        # códigos de demanda que nos interessam
-        codes = [
-            "A", "R", "M", "C", "RM",
-            "Grupos/Eventos", "Outros", "AI", "REA", "AN"
-        ]
-
         data = {                # contadores básicos
             "total de Pacientes": 0, "acolh": 0,
             "desj": 0, "alm": 0, "lan": 0, "jan": 0,
         }
-        # inicia todos os códigos de demanda em zero
-        data.update({c: 0 for c in codes})
+        # demandas já contadas no SQL (record_demands)
+        data.update({c: dmd_counts.get(c, 0) for c in METRIC_CODES})
 
         for r in rows:
-            is_clone = bool(r[17])
+            is_clone = bool(r.archived_ai)
             if not is_clone:
                 data["total de Pacientes"] += 1
 
-            # ----- DEMANDAS --------------------------------------------------
-            dmd_tokens = [s.strip() for s in (r[2] or "").split(",")]
-            # se for “AN Saiu” não entra na contagem
-            dmd_tokens = [tok for tok in dmd_tokens if tok.strip() != "AN Saiu"]
-
-            for code in codes:
-                if any(tok.startswith(code) for tok in dmd_tokens):
-                    data[code] += 1
-
             # ----- REFEIÇÕES (ignora clones AI) --------------------
-            # 3) _metrics()
             if not is_clone:             # clones não contam refeições
-                if r[11]: data["desj"] += r[11]
-                if r[12]: data["alm"]  += r[12]
-                if r[13]: data["lan"]  += r[13]
-                if r[14]: data["jan"]  += r[14]
+                if r.desjejum: data["desj"] += r.desjejum
+                if r.lunch:    data["alm"]  += r.lunch
+                if r.snack:    data["lan"]  += r.snack
+                if r.dinner:   data["jan"]  += r.dinner
 
 
 
             # ----- ENCAMINHAMENTOS ------------------------------------------
-            enc = (r[10] or "").strip()      # coluna encaminhamento
+            enc = (r.encaminhamento or "").strip()
             if enc:
                 data["acolh"] += 1           # contador geral de acolhimentos
                 data.setdefault(enc, 0)      # cria chave se ainda não existe
@@ -862,16 +1135,7 @@ class Main(QMainWindow):
         date_iso = self.date.date().toString("dd/MM/yyyy")
 
         # buscamos também demands, start_time e end_time
-        with get_conn() as c:
-            rows = c.execute(f"""
-                SELECT patient_name,
-                       demands, start_time, end_time,
-                       enter_inf
-                  FROM records
-                 WHERE date=? AND {col_name}=1 AND left_sys IS NULL
-                   AND archived_ai = 0
-                 ORDER BY patient_name
-            """, (date_iso,)).fetchall()
+        rows = meal_rows(date_iso, col_name)
 
         if not rows:
             QTimer.singleShot(
@@ -882,26 +1146,22 @@ class Main(QMainWindow):
             )
             return
 
-        def demanda_format(demands, st, et):
+        def demanda_format(first_code, c_token, st, et):
             """
             • Se tiver 'C', devolve 'C HH:mm-HH:mm'
             • Caso contrário, devolve o primeiro código (A, R, RM…)
             """
-            if demands and "C" in [tok.strip().split(" ")[0] for tok in demands.split(",")]:
+            if c_token:
                 if st and et:
                     return f"C {st}-{et}"
-                # se o intervalo não estiver nas colunas, tenta pegar do texto 'C (...)'
-                for tok in demands.split(","):
-                    tok = tok.strip()
-                    if tok.startswith("C"):
-                        return tok
-                return "C"
-            # não sendo convivência, pega o 1º token
-            return (demands.split(",")[0].strip().split(" ")[0]) if demands else "—"
+                # se o intervalo não estiver nas colunas, usa o texto 'C (...)'
+                return c_token
+            # não sendo convivência, pega o 1º código
+            return first_code or "—"
 
         body = []
-        for nome, dmd, st, et, hora in rows:
-            d_fmt  = demanda_format(dmd, st, et)
+        for nome, first_code, c_token, st, et, hora in rows:
+            d_fmt  = demanda_format(first_code, c_token, st, et)
             h_fmt  = hora or "s/horário"
             body.append(f"- {nome} ({d_fmt}) — {h_fmt}")
 
@@ -927,8 +1187,8 @@ class Main(QMainWindow):
     # ------------------------------------------------------------
     @staticmethod
     def _to_iso(d: str) -> str:
-        """Converte dd/MM/yyyy em yyyymmdd para filtros SQL."""
-        return d[6:10] + d[3:5] + d[0:2]
+        """Converte dd/MM/yyyy em yyyy-MM-dd (coluna `date_iso`)."""
+        return to_iso_date(d)
 
     def _query_by_filters(self, f: dict, *, include_archived: bool = False):
         """Monta e executa a query de busca, compartilhada por relatórios."""
@@ -939,42 +1199,44 @@ class Main(QMainWindow):
             "enter_sys", "left_sys",
         ]
 
+        # texto via índice FTS (ranqueado): observações sempre;
+        # nome/profissional na busca avançada (prefixos, sem acento)
+        match = [fts_match("observations", f.get("obs") or "")]
+        if f["adv"]:
+            match += [fts_match("patient_name", f["name"]),
+                      fts_match("reference_prof", f["prof"])]
+        match = " AND ".join(m for m in match if m)
+
         sql = f"""
-            SELECT {', '.join(select_cols)}
+            SELECT {', '.join('records.' + col for col in select_cols)}
               FROM records
-             WHERE (substr(date,7,4)||substr(date,4,2)||substr(date,1,2))
-                   BETWEEN ? AND ?
         """
+        if match:
+            sql += " JOIN records_fts ON records_fts.rowid = records.id"
+        sql += " WHERE date_iso BETWEEN ? AND ?"
         params = [self._to_iso(f["d_ini"]), self._to_iso(f["d_end"])]
-
-        def add_tokens(field, value):
-            nonlocal sql, params           # ← move pra primeira linha!
-            for token in value.split():
-                sql += f" AND {field} LIKE ?"
-                params.append(f"%{token}%")
+        if match:
+            sql += " AND records_fts MATCH ?"
+            params.append(match)
 
         # nome / profissional
-        if f["adv"]:
-            if f["name"]:
-                add_tokens("patient_name", f["name"])
-            if f["prof"]:
-                add_tokens("reference_prof", f["prof"])
-        else:
+        if not f["adv"]:
             if f["name"]:
-                sql += " AND patient_name LIKE ?"
+                sql += " AND records.patient_name LIKE ?"
                 params.append(f"%{f['name']}%")
             if f["prof"]:
-                sql += " AND reference_prof LIKE ?"
+                sql += " AND records.reference_prof LIKE ?"
                 params.append(f"%{f['prof']}%")
 
-        # demanda
+        # demanda (código exato: “A” não engole “AN”/“AI”)
         if f["dmd"]:
-            sql += " AND demands LIKE ?"
-            params.append(f"%{f['dmd']}%")
+            dmd_sql, dmd_params = demand_filter(parse_demands(f["dmd"])[0].code)
+            sql += dmd_sql
+            params += dmd_params
 
         # encaminhamento
         if f["enc"]:
-            sql += " AND encaminhamento = ?"
+            sql += " AND TRIM(encaminhamento) = ?"     # como em daily_metrics
             params.append(f["enc"])
 
         # refeições
@@ -993,9 +1255,10 @@ class Main(QMainWindow):
         if not include_archived:
             sql += " AND archived_ai = 0"
 
-        sql += " ORDER BY (substr(date,7,4)||substr(date,4,2)||substr(date,1,2)) DESC, patient_name"
-        with get_conn() as c:
-            rows = c.execute(sql, params).fetchall()
+        order = "date_iso DESC, records.patient_name"
+        sql += f" ORDER BY {'records_fts.rank, ' if match else ''}{order}"
+        c = connection()
+        rows = c.execute(sql, params).fetchall()
 
         return rows
 
@@ -1004,9 +1267,15 @@ class Main(QMainWindow):
         if dlg.exec_() == 0:       # usuário cancelou
             return
 
+        # a consulta roda no executor; uma nova busca descarta a anterior
         f = dlg.filters()
-        rows = self._query_by_filters(f, include_archived=False)
+        self.queries.submit(
+            "search", self._query_by_filters, f,
+            on_result=lambda rows: self._show_search(f, rows),
+            on_error=lambda exc: self._query_failed("Busca", exc),
+        )
 
+    def _show_search(self, f: dict, rows: list) -> None:
         if not rows:
             QMessageBox.information(self, "Busca", "Nenhum resultado encontrado.")
             return
@@ -1018,29 +1287,27 @@ class Main(QMainWindow):
         if f["enc"]: resumo.append(f"Enc.: {f['enc']}")
         if f["name"]: resumo.append(f"Nome≈“{f['name']}”")
         if f["prof"]: resumo.append(f"Prof≈“{f['prof']}”")
+        if f.get("obs"): resumo.append(f"Obs≈“{f['obs']}”")
         if f.get("active_only"):
             resumo.append("Somente ativos")
 
         res = QDialog(self)
         res.setWindowTitle(" ; ".join(resumo) + f"   — {len(rows)} registros")
 
-        tbl = QTableWidget(len(rows), 9, res)
         headers = ["Data", "Paciente", "Prof.", "Desj.",
                    "Alm.", "Lan.", "Jan.", "Entrou", "Saiu"]
-        tbl.setHorizontalHeaderLabels(headers)
 
-        # também preparamos uma lista p/ exportação
+        # a mesma lista alimenta a tabela e a exportação
         export_rows = []
-        for r, row in enumerate(rows):
+        for row in rows:
             row_list = list(row)
             for c in (3, 4, 5, 6):              # 0/1 → ✔️/—
                 row_list[c] = "✔️" if row_list[c] else ""
             export_rows.append(row_list)
 
-            for c, val in enumerate(row_list):
-                tbl.setItem(r, c, QTableWidgetItem(str(val)))
-
-        tbl.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        model = RowTableModel(headers, res, key=None, mark_col=None)
+        model.set_rows(export_rows)
+        tbl = RowTableView(model, res)
 
         # ----- botão Exportar p/ Excel -----
         def _export():
@@ -1067,24 +1334,38 @@ class Main(QMainWindow):
 
 
     # -------- tabela helper
-    def _tbl(self, title, headers=None):
+    def _tbl(self, title, headers=None, columns=TAB_ROW, muted_col=None):
         """
-        Cria uma QTableWidget padrão.
+        Cria uma RowTableView: RowTableModel (linhas do dia, Record) atrás de
+        um RowFilterProxy (filtro/ordem da tela).
         Se 'headers' for passado, usa essa lista; caso contrário usa as 8 colunas base.
         """
         if headers is None:
             headers = ["ID","Paciente","Demanda","Prof.",
                        "Entrou","≈Entrou","Saiu","≈Saiu"]
 
-        t = QTableWidget(0, len(headers))
-        t.setHorizontalHeaderLabels(headers)
-        t.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
-        t.setEditTriggers(QTableWidget.NoEditTriggers)
-        t.setSelectionBehavior(QTableWidget.SelectRows)
-        t.itemDoubleClicked.connect(self.show_history)
+        model = RowTableModel(headers, self, columns=columns,
+                              key=attrgetter("id"), muted_col=muted_col)
+        t = RowTableView(RowFilterProxy(model, self))
+        t.doubleClicked.connect(self.show_history)
+        t.setContextMenuPolicy(Qt.CustomContextMenu)
+        t.customContextMenuRequested.connect(lambda pos, t=t: self._patient_menu(t, pos))
         self.tabs.addTab(t, title)
         return t
 
+    def _patient_menu(self, tbl, pos):
+        """Botão direito numa aba de pacientes: alterações / atendimentos."""
+        index = tbl.indexAt(pos)
+        if not index.isValid():
+            return
+        proxy = tbl.model()
+        row = proxy.sourceModel().row_at(proxy.mapToSource(index).row())
+        menu = QMenu(tbl)
+        menu.addAction("Alterações deste registro ✏️", lambda: self.show_history(index))
+        menu.addAction("Atendimentos do paciente 📜",
+                       lambda: self.show_patient_history(row.patient_name))
+        menu.exec_(tbl.viewport().mapToGlobal(pos))
+
 
     def _cons_tbl(self, title):
         t = QTableWidget(0, 2)
@@ -1094,21 +1375,30 @@ class Main(QMainWindow):
         return t
     
 
-    def _fill(self, tbl, data, include_enc=False):
-        tbl.setRowCount(len(data))
-        for r, row in enumerate(data):
-            pid = row[0]
-            edited_flag = "🖊️" if has_edit_log(pid) else ""
-            for c, val in enumerate(row):
-                if c == 1:  # coluna “Paciente”
-                    val = f"{val}{edited_flag}"
-                item = QTableWidgetItem("" if val is None else str(val))
-                if include_enc and row[5]:          # 4 == archived_ai
-                    item.setForeground(Qt.gray)
-                    item.setFlags(item.flags() & ~(Qt.ItemIsSelectable | Qt.ItemIsEnabled))
-                
-                tbl.setItem(r, c, item)
-        tbl.resizeRowsToContents()
+    def _fill(self, tbl, data, edited=None):
+        if edited is None:                  # uma consulta para a tabela toda
+            edited = edited_ids(row[0] for row in data)
+        tbl.model().sourceModel().set_rows(data, edited)
+
+    def _apply_view_filters(self, *_):
+        """Demanda / ordem / filtro rápido → proxies das abas (sem banco)."""
+        wanted = self.cmb_dmd_filter.currentData()
+        state = (wanted, self.cmb_order.currentIndex(), self.txt_quick.text())
+        if state == self._filters:
+            return
+        self._filters = state
+        accept = day_row_filter(wanted, state[2])
+        key = day_sort_key(wanted, state[1])
+        for tbl in self.patient_tables:
+            if tbl is self.tbl_acolh:            # sempre todos, por ID desc.
+                tbl.model().set_view(day_row_filter("", state[2]))
+            else:
+                tbl.model().set_view(accept, key)
+
+    def _selected_ids(self) -> list:
+        """ids selecionados na aba de pacientes atual ([] nas outras abas)."""
+        tbl = self.tabs.currentWidget()
+        return tbl.selected_ids() if tbl in self.patient_tables else []
 
 
 
@@ -1141,25 +1431,23 @@ class Main(QMainWindow):
         ID | Paciente | Demanda | Prof. | Encaminhamento |
         Entrou | ≈Entrou | Saiu | ≈Saiu
         """
-        sql = """
-            SELECT id, patient_name, demands, reference_prof,
-                   encaminhamento, archived_ai,
-                   enter_sys, enter_inf, left_sys, left_inf
+        sql = f"""
+            SELECT {', '.join(ACOLH_COLS)}
             FROM records
-            WHERE date = ?
+            WHERE date_iso = ?
               AND encaminhamento IS NOT NULL
               AND archived_ai = 0
               AND left_sys IS NULL
 
             ORDER BY id DESC
         """
-        with get_conn() as c:
-            return c.execute(sql, (date_iso,)).fetchall()
+        c = connection()
+        return c.cursor(RecordCursor).execute(sql, (to_iso_date(date_iso),)).fetchall()
 
 # ------------------------------------------------------------
 #  REABERTURA AUTOMÁTICA – “AN”/“AN Entrou” do dia anterior
 # ------------------------------------------------------------
-    def _rollover_an(self, today_iso: str) -> None:
+    def _rollover_an(self, today_iso: str) -> bool:
         """
         Duplica, para o dia ‘today_iso’, todos os pacientes que:
             • ainda NÃO têm left_sys (ou seja, continuam internados)
@@ -1167,60 +1455,102 @@ class Main(QMainWindow):
         Regras:
             • Se era “AN Entrou”, vira “AN” no dia seguinte.
             • Não duplica se o paciente já existir na data de destino.
+            • Cada dia roda uma única vez (tabela rollover_log).
+            • Dias sem abrir o programa (fim de semana…) são preenchidos
+              em sequência, até ROLLOVER_MAX_GAP dias, na mesma transação;
+              o primeiro copia do último dia que tem registros.
+            • Só roda para HOJE: datas passadas abertas para consulta não
+              ganham linhas e as futuras esperam o dia chegar.
+        Devolve True se gravou algo (dias processados agora).
         """
-        prev_iso = QDate.fromString(today_iso, "dd/MM/yyyy")\
-                         .addDays(-1).toString("dd/MM/yyyy")
-
-        with get_conn() as c:
-            rows = c.execute("""
-                SELECT patient_name, demands, reference_prof,
-                       observations, encaminhamento,
-                       desjejum, lunch, snack, dinner,
-                       start_time, end_time
-                  FROM records
-                 WHERE date=? AND left_sys IS NULL AND archived_ai = 0
-            """, (prev_iso,)).fetchall()
-
-            for row in rows:
-                (name, demands, ref, obs, enc,
-                 b, l, s, d, st, en) = row
-
-                # só interessa se houver “AN” ou “AN Entrou”
-                toks = [t.strip() for t in (demands or "").split(",")]
-                if not any(t.startswith("AN") for t in toks):
-                    continue
-
-                # já existe hoje?
-                if c.execute("SELECT 1 FROM records WHERE patient_name=? AND date=? LIMIT 1",
-                             (name, today_iso)).fetchone():
-                    continue
-
-                # troca “AN Entrou” → “AN”
-                novo_toks = []
-                for t in toks:
-                    if t.startswith("AN Entrou"):
-                        novo_toks.append("AN")
-                    elif t.startswith("AN"):
-                        novo_toks.append("AN")
-                    else:
-                        novo_toks.append(t)
-                novo_demands = ", ".join(novo_toks)
-
-                now = QTime.currentTime().toString("HH:mm")
+        target = QDate.fromString(to_iso_date(today_iso), "yyyy-MM-dd")
+        if target != QDate.currentDate():
+            return False
+        target_key = target.toString("yyyy-MM-dd")
+
+        with transaction() as c:
+            if c.execute("SELECT 1 FROM rollover_log WHERE date_iso=?",
+                         (target_key,)).fetchone():
+                return False
 
-                c.execute("""
-                    INSERT INTO records (
-                        patient_name, demands, reference_prof, date,
-                        enter_sys, enter_inf,
-                        observations, encaminhamento,
-                        desjejum, lunch, snack, dinner,
-                        start_time, end_time
+            # último dia já processado antes do alvo → dias pendentes
+            last, = c.execute(
+                "SELECT MAX(date_iso) FROM rollover_log WHERE date_iso < ?",
+                (target_key,),
+            ).fetchone()
+            first = target
+            if last:
+                gap = QDate.fromString(last, "yyyy-MM-dd").daysTo(target)
+                first = target.addDays(-min(gap - 1, ROLLOVER_MAX_GAP - 1))
+
+            # origem do primeiro dia: o último com registros antes dele
+            # (além de ROLLOVER_MAX_GAP, o dia anterior está vazio)
+            prev_key, = c.execute(
+                "SELECT MAX(date_iso) FROM records WHERE date_iso < ?",
+                (first.toString("yyyy-MM-dd"),),
+            ).fetchone()
+
+            now = QTime.currentTime().toString("HH:mm")
+            day = first
+            while day <= target:
+                day_key = day.toString("yyyy-MM-dd")
+
+                # quem tem “AN”/“AN Entrou” ontem e ainda não existe hoje
+                rows = c.execute("""
+                    SELECT p.patient_id, p.patient_name, p.demands, p.reference_prof,
+                           p.observations, p.encaminhamento,
+                           p.desjejum, p.lunch, p.snack, p.dinner,
+                           p.start_time, p.end_time
+                      FROM records p
+                     WHERE p.date_iso=? AND p.left_sys IS NULL AND p.archived_ai = 0
+                       AND EXISTS (SELECT 1 FROM record_demands d
+                                    WHERE d.record_id = p.id AND d.code = 'AN')
+                       AND NOT EXISTS (SELECT 1 FROM records t
+                                        WHERE t.patient_id = p.patient_id
+                                          AND t.date_iso = ?)
+                     ORDER BY p.id
+                """, (prev_key, day_key)).fetchall()
+
+                seen = set()
+                for (patient_id, name, demands, ref, obs, enc,
+                     b, l, s, d, st, en) in rows:
+                    # mesmo paciente duas vezes ontem → só a primeira
+                    if patient_id is not None:
+                        if patient_id in seen:
+                            continue
+                        seen.add(patient_id)
+
+                    # troca “AN Entrou” → “AN”
+                    novo_demands = ", ".join(
+                        "AN" if t.code == "AN" else t.token
+                        for t in parse_demands(demands)
                     )
-                    VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?)
-                """, (name, novo_demands, ref, today_iso,
-                      now, now, obs, enc,
-                      b, l, s, d, st, en))
-            c.commit()
+
+                    cur = c.execute("""
+                        INSERT INTO records (
+                            patient_name, demands, reference_prof, date,
+                            enter_sys, enter_inf,
+                            observations, encaminhamento,
+                            desjejum, lunch, snack, dinner,
+                            start_time, end_time, patient_id
+                        )
+                        VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)
+                    """, (name, novo_demands, ref, day.toString("dd/MM/yyyy"),
+                          now, now, obs, enc,
+                          b, l, s, d, st, en, patient_id))
+                    sync_demands(c, cur.lastrowid, novo_demands)
+
+                if rows:
+                    update_daily_metrics(c, [day_key])
+                    on_commit(partial(day_cache.invalidate, [day_key]))
+                c.execute(
+                    "INSERT INTO rollover_log (date_iso, ts) VALUES (?,?)",
+                    (day_key, datetime.now().strftime("%d/%m %H:%M")),
+                )
+                prev_key = day_key
+                day = day.addDays(1)
+        return True
+
      
     # ------------------------------------------------------------
     #  Importador de Excel (rápido + progress bar)
@@ -1241,7 +1571,7 @@ class Main(QMainWindow):
                 return None
             if pd.isna(ts):
                 return None
-            return ts.date().isoformat()
+            return ts.strftime("%d/%m/%Y")     # mesmo formato das abas do dia
 
         def _normalize_time(value):
             if value is None:
@@ -1281,136 +1611,123 @@ class Main(QMainWindow):
         }
 
         processed = 0
+        touched_days = set()
         try:
-            conn = get_conn()
-            cur  = conn.cursor()
-            cur.execute("BEGIN")           # transação ÚNICA
-
-            for sheet_name, df in wb.items():
-                sh = str(sheet_name).strip().lower()
-
-                # ---------- PACIENTES / REFEIÇÕES ----------
-                if sh in meal_flag:
-                    flag = meal_flag[sh]
-                    for _, row in df.iterrows():
-                        if row.isna().all():
-                            continue
-                        nome  = str(row[0]).strip()
-                        dmd   = str(row[1]).strip()
-                        prof  = str(row[2]).strip()
-                        data  = _normalize_date(row[3])
-                        hora  = _normalize_time(row[4])
-                        obs   = str(row[5]).strip()
-
-                        if not nome or not data:
-                            if nome or data:
-                                invalid_rows.append((sheet_name, nome or "(sem nome)", "data inválida"))
-                            continue
-
-                        if hora is False:
-                            invalid_rows.append((sheet_name, nome, "hora inválida"))
-                            continue
-
-                        # dentro do loop for _, row in df.iterrows():
-                        pid = self._get_or_create(nome, data, cur)
-
-                        # fetch dados atuais
-                        row = cur.execute("SELECT demands FROM records WHERE id=?", (pid,)).fetchone()
-                        if row is None:
-                            raise RuntimeError("ID não encontrado.")
-
-                        old_demands, = row
-                        old_demands = old_demands or ""
-                        new_demands = ", ".join(sorted({*(tok.strip() for tok in old_demands.split(",")),
-                                                        *(tok.strip() for tok in dmd.split(","))} - {""}))
-
-                        sets = ["demands=?", "reference_prof=?", "observations=?"]
-                        vals = [new_demands, prof, obs]
-
-                        # --- MARCA REFEIÇÃO conforme aba ---------------------------------
-                        if flag:                           # almoço / lanche / janta
-                            sets.append(f"{flag}=?")
-                            vals.append(1)
-                        else:                              # aba “Pacientes”
-                            # se o horário começa com 09: marca Desjejum
-                            if hora and str(hora)[:2] == "09":
-                                sets.append("desjejum=?")
-                                vals.append(1)
-
-                        # --- ACERTA horário de entrada -----------------------------------
-                        if hora:
-                            sets += ["enter_inf=?", "enter_sys=?"]   # grava nos dois campos
-                            vals += [hora, hora]
-
-                        vals.append(pid)
-                        cur.execute(f"UPDATE records SET {', '.join(sets)} WHERE id=?", vals)
-
-
-                        # progress bar
-                        processed += 1
-                        progress.setValue(processed)
-                        QApplication.processEvents()
-                        if progress.wasCanceled():
-                            raise RuntimeError("Importação cancelada pelo usuário.")
-
-                # ---------- ACOLHIMENTOS ----------
-                elif sh.startswith("acolh"):
-                    for _, row in df.iterrows():
-                        if row.isna().all():
-                            continue
-                        nome  = str(row[0]).strip()
-                        dmd   = str(row[1]).strip()
-                        enc   = str(row[2]).strip()
-                        prof  = str(row[3]).strip()
-                        data  = _normalize_date(row[4])
-                        hora  = _normalize_time(row[5])
-                        obs   = str(row[6]).strip()
-
-                        if not nome or not data:
-                            if nome or data:
-                                invalid_rows.append((sheet_name, nome or "(sem nome)", "data inválida"))
-                            continue
-
-                        if hora is False:
-                            invalid_rows.append((sheet_name, nome, "hora inválida"))
-                            continue
-
-                        pid = self._get_or_create(nome, data, cur)
-
-                        row = cur.execute(
-                            "SELECT demands, encaminhamento FROM records WHERE id=?", (pid,)
-                        ).fetchone()
-                        if row is None:
-                            raise RuntimeError("ID não encontrado.")
-
-                        old_demands, old_enc = row
-                        old_demands = old_demands or ""
-                        new_demands = ", ".join(
-                            sorted({*(tok.strip() for tok in old_demands.split(",")),
-                                    *(tok.strip() for tok in dmd.split(","))} - {""})
-                        )
-
-                        cur.execute("""
-                            UPDATE records
-                            SET demands=?, encaminhamento=?, reference_prof=?,
-                                observations=?, enter_inf=?
-                            WHERE id=?
-                        """, (new_demands, enc, prof, obs, hora, pid))
-
-                        processed += 1
-                        progress.setValue(processed)
-                        QApplication.processEvents()
-                        if progress.wasCanceled():
-                            raise RuntimeError("Importação cancelada pelo usuário.")
-
-            conn.commit()
+            with transaction() as conn:     # transação ÚNICA
+                cur = conn.cursor()
+
+                for sheet_name, df in wb.items():
+                    sh = str(sheet_name).strip().lower()
+
+                    # ---------- PACIENTES / REFEIÇÕES ----------
+                    if sh in meal_flag:
+                        flag = meal_flag[sh]
+                        for _, row in df.iterrows():
+                            if row.isna().all():
+                                continue
+                            nome  = str(row[0]).strip()
+                            dmd   = str(row[1]).strip()
+                            prof  = str(row[2]).strip()
+                            data  = _normalize_date(row[3])
+                            hora  = _normalize_time(row[4])
+                            obs   = str(row[5]).strip()
+
+                            if not nome or not data:
+                                if nome or data:
+                                    invalid_rows.append((sheet_name, nome or "(sem nome)", "data inválida"))
+                                continue
+
+                            if hora is False:
+                                invalid_rows.append((sheet_name, nome, "hora inválida"))
+                                continue
+
+                            # dentro do loop for _, row in df.iterrows():
+                            pid = self._get_or_create(nome, data, cur)
+
+                            # demandas atuais ∪ demandas da planilha
+                            old_tokens = {tok for (tok,) in cur.execute(
+                                "SELECT token FROM record_demands WHERE record_id=?", (pid,))}
+                            new_demands = ", ".join(sorted(
+                                old_tokens | {t.token for t in parse_demands(dmd)}))
+
+                            fields = {"demands": new_demands,
+                                      "reference_prof": prof, "observations": obs}
+
+                            # --- MARCA REFEIÇÃO conforme aba ---------------------------------
+                            if flag:                           # almoço / lanche / janta
+                                fields[flag] = 1
+                            else:                              # aba “Pacientes”
+                                # se o horário começa com 09: marca Desjejum
+                                if hora and str(hora)[:2] == "09":
+                                    fields["desjejum"] = 1
+
+                            # --- ACERTA horário de entrada -----------------------------------
+                            if hora:
+                                fields["enter_inf"] = fields["enter_sys"] = hora   # grava nos dois campos
+
+                            update_record_fields(cur, pid, fields)
+                            sync_demands(cur, pid, new_demands)
+                            touched_days.add(to_iso_date(data))
+
+
+                            # progress bar
+                            processed += 1
+                            progress.setValue(processed)
+                            QApplication.processEvents()
+                            if progress.wasCanceled():
+                                raise RuntimeError("Importação cancelada pelo usuário.")
+
+                    # ---------- ACOLHIMENTOS ----------
+                    elif sh.startswith("acolh"):
+                        for _, row in df.iterrows():
+                            if row.isna().all():
+                                continue
+                            nome  = str(row[0]).strip()
+                            dmd   = str(row[1]).strip()
+                            enc   = str(row[2]).strip()
+                            prof  = str(row[3]).strip()
+                            data  = _normalize_date(row[4])
+                            hora  = _normalize_time(row[5])
+                            obs   = str(row[6]).strip()
+
+                            if not nome or not data:
+                                if nome or data:
+                                    invalid_rows.append((sheet_name, nome or "(sem nome)", "data inválida"))
+                                continue
+
+                            if hora is False:
+                                invalid_rows.append((sheet_name, nome, "hora inválida"))
+                                continue
+
+                            pid = self._get_or_create(nome, data, cur)
+
+                            old_tokens = {tok for (tok,) in cur.execute(
+                                "SELECT token FROM record_demands WHERE record_id=?", (pid,))}
+                            new_demands = ", ".join(sorted(
+                                old_tokens | {t.token for t in parse_demands(dmd)}))
+
+                            cur.execute("""
+                                UPDATE records
+                                SET demands=?, encaminhamento=?, reference_prof=?,
+                                    observations=?, enter_inf=?
+                                WHERE id=?
+                            """, (new_demands, enc, prof, obs, hora, pid))
+                            sync_demands(cur, pid, new_demands)
+                            touched_days.add(to_iso_date(data))
+
+                            processed += 1
+                            progress.setValue(processed)
+                            QApplication.processEvents()
+                            if progress.wasCanceled():
+                                raise RuntimeError("Importação cancelada pelo usuário.")
+
+                update_daily_metrics(cur, touched_days)
+                on_commit(partial(day_cache.invalidate, touched_days))
 
         except Exception as exc:
-            conn.rollback()
             QMessageBox.critical(self, "Erro", str(exc))
             return
         finally:
-            conn.close()
             progress.close()
 
         self.refresh()
@@ -1427,33 +1744,30 @@ class Main(QMainWindow):
 
     # --------- helper modificado: permite usar cur externo ----------
     def _get_or_create(self, name, date_iso, cur=None):
-        own_conn = False
         if cur is None:
-            own_conn = True
-            conn = get_conn()
-            cur  = conn.cursor()
+            with transaction() as conn:
+                return Main._get_or_create(self, name, date_iso, conn.cursor())
 
+        patient_id = patient_id_for(cur, name)
         row = cur.execute(
             """
                 SELECT id
                   FROM records
-                 WHERE patient_name=?
-                   AND date=?
+                 WHERE patient_id=?
+                   AND date_iso=?
                    AND left_sys IS NULL
                    AND archived_ai = 0
             """,
-            (name, date_iso)
+            (patient_id, to_iso_date(date_iso))
         ).fetchone()
         if row:
             pid = row[0]
         else:
             now = QTime.currentTime().toString("HH:mm")
             cur.execute("""
-                INSERT INTO records (patient_name, date, enter_sys, enter_inf)
-                VALUES (?,?,?,?)""", (name, date_iso, now, now))
+                INSERT INTO records (patient_name, date, enter_sys, enter_inf, patient_id)
+                VALUES (?,?,?,?,?)""", (name, date_iso, now, now, patient_id))
             pid = cur.lastrowid
-        if own_conn:
-            conn.commit(); conn.close()
         return pid
 
     # ------------------------------------------------------------
@@ -1465,18 +1779,17 @@ class Main(QMainWindow):
           • filtro de demanda escolhido no combo (exato, sem engolir AN/M/RM…)
           • ordenação selecionada no combo de ordem
           • parâmetro `extra` passado pelos outros métodos (desjejum, lunch …)
-        O formato de saída continua sendo 8 colunas:
+        Cada linha é um Record com as 8 colunas de TAB_COLS:
             id, patient_name, demands, reference_prof,
             enter_sys, enter_inf, left_sys, left_inf
         """
         # ---------------- parâmetros fixos -----------------
         base_sql = f"""
-            SELECT id, patient_name, demands, reference_prof,
-                   enter_sys, enter_inf, left_sys, left_inf
+            SELECT {', '.join(TAB_COLS)}
               FROM records
-             WHERE date = ? {extra}
+             WHERE date_iso = ? {extra}
         """
-        params = [date_iso]
+        params = [to_iso_date(date_iso)]
 
         # ───── novo trecho ─────
         if not include_clones:                 # padrão: esconder fantasmas
@@ -1487,14 +1800,16 @@ class Main(QMainWindow):
         wanted = (self.cmb_dmd_filter.currentData()
                   if hasattr(self, 'cmb_dmd_filter') else "")
         if wanted:
-            # nada de LIKE "%A%" – vamos filtrar depois em Python
-            pass  # só pegaremos tudo e filtraremos já no Python
+            # nada de LIKE "%A%" – usa o índice de record_demands
+            dmd_sql, dmd_params = demand_filter(wanted)
+            base_sql += dmd_sql
+            params += dmd_params
 
         # ---------------- ordenação ------------------------
         order_idx = self.cmb_order.currentIndex() if hasattr(self, 'cmb_order') else 0
 
         if wanted == "C":                         # Convivência → ordenar por horário
-            order_clause = "ORDER BY start_time, end_time, patient_name COLLATE NOCASE"
+            order_clause = "ORDER BY start_min, end_min, patient_name COLLATE NOCASE"
         else:                                     # demais opções
             order_map = {
                 0: "ORDER BY id DESC",
@@ -1506,30 +1821,8 @@ class Main(QMainWindow):
         sql = f"{base_sql} {order_clause}"
 
         # ---------------- executa SQL ----------------------
-        with get_conn() as c:
-            rows = c.execute(sql, params).fetchall()
-
-            # ---------------- filtro exato em Python -----------
-        if wanted:
-            def _match(demand_str: str) -> bool:
-                """
-                Regras:
-                    • C  → qualquer token que comece com 'C'
-                    • AN → qualquer token que comece com 'AN'
-                    • Qualquer outro código → igualdade exata
-                """
-                for tok in (demand_str or "").split(","):
-                    tok = tok.strip()
-                    if wanted == "C" and tok.startswith("C"):
-                        return True
-                    if wanted == "AN" and tok.startswith("AN"):
-                        return True
-                    if tok == wanted:                     # ex.: 'AN Entrou'
-                        return True
-                return False
-
-            rows = [r for r in rows if _match(r[2])]
-
+        c = connection()
+        rows = c.cursor(RecordCursor).execute(sql, params).fetchall()
 
         return rows
 
@@ -1544,23 +1837,23 @@ class Main(QMainWindow):
         """
         # 1) alguém acabou de mexer: refazemos o cenário completo
         ai_on = any(cb.isChecked() for cb in self.dem_cb
-                    if cb.text() in ("AI", "REA"))
+                    if cb.text() in ARCHIVE_CODES)
         other_on = any(cb.isChecked() for cb in self.dem_cb
-                       if cb.text() not in ("AI", "REA"))
+                       if cb.text() not in ARCHIVE_CODES)
 
         # 2) aplica a regra
         if ai_on and other_on:
-            if self.sender() and self.sender().text() in ("AI", "REA"):
+            if self.sender() and self.sender().text() in ARCHIVE_CODES:
                 # AI/REA venceu  → limpa as outras
                 for cb in self.dem_cb:
-                    if cb.text() not in ("AI", "REA"):
+                    if cb.text() not in ARCHIVE_CODES:
                         cb.blockSignals(True)
                         cb.setChecked(False)
                         cb.blockSignals(False)
             else:
                 # outra venceu  → limpa AI/REA + encaminhamento
                 for cb in self.dem_cb:
-                    if cb.text() in ("AI", "REA"):
+                    if cb.text() in ARCHIVE_CODES:
                         cb.blockSignals(True)
                         cb.setChecked(False)
                         cb.blockSignals(False)
@@ -1568,7 +1861,7 @@ class Main(QMainWindow):
                 self.lbl_enc.clear()
 
         # 3) se AI/REA acabou ligado, pedir/confirmar encaminhamento
-        if any(cb.isChecked() for cb in self.dem_cb if cb.text() in ("AI", "REA")):
+        if any(cb.isChecked() for cb in self.dem_cb if cb.text() in ARCHIVE_CODES):
             if not self.enc:                       # ainda não tem enc. → pergunta
                 dia = EncaminhamentoDialog(self)
                 if dia.exec_():
@@ -1577,7 +1870,7 @@ class Main(QMainWindow):
                 else:
                     # usuário cancelou → desmarca AI/REA
                     for cb in self.dem_cb:
-                        if cb.text() in ("AI", "REA"):
+                        if cb.text() in ARCHIVE_CODES:
                             cb.blockSignals(True)
                             cb.setChecked(False)
                             cb.blockSignals(False)
@@ -1600,12 +1893,9 @@ class Main(QMainWindow):
         if not dlg.exec_(): self.sender().setChecked(False); return
         self.start_time,self.end_time=dlg.interval()
         self.lbl_conv.setText(f"Convivência 🏠 {self.start_time}-{self.end_time}")
-        t0=QTime.fromString(self.start_time,"HH:mm"); t1=QTime.fromString(self.end_time,"HH:mm")
-        def covers(h): return t0<=h<=t1
-        self.chk_b.setChecked(covers(HORARIOS["desjejum"]))
-        self.chk_l.setChecked(covers(HORARIOS["almoco"]))
-        self.chk_s.setChecked(covers(HORARIOS["lanche"]))
-        self.chk_d.setChecked(covers(HORARIOS["janta"]))
+        for chk, on in zip((self.chk_b,self.chk_l,self.chk_s,self.chk_d),
+                           covered_meals(self.start_time,self.end_time)):
+            chk.setChecked(bool(on))
 
     # ------------------------------------------------------------
     #  Não permitir combinações entre R, M e RM  (formulário novo)
@@ -1643,8 +1933,8 @@ class Main(QMainWindow):
 
     def register(self):
         # ── trava anti-AI/REA ──────────────────────────────────────────
-        ai_on     = any(cb.isChecked() for cb in self.dem_cb if cb.text() in ("AI", "REA"))
-        other_on  = any(cb.isChecked() for cb in self.dem_cb if cb.text() not in ("AI", "REA"))
+        ai_on     = any(cb.isChecked() for cb in self.dem_cb if cb.text() in ARCHIVE_CODES)
+        other_on  = any(cb.isChecked() for cb in self.dem_cb if cb.text() not in ARCHIVE_CODES)
         if ai_on and other_on:
             QMessageBox.warning(self, "Demanda inválida",
                                 "AI/REA não pode ser combinada com outras demandas.")
@@ -1687,9 +1977,9 @@ class Main(QMainWindow):
                 archived_ai = 0,
             )
 
-            add_record(row)
+            changed = add_record(row)
             self._clear()
-            self.refresh()
+            self._apply_changes(changed)
             QMessageBox.information(self, "Sucesso 🎉", "Registro salvo!")
 
         except Exception as e:
@@ -1708,50 +1998,49 @@ class Main(QMainWindow):
             QMessageBox.warning(self, "Aviso ⚠️", "Selecione uma aba de pacientes.")
             return
         if tbl is self.tbl_left: return
-        rows=tbl.selectionModel().selectedRows()
-        if not rows: QMessageBox.warning(self,"Aviso ⚠️","Selecione o paciente."); return
+        ids=tbl.selected_ids()
+        if not ids: QMessageBox.warning(self,"Aviso ⚠️","Selecione o paciente."); return
         dlg=SimpleTimeDialog("Horário de Saída ⏲️",self)
         if not dlg.exec_(): return
         left_inf=dlg.hour(); left_sys=QTime.currentTime().toString("HH:mm")
-        for r in rows:
-            pid=int(tbl.item(r.row(),0).text())
+        changed=[]
+        for pid in ids:
             try:
-                leave_record(pid,left_sys,left_inf)
+                changed += leave_record(pid,left_sys,left_inf)
             except ValueError as exc:
                 QMessageBox.warning(self, "Aviso ⚠️", str(exc))
             except Exception as exc:
                 QMessageBox.critical(self, "Erro ❌", str(exc))
-        self.refresh()
+        self._apply_changes(changed)
 
     # -------- reativar
     def activate(self):
         if self.tabs.currentWidget() is not self.tbl_left:
             QMessageBox.warning(self,"Aviso ⚠️","Vá para aba Saíram."); return
-        rows=self.tbl_left.selectionModel().selectedRows()
-        if not rows: QMessageBox.warning(self,"Aviso ⚠️","Selecione o paciente."); return
+        ids=self.tbl_left.selected_ids()
+        if not ids: QMessageBox.warning(self,"Aviso ⚠️","Selecione o paciente."); return
         dlg=SimpleTimeDialog("Horário de Retorno ⏰",self)
         if not dlg.exec_(): return
         enter_inf=dlg.hour(); enter_sys=QTime.currentTime().toString("HH:mm")
-        for r in rows:
-            pid=int(self.tbl_left.item(r.row(),0).text())
-            try: reactivate_from(pid,enter_sys,enter_inf)
+        changed=[]
+        for pid in ids:
+            try: changed += reactivate_from(pid,enter_sys,enter_inf)
             except Exception as e: QMessageBox.critical(self,"Erro ❌",str(e))
-        self.refresh()
+        self._apply_changes(changed)
 
     # -------- editar refeições
     def edit_meals(self):
-        tbl = self.tabs.currentWidget()
-        rows = tbl.selectionModel().selectedRows()
-        if not rows:
+        ids = self._selected_ids()
+        if not ids:
             QMessageBox.warning(self,"Aviso ⚠️","Selecione o paciente."); return
 
-        pid = int(tbl.item(rows[0].row(), 0).text())
+        pid = ids[0]
 
-        with get_conn() as c:
-            row = c.execute(
-                "SELECT desjejum,lunch,snack,dinner,left_sys,archived_ai FROM records WHERE id=?",
-                (pid,),
-            ).fetchone()
+        c = connection()
+        row = c.execute(
+            "SELECT desjejum,lunch,snack,dinner,left_sys,archived_ai FROM records WHERE id=?",
+            (pid,),
+        ).fetchone()
 
         if row is None:
             raise RuntimeError("ID não encontrado.")
@@ -1787,12 +2076,12 @@ class Main(QMainWindow):
             return
 
         try:
-            update_meals(
+            changed = update_meals(
                 pid,
                 int(cb_b.isChecked()), int(cb_l.isChecked()),
                 int(cb_s.isChecked()), int(cb_d.isChecked())
             )
-            self.refresh()
+            self._apply_changes(changed)
         except Exception as exc:
             QMessageBox.critical(self, "Erro ❌", str(exc))
 
@@ -1803,21 +2092,21 @@ class Main(QMainWindow):
     # ------------------------------------------------------------
     def edit_record(self):
         tbl = self.tabs.currentWidget()
-        sel = tbl.selectionModel().selectedRows()
-        if not sel:
+        ids = self._selected_ids()
+        if not ids:
             QMessageBox.warning(self, "Aviso ⚠️", "Selecione o paciente antes.")
             return
 
-        pid = int(tbl.item(sel[0].row(), 0).text())
+        pid = ids[0]
 
         # --------------- carrega dados atuais ---------------
-        with get_conn() as c:
-            row = c.execute("""
-                SELECT patient_name, demands, reference_prof, observations,
-                       start_time, end_time, encaminhamento,
-                       desjejum, lunch, snack, dinner
-                FROM records WHERE id=?""", (pid,)
-            ).fetchone()
+        c = connection()
+        row = c.execute("""
+            SELECT patient_name, demands, reference_prof, observations,
+                   start_time, end_time, encaminhamento,
+                   desjejum, lunch, snack, dinner
+            FROM records WHERE id=?""", (pid,)
+        ).fetchone()
 
         if row is None:
             raise RuntimeError("ID não encontrado.")
@@ -1826,8 +2115,7 @@ class Main(QMainWindow):
          start_t, end_t, enc,
          b, l, s, d) = row
 
-        tokens_atual = {tok.strip().split(" ")[0]
-                        for tok in (demands or "").split(",") if tok}
+        tokens_atual = set(demand_keys(demands))     # "AN Entrou" marca a própria caixa
 
         # --------------- monta diálogo ---------------
         dlg = QDialog(self); dlg.setWindowTitle("Editar registro 📝")
@@ -1865,7 +2153,7 @@ class Main(QMainWindow):
         # 1) AI / REA exclusivos
         def _enforce_ai_rule(state: int, box: QCheckBox) -> None:
             nonlocal enc
-            ai_codes = ("AI", "REA")
+            ai_codes = ARCHIVE_CODES
             ai_on    = any(chk_map[c].isChecked() for c in ai_codes)
             other_on = any(
                 chk_map[c].isChecked() for c in DEMAND_LIST if c not in ai_codes
@@ -1928,13 +2216,13 @@ class Main(QMainWindow):
                 if d.exec_():
                     enc = d.choice()
                 else:                                      # cancelou ⇒ desmarca AI/REA
-                    for c in ("AI", "REA"):
+                    for c in ARCHIVE_CODES:
                         _mute(chk_map[c], False)
                     enc = None
             else:
                 enc = None
 
-        for c in ("AI", "REA"):
+        for c in ARCHIVE_CODES:
             chk_map[c].stateChanged.connect(_ask_enc)
 
 
@@ -1964,16 +2252,10 @@ class Main(QMainWindow):
         new_demands = ", ".join(fmt_C() if d == "C" else d for d in sel_tokens)
 
         # ---------- refeições automáticas se Convívio ----------
+        changed = []
         if "C" in sel_tokens and start_t and end_t:
-            def covers(qt):
-                t0 = QTime.fromString(start_t, "HH:mm")
-                t1 = QTime.fromString(end_t, "HH:mm")
-                return t0 <= qt <= t1
-            new_b = int(covers(HORARIOS["desjejum"]))
-            new_l = int(covers(HORARIOS["almoco"]))
-            new_s = int(covers(HORARIOS["lanche"]))
-            new_d = int(covers(HORARIOS["janta"]))
-            update_meals(pid, new_b, new_l, new_s, new_d)
+            new_b, new_l, new_s, new_d = covered_meals(start_t, end_t)
+            changed += update_meals(pid, new_b, new_l, new_s, new_d)
             ask_meals = False
         else:
             ask_meals = QMessageBox.question(
@@ -1984,24 +2266,22 @@ class Main(QMainWindow):
 
         # ---------- grava tudo ----------
         try:
-            update_demands(pid, new_demands, start_t, end_t, enc)
+            changed += update_demands(pid, new_demands, start_t, end_t, enc)
 
-            with get_conn() as c:
+            with transaction() as c:
                 c.execute("""
-                    UPDATE records SET patient_name=?, reference_prof=?, observations=?
-                    WHERE id=?""", (new_name, new_prof, new_obs, pid))
-                c.commit()
-
+                    UPDATE records
+                       SET patient_name=?, reference_prof=?, observations=?, patient_id=?
+                     WHERE id=?""",
+                    (new_name, new_prof, new_obs, patient_id_for(c, new_name), pid))
+                invalidate_records(c, [pid])
+                changed += changed_records(c, [pid])
+
+            self._apply_changes(changed)
             if ask_meals:
-                self.refresh()
                 # re-seleciona para abrir o diálogo correto
-                for r in range(tbl.rowCount()):
-                    if int(tbl.item(r, 0).text()) == pid:
-                        tbl.selectRow(r)
-                        break
+                tbl.select_id(pid)
                 self.edit_meals()
-
-            self.refresh()
         except Exception as exc:
             QMessageBox.critical(self, "Erro ❌", str(exc))
 
@@ -2010,13 +2290,13 @@ class Main(QMainWindow):
     # ------------------------------------------------------------
     def _show_observations(self):
         iso = self.date.date().toString("dd/MM/yyyy")
-        with get_conn() as c:
-            rows = c.execute("""
-                SELECT id, patient_name, observations
-                FROM records
-                WHERE date=? AND observations IS NOT NULL
-                      AND TRIM(observations) <> ''
-            """, (iso,)).fetchall()
+        c = connection()
+        rows = c.execute("""
+            SELECT id, patient_name, observations
+            FROM records
+            WHERE date_iso=? AND observations IS NOT NULL
+                  AND TRIM(observations) <> ''
+        """, (to_iso_date(iso),)).fetchall()
 
         if not rows:
             QMessageBox.information(self, "Observações",
@@ -2047,17 +2327,17 @@ class Main(QMainWindow):
 
 
     # -------- histórico (duplo clique)
-    def show_history(self, item):
-        pid = int(item.tableWidget().item(item.row(), 0).text())
-        with get_conn() as c:
-            meal = c.execute(
-                "SELECT ts,old_b,old_l,old_s,old_d,new_b,new_l,new_s,new_d "
-                "FROM meal_log WHERE record_id=? ORDER BY log_id",
-                (pid,)).fetchall()
-            dem  = c.execute(
-                "SELECT ts,old_demands,new_demands "
-                "FROM demand_log WHERE record_id=? ORDER BY log_id",
-                (pid,)).fetchall()
+    def show_history(self, index):
+        pid = index.data(ROW_ID_ROLE)
+        c = connection()
+        meal = c.execute(
+            "SELECT ts,old_b,old_l,old_s,old_d,new_b,new_l,new_s,new_d "
+            "FROM meal_log WHERE record_id=? ORDER BY log_id",
+            (pid,)).fetchall()
+        dem  = c.execute(
+            "SELECT ts,old_demands,new_demands "
+            "FROM demand_log WHERE record_id=? ORDER BY log_id",
+            (pid,)).fetchall()
 
         if not meal and not dem:
             QMessageBox.information(self, "Histórico", "Sem alterações registradas.")
@@ -2077,98 +2357,249 @@ class Main(QMainWindow):
         QMessageBox.information(self, "Histórico ✏️", txt)
 
 
+    def show_patient_history(self, name: str) -> None:
+        """Todos os dias em que o paciente foi atendido (patient_history)."""
+        self.queries.submit(
+            "history", patient_history, name,
+            on_result=lambda rows: self._show_patient_history(name, rows),
+            on_error=lambda exc: self._query_failed("Histórico", exc),
+        )
+
+    def _show_patient_history(self, name: str, rows: list) -> None:
+        if not rows:
+            QMessageBox.information(self, "Atendimentos", "Nenhum atendimento encontrado.")
+            return
+
+        dlg = QDialog(self)
+        dlg.setWindowTitle(f"📜 {name} — {len(rows)} atendimentos")
+        headers = ["Data", "Demanda", "Prof.", "Entrou", "Saiu"]
+        def columns(r):                 # data sempre dd/MM/yyyy (importados antigos: ISO)
+            day = QDate.fromString(to_iso_date(r[1]), "yyyy-MM-dd").toString("dd/MM/yyyy")
+            return (day, *r[2:])
+
+        model = RowTableModel(headers, dlg, columns=columns, mark_col=None)
+        model.set_rows(rows)
+        lay = QVBoxLayout(dlg)
+        lay.addWidget(RowTableView(model, dlg))
+        dlg.resize(640, 420)
+        dlg.exec_()
+
+
     # ───────────────────────────────────────── refresh COMPLETO ─────────────────────────────────────────
+    def _load_day(self, iso: str) -> tuple:
+        """
+        Tudo o que o refresh() precisa do dia `iso` (dd/MM/yyyy) quando ele
+        não está no day_cache. Roda no executor, fora da thread da tela:
+        não mexe em widgets. Devolve (dados do dia, se o rollover gravou).
+        """
+        # traz AN / AN Entrou do dia anterior
+        rolled = self._rollover_an(iso)
+
+        # ——— UMA consulta para o dia inteiro ———
+        rows = day_rows(iso)
+        return self._build_day(rows, edited_ids(r.id for r in rows)), rolled
+
+    def _build_day(self, rows, edited) -> dict:
+        """Abas, combo e contadores a partir das linhas do dia (Record, por id)."""
+        tokens = {r.id: parse_demands(r.demands) for r in rows}
+
+        # ——— particiona em memória ———
+        active, left, acolh = [], [], []
+        dmd_day = {}
+        for r in rows:
+            if r.archived_ai:              # clones AI/REA não aparecem nas abas
+                continue
+            if r.left_sys is None:
+                active.append(r)
+                if r.encaminhamento is not None:
+                    acolh.append(r)
+                for code in {t.code for t in tokens[r.id] if t.key != "AN Saiu"}:
+                    dmd_day[code] = dmd_day.get(code, 0) + 1
+            else:
+                left.append(r)
+
+        return {
+            "rows": rows,
+            # combo de demandas (inclui clones, como antes)
+            "seen": {t.key for toks in tokens.values() for t in toks},
+            "active": active, "left": left, "acolh": acolh,
+            "day": self._metrics(active, dmd_day),
+            "edited": frozenset(edited),
+        }
+
+    @staticmethod
+    def _keep_day(key: str, data: dict) -> None:
+        # dias futuros não entram no cache: o rollover deles só roda
+        # quando a data chegar
+        if QDate.fromString(key, "yyyy-MM-dd") <= QDate.currentDate():
+            day_cache.put(key, data)
+
+    def _apply_changes(self, records) -> None:
+        """
+        Fim de uma gravação da tela: encaixa os Records devolvidos (ver
+        changed_records) nos dados do dia exibido, sem reler o dia — o
+        modelo de cada aba faz só os inserts/remoções/dataChanged daquelas
+        linhas e os contadores são recalculados em memória.
+        Cai no refresh() completo se ainda não há dados, se algum registro
+        é de outro dia, se outra conexão gravou desde o último refresh ou
+        se uma leitura do dia ainda está em andamento.
+        """
+        stamp = change_stamp()
+        key = to_iso_date(self._view or "")
+        if (self._data is None or self._stamp is None or stamp[:2] != self._stamp[:2]
+                or self.queries.pending("day")
+                or self._view != self.date.date().toString("dd/MM/yyyy")
+                or any(r.date_iso != key for r in records)):
+            self.refresh()
+            return
+
+        changed = {r.id: r for r in records}
+        rows = [changed.pop(r.id, r) for r in self._data["rows"]]
+        rows += sorted(changed.values(), key=lambda r: r.id)      # novos (ids maiores)
+        ids = [r.id for r in records]
+        edited = (self._data["edited"] - set(ids)) | edited_ids(ids)
+
+        data = self._build_day(rows, edited)
+        self._keep_day(key, data)
+        self._show_day(data)
+        self._stamp = change_stamp()
+
+    def _poll_changes(self):
+        """Timer: recarrega só se outra conexão gravou desde o último refresh."""
+        if self._stamp is None or QApplication.activeModalWidget() is not None:
+            return                   # diálogo aberto: o próprio diálogo dá refresh
+        if change_stamp()[:2] != self._stamp[:2]:
+            self.refresh()
+
     def refresh(self):
+        """
+        Mostra o dia da data escolhida. Dia no cache aparece na hora; senão
+        a leitura vai para o executor e a tela segue respondendo — se a data
+        mudar de novo antes de terminar, a leitura antiga é descartada.
+        """
         iso = self.date.date().toString("dd/MM/yyyy")
-                # traz AN / AN Entrou do dia anterior
-        self._rollover_an(iso)
-                # garante que o combo está sempre sincronizado
-        self._update_demand_filter_combo()
+        stamp = change_stamp()
+        if stamp == self._stamp and iso == self._view:
+            return                   # nada mudou no banco nem no dia
+        if self._loading == (iso, stamp) and self.queries.pending("day"):
+            return                   # essa mesma leitura já está a caminho
+        if self._stamp is None or stamp[:2] != self._stamp[:2]:
+            # gravação de fora do processo: não dá para saber quais dias
+            day_cache.clear()
+
+        data = day_cache.get(to_iso_date(iso))
+        if data is not None:
+            self.queries.cancel("day")
+            self._loading = None
+            self._show_day(data)
+            self._stamp, self._view = stamp, iso
+            return
 
+        self._loading = (iso, stamp)
+        self.queries.submit(
+            "day", self._load_day, iso,
+            on_result=lambda loaded: self._day_loaded(iso, stamp, *loaded),
+            on_error=lambda exc: self._day_failed(iso, exc),
+        )
 
+    def _day_loaded(self, iso: str, stamp: tuple, data: dict, rolled: bool) -> None:
+        self._loading = None
+        self._keep_day(to_iso_date(iso), data)
+        self._show_day(data)
+        # o carimbo é o de antes da leitura: gravação de fora no meio dela
+        # ainda dispara o _poll_changes. Se o rollover gravou, vale o de
+        # agora (senão a própria gravação dele pareceria de fora).
+        self._stamp, self._view = (change_stamp() if rolled else stamp), iso
 
-        # ——— puxa dados do BD ———
-        with get_conn() as c:
-            today_rows = c.execute(
-                "SELECT * FROM records WHERE date=? AND left_sys IS NULL AND archived_ai=0",
-                (iso,),
-            ).fetchall()
-            all_rows   = c.execute(
-                "SELECT * FROM records WHERE archived_ai=0"
-            ).fetchall()
+    def _day_failed(self, iso: str, exc: Exception) -> None:
+        self._loading = None         # o próximo refresh()/poll tenta de novo
+        self._query_failed(f"Dia {iso}", exc)
 
-        day = self._metrics(today_rows)
-        tot = self._metrics(all_rows)
-        counts_today = counts(iso)
+    def _query_failed(self, what: str, exc: Exception) -> None:
+        logging.getLogger(__name__).warning("%s: consulta falhou: %s", what, exc)
+        QMessageBox.warning(self, "Banco de dados",
+                            f"{what}: não foi possível ler o banco.\n{exc}")
 
-        # --- mini-contadores do dashboard ---
-        mini = {
+    @staticmethod
+    def _dashboard(data: dict) -> dict:
+        """Mini-contadores do dashboard (dash_lbls) a partir de _build_day()."""
+        day = data["day"]
+        return {
             "desj":  day["desj"],
             "lunch": day["alm"],
             "snack": day["lan"],
             "dinner":day["jan"],
-            "total": counts_today["total de Pacientes"],
-            "acolh": counts_today["acolh"],
+            "total": len(data["active"]),
+            "acolh": len(data["acolh"]),
         }
-        for k, v in mini.items():
+
+    def _show_day(self, data: dict) -> None:
+        """Combo, contadores e abas (só a visível agora) com os dados do dia."""
+        # garante que o combo está sempre sincronizado (pode voltar a “Todas”)
+        self._update_demand_filter_combo(data["seen"])
+        self._apply_view_filters()
+
+        # --- mini-contadores do dashboard ---
+        for k, v in self._dashboard(data).items():
             lbl = self.dash_lbls.get(k)        # ← evita KeyError se faltar
             if lbl is not None:
                 lbl.setText(str(v))
 
-        # --- preenche tabelas principais ---
-        self._fill(self.tbl_all,   self.fetch(iso, "AND left_sys IS NULL"))
-        self._fill(self.tbl_break, self.fetch(iso, "AND desjejum=1 AND left_sys IS NULL"))
-        self._fill(self.tbl_lunch, self.fetch(iso, "AND lunch=1 AND left_sys IS NULL"))
-        self._fill(self.tbl_snack, self.fetch(iso, "AND snack=1 AND left_sys IS NULL"))
-        self._fill(self.tbl_dinner,self.fetch(iso, "AND dinner=1 AND left_sys IS NULL"))
-        self._fill(
-            self.tbl_acolh,
-            self._fetch_acolh(iso),
-            include_enc=True
-        )
-        self._fill(self.tbl_left,  self.fetch(iso, "AND left_sys IS NOT NULL"))
+        # --- abas: só a visível agora; as outras quando forem abertas ---
+        self._data = data
+        self._dirty = set(self.patient_tables) | {self.tbl_cons_day, self.tbl_cons_total}
+        self._fill_tab(self.tabs.currentWidget())
 
-        # --- consolidados ---
-        self._fill_cons(self.tbl_cons_day,   day)
-        self._fill_cons(self.tbl_cons_total, tot)
+
+    def _fill_tab(self, tbl):
+        """
+        Preenche `tbl` com os dados do último refresh, se ainda não foi
+        preenchida desde então. O consolidado geral (histórico inteiro)
+        só é calculado quando a aba dele é aberta.
+        """
+        if tbl not in self._dirty:
+            return
+        self._dirty.discard(tbl)
+        data = self._data
+        if tbl is self.tbl_cons_day:
+            self._fill_cons(tbl, data["day"])
+        elif tbl is self.tbl_cons_total:
+            self._fill_cons(tbl, day_cache.totals())
+        elif tbl is self.tbl_acolh:
+            self._fill(tbl, sorted(data["acolh"], key=lambda r: -r.id), edited=data["edited"])
+        elif tbl is self.tbl_left:
+            self._fill(tbl, data["left"], edited=data["edited"])
+        elif tbl in self.meal_tables:
+            meal = self.meal_tables[tbl]
+            self._fill(tbl, [r for r in data["active"] if getattr(r, meal) == 1],
+                       edited=data["edited"])
+        else:
+            self._fill(tbl, data["active"], edited=data["edited"])
 
 
     # ------------------------------------------------------------
     #  Atualiza a lista do combo de filtro de demandas (painel principal)
     # ------------------------------------------------------------
-    def _update_demand_filter_combo(self):
+    def _update_demand_filter_combo(self, seen=None):
         """Preenche cmb_dmd_filter apenas com *códigos visíveis* no dia atual.
 
         • C (…intervalo…)             → aparece como  C  
         • AN / AN Entrou / AN Saiu    → cada um aparece separado  
         • AI / REA / A / R / M / RM … → idem
+
+        `seen` pode vir pronto do refresh(); senão consulta o banco.
         """
         if not hasattr(self, "cmb_dmd_filter"):   # chamado antes da criação?
             return
 
-        iso  = self.date.date().toString("dd/MM/yyyy")
-        seen = set()
-
-        with get_conn() as c:
-            for (demands,) in c.execute(
-                "SELECT DISTINCT demands FROM records "
-                "WHERE date=? AND demands IS NOT NULL", (iso,)
-            ):
-                for tok in (demands or "").split(","):
-                    tok = tok.strip()
-                    if not tok:
-                        continue
-
-                    # -------- regras de extração -----------------
-                    if tok.startswith("C"):
-                        key = "C"                         # C (10:00-12:00) → C
-                    elif tok.startswith("AN Entrou"):
-                        key = "AN Entrou"
-                    elif tok.startswith("AN Saiu"):
-                        key = "AN Saiu"
-                    else:
-                        key = tok.split(" ")[0]           # A, R, RM, AI, REA…
-                    seen.add(key)
+        if seen is None:
+            iso = self.date.date().toString("dd/MM/yyyy")
+            c = connection()
+            seen = {key for (key,) in c.execute(f"""
+                SELECT DISTINCT {DEMAND_KEY_SQL}
+                  FROM records r JOIN record_demands d ON d.record_id = r.id
+                 WHERE r.date_iso = ?
+            """, (to_iso_date(iso),))}
 
         # guarda seleção atual
         old_sel = self.cmb_dmd_filter.currentData()
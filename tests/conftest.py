@@ -0,0 +1,42 @@
+"""
+Testes lentos (benchmarks, banco semeado com anos de histórico) ficam fora
+da rodada padrão e são marcados com @pytest.mark.slow:
+    pytest --run-slow
+Os números dos benchmarks vão para o log:
+    pytest --run-slow --log-cli-level=INFO -k benchmark
+"""
+import sys
+from pathlib import Path
+
+import pytest
+
+# os testes importam infra, registro_pac, ui… direto da raiz do repositório
+repo_root = Path(__file__).resolve().parents[1]
+if str(repo_root) not in sys.path:
+    sys.path.insert(0, str(repo_root))
+
+
+@pytest.fixture(scope="session")
+def qapp():
+    from PyQt5.QtWidgets import QApplication
+
+    app = QApplication.instance()
+    return app or QApplication([])
+
+
+def pytest_addoption(parser):
+    parser.addoption("--run-slow", action="store_true",
+                     help="roda também os testes marcados como slow")
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "slow: benchmark / banco grande (só com --run-slow)")
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption("--run-slow"):
+        return
+    skip = pytest.mark.skip(reason="lento: rode com --run-slow")
+    for item in items:
+        if "slow" in item.keywords:
+            item.add_marker(skip)
@@ -1,14 +1,8 @@
 import json
-import sys
 from datetime import datetime as real_datetime
-from pathlib import Path
 
 import pytest
 
-repo_root = Path(__file__).resolve().parents[1]
-if str(repo_root) not in sys.path:
-    sys.path.insert(0, str(repo_root))
-
 pytest.importorskip("pandas")
 pytest.importorskip("PyQt5")
 
@@ -74,3 +68,59 @@ def test_backup_now_creates_timestamped_copy(tmp_path, monkeypatch):
     expected = backup_root / "2024-01" / "02" / "patients_03-04-05.db"
     assert expected.exists()
     assert expected.read_text(encoding="utf-8") == "database-contents"
+
+
+def test_maintenance_cfg_merges_known_overrides(tmp_path, monkeypatch):
+    import infra
+
+    cfg_path = tmp_path / "settings.json"
+    cfg_path.write_text(
+        json.dumps({"maintenance": {"idle_sec": 30, "typo": 1}}), encoding="utf-8"
+    )
+    monkeypatch.setitem(infra._load_cfg.__globals__, "CONFIG_FILE", cfg_path)
+
+    cfg = infra.maintenance_cfg()
+    assert cfg["idle_sec"] == 30
+    assert "typo" not in cfg
+    assert cfg["interval_min"] == infra.MAINTENANCE_DEFAULTS["interval_min"]
+
+
+def test_run_maintenance_reports_timings(tmp_path, monkeypatch):
+    import infra
+
+    monkeypatch.setattr(infra, "DB_PATH", tmp_path / "patients.db")
+    infra.init_db()
+    try:
+        cfg = {**infra.MAINTENANCE_DEFAULTS, "wal_truncate_mb": 0}
+        timings = infra.run_maintenance(cfg, analyze=True)
+        conn = infra.connection()
+        assert {"analyze", "optimize", "checkpoint_truncate",
+                "incremental_vacuum"} <= set(timings)
+        assert "vacuum" not in timings            # banco novo já nasce INCREMENTAL
+        assert conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+        assert conn.execute("SELECT 1 FROM sqlite_stat1 LIMIT 1").fetchone()
+    finally:
+        infra.close_connections()
+
+
+def test_old_database_is_converted_only_on_request(tmp_path, monkeypatch):
+    import sqlite3
+
+    import infra
+
+    db_file = tmp_path / "patients.db"
+    with sqlite3.connect(db_file) as old:           # banco de antes do auto_vacuum
+        old.execute("CREATE TABLE legado (x)")
+    monkeypatch.setattr(infra, "DB_PATH", db_file)
+    infra.init_db()
+    try:
+        conn = infra.connection()
+        timings = infra.run_maintenance(infra.MAINTENANCE_DEFAULTS)
+        assert "vacuum" not in timings and "incremental_vacuum" not in timings
+        assert conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 0
+
+        infra.enable_incremental_vacuum()
+        assert conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+        assert "incremental_vacuum" in infra.run_maintenance(infra.MAINTENANCE_DEFAULTS)
+    finally:
+        infra.close_connections()
@@ -1,15 +1,11 @@
 import sqlite3
 import sys
-from pathlib import Path
+import threading
 
 import pandas as pd
 import pytest
 import infra
 
-repo_root = Path(__file__).resolve().parents[1]
-if str(repo_root) not in sys.path:
-    sys.path.insert(0, str(repo_root))
-
 pytest.importorskip("PyQt5")
 
 try:
@@ -26,14 +22,6 @@ def temp_db(monkeypatch, tmp_path):
     return db_file
 
 
-@pytest.fixture(scope="session")
-def qapp():
-    from PyQt5.QtWidgets import QApplication
-
-    app = QApplication.instance()
-    return app or QApplication([])
-
-
 @pytest.fixture
 def sample_record(temp_db):
     registro_pac.add_record(
@@ -73,6 +61,145 @@ def test_get_conn_sets_pragmas(monkeypatch, tmp_path):
     assert busy_timeout == 1500
 
 
+def test_connection_is_reused_and_reopened_per_db(monkeypatch, tmp_path, temp_db):
+    first = infra.connection()
+    assert infra.connection() is first
+
+    monkeypatch.setattr(infra, "DB_PATH", tmp_path / "other.db")
+    assert infra.connection() is not first
+
+    infra.close_connections()
+    with pytest.raises(sqlite3.ProgrammingError):
+        first.execute("SELECT 1")
+
+
+def test_change_stamp_tracks_own_and_foreign_writes(temp_db, sample_record):
+    stamp = infra.change_stamp()
+    registro_pac.day_rows("01/01/2024")
+    assert infra.change_stamp() == stamp          # leitura não muda nada
+
+    registro_pac.update_meals(sample_record, 1, 0, 0, 0)
+    own = infra.change_stamp()
+    assert own[1] == stamp[1] and own[2] == stamp[2] + 1
+
+    with sqlite3.connect(temp_db) as other:       # “outro PC”
+        other.execute("UPDATE records SET observations='x'")
+    foreign = infra.change_stamp()
+    assert foreign[1] != own[1] and foreign[2] == own[2]
+
+
+def test_poll_refreshes_only_on_foreign_writes(monkeypatch, temp_db, sample_record, qapp):
+    main = registro_pac.Main.__new__(registro_pac.Main)
+    calls = []
+    monkeypatch.setattr(main, "refresh", lambda: calls.append(1), raising=False)
+    main._stamp = infra.change_stamp()
+
+    registro_pac.update_meals(sample_record, 1, 0, 0, 0)   # escrita própria
+    main._poll_changes()
+    assert calls == []
+
+    with sqlite3.connect(temp_db) as other:
+        other.execute("UPDATE records SET observations='x'")
+    main._poll_changes()
+    assert calls == [1]
+
+
+def test_tabs_are_filled_lazily_once_per_refresh(monkeypatch):
+    main = registro_pac.Main.__new__(registro_pac.Main)
+    names = ["all", "break", "lunch", "snack", "dinner", "acolh", "left", "cons_day", "cons_total"]
+    for name in names:
+        setattr(main, f"tbl_{name}", name)
+    main.patient_tables = names[:7]
+    main.meal_tables = {"break": "desjejum", "lunch": "lunch", "snack": "snack", "dinner": "dinner"}
+
+    filled, totals = [], []
+    monkeypatch.setattr(main, "_fill", lambda tbl, rows, edited=None: filled.append(tbl),
+                        raising=False)
+    monkeypatch.setattr(main, "_fill_cons", lambda tbl, data: filled.append(tbl), raising=False)
+    monkeypatch.setattr(registro_pac.day_cache, "totals", lambda: totals.append(1) or {})
+
+    main._data = {"active": [], "left": [], "acolh": [], "day": {}, "edited": set()}
+    main._dirty = set(names)
+    main._fill_tab("all")
+    main._fill_tab("all")                  # já preenchida desde o último refresh
+    assert filled == ["all"] and totals == []
+
+    main._fill_tab("cons_total")           # histórico só quando a aba abre
+    assert filled == ["all", "cons_total"] and totals == [1]
+    assert main._dirty == set(names) - {"all", "cons_total"}
+
+
+def test_writes_update_day_view_in_place(monkeypatch, temp_db, qapp, tmp_path):
+    monkeypatch.setattr(infra, "CONFIG_FILE", tmp_path / "settings.json")
+    today = registro_pac.QDate.currentDate().toString("dd/MM/yyyy")
+    base = {
+        "demands": "A", "reference_prof": "Prof", "date": today,
+        "enter_sys": "08:00", "enter_inf": "08:00", "left_sys": None, "left_inf": None,
+        "observations": "", "encaminhamento": None,
+        "desjejum": 1, "lunch": 0, "snack": 0, "dinner": 0,
+        "start_time": None, "end_time": None, "archived_ai": 0,
+    }
+    for name in ("Ana", "Bia", "Caio"):
+        registro_pac.add_record({**base, "patient_name": name})
+
+    main = registro_pac.Main()
+    main.queries.wait()                            # refresh() inicial, no executor
+    refreshes = []
+    monkeypatch.setattr(main, "refresh", lambda: refreshes.append(1))
+
+    def ids(part):
+        return [r.id for r in main._data[part]]
+
+    [bia] = [r for r in main._data["active"] if r.patient_name == "Bia"]
+    main._apply_changes(registro_pac.leave_record(bia.id, "09:00", "09:00"))
+    main._apply_changes(registro_pac.update_meals(ids("active")[0], 1, 1, 0, 0))
+    main._apply_changes(registro_pac.add_record({**base, "patient_name": "Duda"}))
+    assert refreshes == []
+    assert ids("left") == [bia.id] and bia.id not in ids("active")
+    assert (main.dash_lbls["desj"].text(), main.dash_lbls["lunch"].text()) == ("3", "1")
+
+    # o mesmo que reler o dia do zero
+    rows = registro_pac.day_rows(today)
+    fresh = main._build_day(rows, registro_pac.edited_ids(r.id for r in rows))
+    assert fresh == main._data
+
+    main.tabs.setCurrentWidget(main.tbl_left)
+    assert main.tbl_left.model().sourceModel().rows() == main._data["left"]
+
+    with sqlite3.connect(temp_db) as other:        # gravação de fora → refresh completo
+        other.execute("UPDATE records SET observations='x'")
+    main._apply_changes([])
+    assert refreshes == [1]
+
+
+def test_transaction_rolls_back_on_error(temp_db):
+    with pytest.raises(RuntimeError), infra.transaction() as c:
+        c.execute("INSERT INTO records (patient_name, date) VALUES ('X', '01/01/2024')")
+        raise RuntimeError("boom")
+
+    with infra.transaction() as c:
+        c.execute("INSERT INTO records (patient_name, date) VALUES ('Y', '01/01/2024')")
+        with pytest.raises(RuntimeError), infra.transaction() as inner:
+            inner.execute("INSERT INTO records (patient_name, date) VALUES ('Z', '01/01/2024')")
+            raise RuntimeError("boom")
+
+    with sqlite3.connect(temp_db) as c:
+        assert c.execute("SELECT patient_name FROM records").fetchall() == [("Y",)]
+
+
+def test_reads_inside_transaction_do_not_commit_it(temp_db, sample_record):
+    with pytest.raises(RuntimeError), infra.transaction() as c:
+        c.execute("UPDATE records SET observations = 'x'")
+        # leituras no meio da transação (ex.: refresh via processEvents)
+        registro_pac.day_rows("01/01/2024")
+        registro_pac.consolidated_metrics()
+        registro_pac.edited_ids([sample_record])
+        raise RuntimeError("boom")
+
+    with sqlite3.connect(temp_db) as c:
+        assert c.execute("SELECT observations FROM records").fetchone() == ("",)
+
+
 def test_init_db_creates_tables_and_columns(temp_db):
     with sqlite3.connect(temp_db) as c:
         tables = {row[0] for row in c.execute("SELECT name FROM sqlite_master WHERE type='table'")}
@@ -83,6 +210,214 @@ def test_init_db_creates_tables_and_columns(temp_db):
             assert col in columns
 
 
+def test_init_db_migrates_iso_dates_and_indexes_date_iso(temp_db):
+    with sqlite3.connect(temp_db) as c:
+        c.execute(
+            "INSERT INTO records (patient_name, date) VALUES (?, ?)",
+            ("Importado", "2024-02-01"),
+        )
+        c.execute("PRAGMA user_version = 0")     # simula banco antigo
+        c.commit()
+
+    registro_pac.init_db()
+
+    with sqlite3.connect(temp_db) as c:
+        assert c.execute(
+            "SELECT date, date_iso FROM records WHERE patient_name='Importado'"
+        ).fetchone() == ("01/02/2024", "2024-02-01")
+
+        plan = " ".join(
+            row[3]
+            for row in c.execute(
+                "EXPLAIN QUERY PLAN SELECT id FROM records WHERE date_iso BETWEEN ? AND ?",
+                ("2024-01-01", "2024-12-31"),
+            )
+        )
+        assert "idx_records_date_iso" in plan
+
+
+def test_time_minute_columns_follow_writes(temp_db, sample_record):
+    pid = sample_record
+    with sqlite3.connect(temp_db) as c:
+        c.execute("PRAGMA user_version = 9")     # antes de _m010
+        c.commit()
+    registro_pac.init_db()                       # colunas já existem: passo idempotente
+
+    def minutes():
+        with sqlite3.connect(temp_db) as c:
+            return c.execute(
+                "SELECT enter_inf_min, left_inf_min, start_min, end_min FROM records WHERE id=?",
+                (pid,),
+            ).fetchone()
+
+    assert minutes() == (480, None, 540, 600)
+    registro_pac.update_demands(pid, "C", new_start="13:30", new_end="23:59")
+    registro_pac.leave_record(pid, left_sys="9:00", left_inf="9:00")   # inválido → NULL
+    assert minutes() == (480, None, 810, 1439)
+
+
+def test_covered_meals_uses_meal_minutes(temp_db):
+    assert infra.covered_meals("08:30", "12:00") == (1, 1, 0, 0)
+    assert infra.covered_meals("12:01", "18:00") == (0, 0, 1, 1)
+    assert infra.covered_meals(None, None) == (0, 0, 0, 0)
+    assert infra.covered_meals("25:00", "26:00") == (0, 0, 0, 0)
+
+    # sem banco: é chamada a cada clique nas refeições
+    seen = []
+    infra.connection().set_trace_callback(seen.append)
+    try:
+        assert infra.covered_meals("09:00", "09:00") == (1, 0, 0, 0)
+    finally:
+        infra.connection().set_trace_callback(None)
+    assert seen == []
+
+    # mesma conversão das colunas *_min
+    c = infra.connection()
+    for text in ["00:00", "23:59", "24:00", "9:00", "09:60", "0900", " 09:00", "", None]:
+        sql = f"SELECT {infra.TIME_MIN_EXPR.format(col='?1')}"
+        assert infra.time_minutes(text) == c.execute(sql, (text,)).fetchone()[0], text
+
+
+def test_init_db_runs_each_migration_once(monkeypatch, temp_db):
+    assert infra.schema_version() == len(infra.MIGRATIONS)
+
+    calls = []
+    monkeypatch.setattr(infra, "MIGRATIONS", infra.MIGRATIONS + [calls.append])
+    registro_pac.init_db()
+    registro_pac.init_db()
+    assert len(calls) == 1
+    assert infra.schema_version() == len(infra.MIGRATIONS)
+
+
+def test_record_demands_follow_writes(monkeypatch, temp_db, sample_record):
+    monkeypatch.setattr(
+        registro_pac.QTime,
+        "currentTime",
+        staticmethod(lambda: registro_pac.QTime.fromString("10:00", "HH:mm")),
+    )
+
+    def tokens(rid):
+        with sqlite3.connect(temp_db) as c:
+            return c.execute(
+                "SELECT code, variant, start_time, end_time FROM record_demands "
+                "WHERE record_id=? ORDER BY pos",
+                (rid,),
+            ).fetchall()
+
+    assert tokens(sample_record) == [("AI", None, None, None), ("C", None, None, None)]
+
+    registro_pac.update_demands(
+        sample_record, "AN Entrou, C (11:00-12:00)", new_start="11:00", new_end="12:00"
+    )
+    assert tokens(sample_record) == [
+        ("AN", "Entrou", None, None),
+        ("C", None, "11:00", "12:00"),
+    ]
+
+    with sqlite3.connect(temp_db) as c:
+        clone_id = c.execute("SELECT id FROM records WHERE archived_ai=1").fetchone()[0]
+    assert tokens(clone_id) == [("AI", None, None, None)]
+
+
+def test_demand_filters_match_exact_codes(temp_db):
+    base = {
+        "reference_prof": "Prof",
+        "date": "05/03/2024",
+        "enter_sys": "08:00",
+        "enter_inf": "08:00",
+        "left_sys": None,
+        "left_inf": None,
+        "observations": "",
+        "encaminhamento": None,
+        "desjejum": 0,
+        "lunch": 0,
+        "snack": 0,
+        "dinner": 0,
+        "start_time": None,
+        "end_time": None,
+        "archived_ai": 0,
+    }
+    for name, demands in [("Um", "A"), ("Dois", "AN Entrou"), ("Tres", "AI")]:
+        registro_pac.add_record({**base, "patient_name": name, "demands": demands})
+
+    filters = {
+        "d_ini": "05/03/2024",
+        "d_end": "05/03/2024",
+        "adv": False,
+        "name": "",
+        "prof": "",
+        "dmd": "A",
+        "enc": None,
+        "b": False,
+        "l": False,
+        "s": False,
+        "d": False,
+    }
+    dummy_main = registro_pac.Main.__new__(registro_pac.Main)
+    assert [r[1] for r in dummy_main._query_by_filters(filters)] == ["Um"]
+
+    day = _day_data("05/03/2024")["day"]
+    assert {code: day[code] for code in ("A", "AN", "AI", "C")} == {"A": 1, "AN": 1, "AI": 1, "C": 0}
+
+
+def test_consolidated_metrics_match_full_scan(monkeypatch, temp_db):
+    base = {
+        "reference_prof": "Prof",
+        "enter_sys": "08:00",
+        "enter_inf": "08:00",
+        "left_sys": None,
+        "left_inf": None,
+        "observations": "",
+        "desjejum": 0,
+        "lunch": 0,
+        "snack": 0,
+        "dinner": 0,
+        "start_time": None,
+        "end_time": None,
+        "archived_ai": 0,
+    }
+    rows = [
+        ("Um", "A, C", "01/03/2024", "CAPS"),
+        ("Dois", "AN Entrou", "01/03/2024", None),
+        ("Tres", "AI", "02/03/2024", " CAPS "),
+        ("Quatro", "AN Saiu", "03/03/2024", "UBS"),
+    ]
+    for name, demands, date, enc in rows:
+        registro_pac.add_record({**base, "patient_name": name, "demands": demands,
+                                 "date": date, "encaminhamento": enc})
+
+    ids = dict(infra.connection().execute("SELECT patient_name, id FROM records"))
+    registro_pac.update_meals(ids["Um"], 1, 1, 0, 1)
+    monkeypatch.setattr(registro_pac, "has_edit_log", lambda _pid: False)
+    registro_pac.update_demands(ids["Tres"], "REA", None, None, " CAPS ")
+    registro_pac.leave_record(ids["Dois"], "10:00", "10:00")
+    registro_pac.reactivate_from(ids["Dois"], "11:00", "11:00")
+
+    def full_scan():
+        c = infra.connection()
+        all_rows = c.cursor(infra.RecordCursor).execute(
+            f"SELECT {', '.join(registro_pac.DAY_COLS)} FROM records WHERE archived_ai=0"
+        ).fetchall()
+        dmd = dict(c.execute("""
+            SELECT d.code, COUNT(DISTINCT d.record_id)
+              FROM record_demands d JOIN records r ON r.id = d.record_id
+             WHERE r.archived_ai = 0 AND NOT (d.code = 'AN' AND d.variant IS 'Saiu')
+             GROUP BY d.code
+        """))
+        dummy_main = registro_pac.Main.__new__(registro_pac.Main)
+        return dummy_main._metrics(all_rows, dmd)
+
+    expected = full_scan()
+    assert expected["REA"] == 1 and expected["AN"] == 1 and expected["CAPS"] == 2
+    assert registro_pac.consolidated_metrics() == expected
+
+    # banco antigo: tabela vazia é refeita pelo rebuild
+    with infra.transaction() as c:
+        c.execute("DELETE FROM daily_metrics")
+    infra.rebuild_daily_metrics()
+    assert registro_pac.consolidated_metrics() == expected
+
+
 def test_update_meals_logs_changes(temp_db, sample_record):
     pid = sample_record
     registro_pac.update_meals(pid, 1, 0, 1, 0)
@@ -238,6 +573,91 @@ def test_get_or_create_ignores_archived_clones(monkeypatch, temp_db, sample_reco
     assert found_id != clone_id
 
 
+def test_patients_table_backfills_and_keys_lookups(monkeypatch, temp_db, sample_record):
+    # banco antigo: registro sem patient_id antes da migração
+    with sqlite3.connect(temp_db) as c:
+        c.execute(
+            "INSERT INTO records (patient_name, date, archived_ai) VALUES (?, ?, 0)",
+            ("  josé   Souza ", "02/01/2024"),
+        )
+        c.execute("UPDATE records SET patient_id=NULL")
+        c.execute("DELETE FROM patients")
+        c.execute(f"PRAGMA user_version = {infra.MIGRATIONS.index(infra._m008_patients)}")
+        c.commit()
+    registro_pac.init_db()
+
+    with sqlite3.connect(temp_db) as c:
+        assert c.execute("SELECT name, name_key FROM patients ORDER BY id").fetchall() == [
+            ("Paciente", "paciente"),
+            ("josé Souza", "jose souza"),
+        ]
+        assert c.execute("SELECT COUNT(*) FROM records WHERE patient_id IS NULL").fetchone()[0] == 0
+
+    # importação: mesmo paciente com outra grafia → mesmo registro do dia
+    dummy = type("Dummy", (), {})()
+    assert registro_pac.Main._get_or_create(dummy, "PACIENTE", "01/01/2024") == sample_record
+
+    found = registro_pac.Main._get_or_create(dummy, "Jose Souza", "03/01/2024")
+    assert registro_pac.patient_history("JOSÉ SOUZA")[0][0] == found
+    assert [r[1] for r in registro_pac.patient_history("José Souza")] == [
+        "03/01/2024", "02/01/2024",
+    ]
+
+    with sqlite3.connect(temp_db) as c:
+        plan = " ".join(
+            row[3]
+            for row in c.execute(
+                "EXPLAIN QUERY PLAN SELECT id FROM records WHERE patient_id=? AND date_iso=?",
+                (1, "2024-01-01"),
+            )
+        )
+    assert "idx_records_patient_date" in plan
+
+
+def test_patient_menu_shows_history_across_days(monkeypatch, temp_db, sample_record, qapp,
+                                               tmp_path):
+    monkeypatch.setattr(infra, "CONFIG_FILE", tmp_path / "settings.json")
+    dummy = type("Dummy", (), {})()
+    registro_pac.Main._get_or_create(dummy, "PACIENTE", "03/01/2024")
+    main = registro_pac.Main()
+    main.queries.wait()
+    main.date.setDate(registro_pac.QDate(2024, 1, 1))
+    main.queries.wait()
+
+    menus, shown = [], []
+    monkeypatch.setattr(registro_pac.QMenu, "exec_", lambda menu, pos: menus.append(menu))
+    monkeypatch.setattr(registro_pac.QDialog, "exec_", lambda dlg: shown.append(dlg) or 0)
+    tbl = main.tabs.currentWidget()
+    main._patient_menu(tbl, tbl.visualRect(tbl.model().index(0, 1)).center())
+
+    [menu] = menus
+    history = [a for a in menu.actions() if "Atendimentos" in a.text()]
+    history[0].trigger()
+    main.queries.wait()                            # consulta roda no executor
+    [dlg] = shown
+    model = dlg.findChild(registro_pac.RowTableView).model()
+    assert [model.index(r, 0).data() for r in range(model.rowCount())] == [
+        "03/01/2024", "01/01/2024",
+    ]
+
+
+def test_edited_ids_batches_log_lookup(temp_db, sample_record):
+    assert registro_pac.edited_ids([sample_record]) == set()
+
+    registro_pac.update_meals(sample_record, 1, 0, 0, 0)
+    assert registro_pac.edited_ids([sample_record, 999]) == {sample_record}
+    assert registro_pac.has_edit_log(sample_record)
+
+    with sqlite3.connect(temp_db) as c:
+        plan = " ".join(
+            row[3]
+            for row in c.execute(
+                "EXPLAIN QUERY PLAN SELECT record_id FROM demand_log WHERE record_id IN (1, 2)"
+            )
+        )
+    assert "idx_demand_log_record" in plan
+
+
 def test_update_demands_requires_start_end_pair(temp_db, sample_record):
     with pytest.raises(ValueError):
         registro_pac.update_demands(sample_record, "C", new_start="10:00")
@@ -320,6 +740,163 @@ def test_search_excludes_archived_clones(temp_db):
     assert all("Clone" not in r for r in export_rows)
 
 
+def test_search_shows_results_dialog(monkeypatch, temp_db, qapp, tmp_path):
+    monkeypatch.setattr(infra, "CONFIG_FILE", tmp_path / "settings.json")
+    base = {
+        "demands": "A", "reference_prof": "Prof", "date": "01/01/2024",
+        "enter_sys": "08:00", "enter_inf": "08:00", "left_sys": None, "left_inf": None,
+        "observations": "", "encaminhamento": None,
+        "desjejum": 1, "lunch": 0, "snack": 0, "dinner": 0,
+        "start_time": None, "end_time": None, "archived_ai": 0,
+    }
+    registro_pac.add_record({**base, "patient_name": "Ana"})
+    registro_pac.add_record({**base, "patient_name": "Bia", "desjejum": 0})
+    filters = {
+        "d_ini": "01/01/2024", "d_end": "01/01/2024", "adv": False,
+        "name": "", "prof": "", "dmd": "", "enc": None,
+        "b": False, "l": False, "s": False, "d": False, "active_only": False,
+    }
+
+    class DummySearch:
+        def __init__(self, parent=None):
+            pass
+
+        def exec_(self):
+            return 1
+
+        def filters(self):
+            return filters
+
+    main = registro_pac.Main()
+    main.queries.wait()
+    shown = []
+    monkeypatch.setattr(registro_pac, "SearchDialog", DummySearch)
+    monkeypatch.setattr(registro_pac.QDialog, "exec_", lambda dlg: shown.append(dlg) or 0)
+    main.search()
+    main.queries.wait()                            # consulta roda no executor
+
+    [res] = shown
+    model = res.findChild(registro_pac.RowTableView).model()
+    assert [(model.index(r, 1).data(), model.index(r, 3).data())
+            for r in range(model.rowCount())] == [("Ana", "✔️"), ("Bia", "")]
+
+
+def test_search_dialog_options_are_cached_and_debounced(monkeypatch, temp_db, sample_record, qapp):
+    from ui import dialogs
+
+    registro_pac.update_demands(sample_record, "AI, C", None, None, " Abrigo")
+    dlg = dialogs.SearchDialog()
+    dlg.d_ini.setDate(registro_pac.QDate(2023, 12, 1))
+    dlg._populate_combos()
+    assert [dlg.cmb_enc.itemData(i) for i in range(dlg.cmb_enc.count())] == ["", "Abrigo"]
+    assert dlg.cmb_dmd.findData("AI") != -1
+
+    # mesmo intervalo, banco intacto → nenhuma consulta
+    seen = []
+    infra.connection().set_trace_callback(seen.append)
+    try:
+        dlg._populate_combos()
+    finally:
+        infra.connection().set_trace_callback(None)
+    assert [sql for sql in seen if "SELECT" in sql] == []
+
+    # várias mudanças de data seguidas → uma única recarga no fim
+    calls = []
+    monkeypatch.setattr(dialogs, "search_options",
+                        lambda *a: calls.append(a) or ([], []))
+    for day in range(2, 9):
+        dlg.d_ini.setDate(registro_pac.QDate(2023, 12, day))
+    assert calls == []
+    dlg._debounce.timeout.emit()
+    assert len(calls) == 1 and calls[0][1] == "2023-12-08"
+
+    # o encaminhamento listado (sem espaços) acha o registro
+    dummy_main = registro_pac.Main.__new__(registro_pac.Main)
+    rows = dummy_main._query_by_filters({
+        "name": "", "prof": "", "obs": "", "dmd": "", "enc": "Abrigo",
+        "d_ini": "01/12/2023", "d_end": "31/01/2024",
+        "b": False, "l": False, "s": False, "d": False, "adv": False,
+    })
+    assert len(rows) == 1
+
+
+def test_search_options_list_every_searchable_demand(temp_db):
+    from ui import dialogs
+
+    base = {
+        "reference_prof": "Prof", "date": "2024-01-01",
+        "enter_sys": "08:00", "enter_inf": "08:00",
+        "left_sys": None, "left_inf": None, "observations": "",
+        "encaminhamento": None, "desjejum": 0, "lunch": 0, "snack": 0,
+        "dinner": 0, "start_time": None, "end_time": None,
+    }
+    registro_pac.add_record({**base, "patient_name": "Saiu",
+                             "demands": "AN Saiu", "archived_ai": 0})
+    registro_pac.add_record({**base, "patient_name": "Clone",
+                             "demands": "REA", "archived_ai": 1})
+
+    codes, _ = dialogs.search_options(infra.change_stamp(), "2024-01-01", "2024-01-01")
+    assert codes == ["AN"]                  # não entra em daily_metrics, mas a busca acha
+    dummy_main = registro_pac.Main.__new__(registro_pac.Main)
+    rows = dummy_main._query_by_filters({
+        "name": "", "prof": "", "obs": "", "dmd": "AN", "enc": "",
+        "d_ini": "01/01/2024", "d_end": "01/01/2024",
+        "b": False, "l": False, "s": False, "d": False, "adv": False,
+    })
+    assert [r[1] for r in rows] == ["Saiu"]
+
+
+def test_search_uses_fts_for_names_and_observations(monkeypatch, temp_db):
+    base = {
+        "demands": "A",
+        "reference_prof": "Conceição",
+        "date": "10/04/2024",
+        "enter_sys": "08:00",
+        "enter_inf": "08:00",
+        "left_sys": None,
+        "left_inf": None,
+        "encaminhamento": None,
+        "desjejum": 0,
+        "lunch": 0,
+        "snack": 0,
+        "dinner": 0,
+        "start_time": None,
+        "end_time": None,
+        "archived_ai": 0,
+    }
+    registro_pac.add_record({**base, "patient_name": "José da Silva",
+                             "observations": "trouxe documentos"})
+    registro_pac.add_record({**base, "patient_name": "Joana Souza",
+                             "observations": ""})
+
+    filters = {
+        "d_ini": "10/04/2024",
+        "d_end": "10/04/2024",
+        "adv": True,
+        "name": "jose sil",
+        "prof": "",
+        "obs": "",
+        "dmd": "",
+        "enc": None,
+        "b": False,
+        "l": False,
+        "s": False,
+        "d": False,
+    }
+    dummy_main = registro_pac.Main.__new__(registro_pac.Main)
+    names = lambda f: [r[1] for r in dummy_main._query_by_filters(f)]
+
+    assert names(filters) == ["José da Silva"]
+    assert names({**filters, "name": "jo", "prof": "conce"}) == ["Joana Souza", "José da Silva"]
+    assert names({**filters, "name": "", "obs": "document"}) == ["José da Silva"]
+
+    # gatilhos: edição de nome reflete no índice
+    with infra.transaction() as c:
+        c.execute("UPDATE records SET patient_name='Joana Lima' WHERE patient_name='Joana Souza'")
+    assert names({**filters, "name": "lima"}) == ["Joana Lima"]
+    assert names({**filters, "name": "souza"}) == []
+
+
 def test_import_excel_normalizes_date_and_time(monkeypatch, tmp_path, qapp):
     db_file = tmp_path / "patients.db"
     monkeypatch.setattr(registro_pac.infra, "DB_PATH", db_file)
@@ -400,8 +977,8 @@ def test_import_excel_normalizes_date_and_time(monkeypatch, tmp_path, qapp):
         ).fetchall()
 
     assert rows == [
-        ("HoraVazia", "2024-02-02", "10:00"),
-        ("Valido", "2024-02-01", "07:30"),
+        ("HoraVazia", "02/02/2024", "10:00"),
+        ("Valido", "01/02/2024", "07:30"),
     ]
     warning_messages = [msg for msg in messages if msg[0] == "warning"]
     assert warning_messages and "hora inválida" in warning_messages[0][2]
@@ -478,7 +1055,7 @@ def test_reactivate_from_updates_in_place(temp_db, sample_record):
         c.execute("UPDATE records SET archived_ai=1 WHERE id=?", (pid,))
         c.commit()
 
-    returned_id = registro_pac.reactivate_from(pid, enter_sys="10:00", enter_inf="10:00")
+    [returned] = registro_pac.reactivate_from(pid, enter_sys="10:00", enter_inf="10:00")
 
     with sqlite3.connect(temp_db) as c:
         record = c.execute(
@@ -492,7 +1069,7 @@ def test_reactivate_from_updates_in_place(temp_db, sample_record):
         meal_logs = c.execute("SELECT record_id FROM meal_log").fetchall()
         assert meal_logs == [(pid,)]
 
-    assert returned_id == pid
+    assert returned.id == pid and returned.left_sys is None
 
 
 def test_reactivate_from_validates_active_records(temp_db, sample_record):
@@ -500,6 +1077,11 @@ def test_reactivate_from_validates_active_records(temp_db, sample_record):
         registro_pac.reactivate_from(sample_record, enter_sys="08:30", enter_inf="08:30")
 
 
+def _set_today(monkeypatch, y, m, d):
+    today = registro_pac.QDate(y, m, d)
+    monkeypatch.setattr(registro_pac.QDate, "currentDate", staticmethod(lambda: today))
+
+
 def test_rollover_an_ignores_archived_clones(monkeypatch, temp_db):
     monkeypatch.setattr(
         registro_pac.QTime,
@@ -543,6 +1125,7 @@ def test_rollover_an_ignores_archived_clones(monkeypatch, temp_db):
         c.execute("UPDATE records SET demands=? WHERE id=?", ("AN", clone_id))
         c.commit()
 
+    _set_today(monkeypatch, 2024, 1, 2)
     dummy_main = type("Dummy", (), {})()
     registro_pac.Main._rollover_an(dummy_main, "02/01/2024")
 
@@ -553,7 +1136,220 @@ def test_rollover_an_ignores_archived_clones(monkeypatch, temp_db):
         )
 
 
-def test_counts_ignores_left_records(temp_db):
+def test_rollover_an_fills_missed_days_once(monkeypatch, temp_db):
+    monkeypatch.setattr(
+        registro_pac.QTime,
+        "currentTime",
+        staticmethod(lambda: registro_pac.QTime.fromString("09:00", "HH:mm")),
+    )
+    base = {
+        "reference_prof": "Prof",
+        "enter_sys": "08:00",
+        "enter_inf": "08:00",
+        "left_sys": None,
+        "left_inf": None,
+        "observations": "",
+        "encaminhamento": None,
+        "desjejum": 0,
+        "lunch": 0,
+        "snack": 0,
+        "dinner": 0,
+        "start_time": None,
+        "end_time": None,
+        "archived_ai": 0,
+    }
+    for name in ("Paciente", "Paciente"):
+        registro_pac.add_record({**base, "patient_name": name,
+                                 "demands": "AN Entrou, M", "date": "05/01/2024"})
+
+    dummy_main = type("Dummy", (), {})()
+    _set_today(monkeypatch, 2024, 1, 5)
+    registro_pac.Main._rollover_an(dummy_main, "05/01/2024")
+    # segunda-feira: sábado e domingo são preenchidos na mesma chamada
+    _set_today(monkeypatch, 2024, 1, 8)
+    registro_pac.Main._rollover_an(dummy_main, "08/01/2024")
+
+    with sqlite3.connect(temp_db) as c:
+        rows = c.execute(
+            "SELECT date, demands, enter_inf FROM records WHERE date <> '05/01/2024' ORDER BY id"
+        ).fetchall()
+        assert rows == [
+            ("06/01/2024", "AN, M", "09:00"),
+            ("07/01/2024", "AN, M", "09:00"),
+            ("08/01/2024", "AN, M", "09:00"),
+        ]
+        assert [d for (d,) in c.execute("SELECT date_iso FROM rollover_log ORDER BY 1")] == [
+            "2024-01-05", "2024-01-06", "2024-01-07", "2024-01-08",
+        ]
+        c.execute("DELETE FROM records WHERE date='08/01/2024'")
+        c.commit()
+
+    # já registrado no ledger: não roda de novo
+    registro_pac.Main._rollover_an(dummy_main, "08/01/2024")
+    with sqlite3.connect(temp_db) as c:
+        assert c.execute(
+            "SELECT COUNT(*) FROM records WHERE date='08/01/2024'"
+        ).fetchone()[0] == 0
+
+
+def test_rollover_an_bridges_long_gaps_and_skips_past_dates(monkeypatch, temp_db):
+    base = {
+        "reference_prof": "Prof", "enter_sys": "08:00", "enter_inf": "08:00",
+        "left_sys": None, "left_inf": None, "observations": "", "encaminhamento": None,
+        "desjejum": 0, "lunch": 0, "snack": 0, "dinner": 0,
+        "start_time": None, "end_time": None, "archived_ai": 0,
+    }
+    registro_pac.add_record({**base, "patient_name": "Paciente",
+                             "demands": "AN", "date": "01/01/2024"})
+    dummy_main = type("Dummy", (), {})()
+    _set_today(monkeypatch, 2024, 1, 1)
+    registro_pac.Main._rollover_an(dummy_main, "01/01/2024")
+
+    # consultar um dia passado não grava nada
+    _set_today(monkeypatch, 2024, 2, 1)
+    assert registro_pac.Main._rollover_an(dummy_main, "10/01/2024") is False
+
+    # um mês sem abrir: só os últimos ROLLOVER_MAX_GAP dias, mas a corrente
+    # parte de 01/01 (último dia com registros) e chega até hoje
+    assert registro_pac.Main._rollover_an(dummy_main, "01/02/2024") is True
+    with sqlite3.connect(temp_db) as c:
+        days = [d for (d,) in c.execute(
+            "SELECT date_iso FROM records WHERE date_iso > '2024-01-01' ORDER BY 1")]
+    assert days[0] == "2024-01-19" and days[-1] == "2024-02-01"
+    assert len(days) == registro_pac.ROLLOVER_MAX_GAP
+
+
+def test_day_cache_serves_revisits_without_sql(monkeypatch, temp_db, sample_record, qapp,
+                                              tmp_path):
+    monkeypatch.setattr(infra, "CONFIG_FILE", tmp_path / "settings.json")
+    main = registro_pac.Main()
+    main.queries.wait()
+    main.date.setDate(registro_pac.QDate(2024, 1, 1))
+    main.queries.wait()
+    first = main._data
+    registro_pac.day_cache.totals()
+    main.date.setDate(registro_pac.QDate(2024, 1, 2))
+    main.queries.wait()
+
+    seen = []
+    conn = infra.connection()
+    conn.set_trace_callback(seen.append)
+    try:
+        main.date.setDate(registro_pac.QDate(2024, 1, 1))   # volta: sem executor
+        registro_pac.day_cache.totals()
+    finally:
+        conn.set_trace_callback(None)
+    assert main._data is first and not main.queries.pending()
+    assert [s for s in seen if s != "PRAGMA data_version"] == []
+
+    # escrita no dia → só ele sai do cache
+    registro_pac.day_cache.put("2023-12-31", {})
+    registro_pac.update_meals(sample_record, 1, 0, 0, 0)
+    assert "2024-01-01" not in registro_pac.day_cache
+    assert "2023-12-31" in registro_pac.day_cache
+    main.refresh()
+    main.queries.wait()
+    assert main._data["day"]["desj"] == 1
+    assert registro_pac.day_cache.totals()["desj"] == 1
+
+
+def test_day_cache_is_invalidated_only_after_commit(temp_db, sample_record):
+    cache = registro_pac.day_cache
+    cache.put("2024-01-01", {})
+    with pytest.raises(RuntimeError), infra.transaction():
+        registro_pac.update_meals(sample_record, 1, 0, 0, 0)
+        raise RuntimeError
+    assert "2024-01-01" in cache                 # ROLLBACK: nada mudou
+
+    ran = []
+    with infra.transaction():
+        registro_pac.update_meals(sample_record, 1, 0, 0, 0)
+        assert "2024-01-01" in cache             # ainda não commitou
+        with pytest.raises(RuntimeError), infra.transaction():     # SAVEPOINT desfeito
+            infra.on_commit(lambda: ran.append("savepoint"))
+            raise RuntimeError
+        infra.on_commit(lambda: ran.append("commit"))
+    assert "2024-01-01" not in cache
+    assert ran == ["commit"]
+
+    infra.on_commit(lambda: ran.append("now"))   # sem transação: na hora
+    assert ran == ["commit", "now"]
+
+
+def test_idle_maintenance_runs_on_the_executor(monkeypatch, temp_db, qapp, tmp_path, caplog):
+    monkeypatch.setattr(infra, "CONFIG_FILE", tmp_path / "settings.json")
+    main = registro_pac.Main()
+    main.queries.wait()
+    runs = []
+    monkeypatch.setattr(registro_pac, "run_maintenance",
+                        lambda cfg, analyze: runs.append((threading.get_ident(), analyze)) or {})
+    main._last_input -= main._maint_cfg["idle_sec"] + 1      # ninguém usando
+
+    main._idle_maintenance()
+    assert main.queries.pending("maintenance")
+    main.queries.wait()
+    assert [a for _, a in runs] == [True] and runs[0][0] != threading.get_ident()
+    assert main._last_analyze is not None
+
+    def locked(cfg, analyze):
+        raise sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr(registro_pac, "run_maintenance", locked)
+    main._idle_maintenance()
+    main.queries.wait()
+    assert "database is locked" in caplog.text
+
+
+def test_refresh_drops_stale_day_loads(monkeypatch, temp_db, sample_record, qapp, tmp_path):
+    monkeypatch.setattr(infra, "CONFIG_FILE", tmp_path / "settings.json")
+    main = registro_pac.Main()
+    main.queries.wait()
+    shown = []
+    monkeypatch.setattr(main, "_show_day", lambda data: shown.append(data["rows"]))
+
+    main.date.setDate(registro_pac.QDate(2024, 1, 1))
+    main.date.setDate(registro_pac.QDate(2023, 12, 31))     # muda de novo antes de ler
+    assert main.queries.pending("day") and main.lbl_loading.isVisibleTo(main)
+    main.queries.wait()
+    assert shown == [[]]                                    # só o último dia chega
+    assert main._view == "31/12/2023"
+    assert not main.lbl_loading.isVisibleTo(main)
+
+
+def test_day_cache_totals_do_not_outlive_concurrent_invalidation(monkeypatch):
+    cache = registro_pac.DayCache()
+    calls = []
+
+    def metrics():
+        # outra thread escreve enquanto o consolidado é calculado
+        writer = threading.Thread(target=cache.invalidate, args=([],))
+        writer.start()
+        writer.join(0.2)
+        calls.append(writer)
+        return {"n": len(calls)}
+
+    monkeypatch.setattr(registro_pac, "consolidated_metrics", metrics)
+    assert cache.totals() == {"n": 1}
+    calls[0].join()
+    assert cache.totals() == {"n": 2}       # recalculado depois da invalidação
+    assert len(cache) == 0
+
+
+def test_day_cache_evicts_least_recently_used():
+    cache = registro_pac.DayCache(maxsize=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)
+    assert "a" in cache and "c" in cache and "b" not in cache
+
+
+def _day_data(date):
+    dummy_main = registro_pac.Main.__new__(registro_pac.Main)
+    return dummy_main._build_day(registro_pac.day_rows(date), set())
+
+
+def test_dashboard_ignores_left_records(temp_db):
     registro_pac.add_record(
         {
             "patient_name": "Um",
@@ -597,17 +1393,17 @@ def test_counts_ignores_left_records(temp_db):
         }
     )
 
-    assert registro_pac.counts("2024-02-02") == {
+    assert registro_pac.Main._dashboard(_day_data("2024-02-02")) == {
         "desj": 1,
         "lunch": 1,
         "snack": 0,
         "dinner": 1,
-        "total de Pacientes": 1,
+        "total": 1,
         "acolh": 1,
     }
 
 
-def test_counts_ignores_archived_ai(temp_db):
+def test_dashboard_ignores_archived_ai(temp_db):
     registro_pac.add_record(
         {
             "patient_name": "Ativo",
@@ -651,11 +1447,111 @@ def test_counts_ignores_archived_ai(temp_db):
         }
     )
 
-    assert registro_pac.counts("2024-03-03") == {
+    assert registro_pac.Main._dashboard(_day_data("2024-03-03")) == {
         "desj": 1,
         "lunch": 0,
         "snack": 0,
         "dinner": 0,
-        "total de Pacientes": 1,
+        "total": 1,
         "acolh": 0,
     }
+
+
+def test_day_rows_sort_and_filter_match_sql_order(temp_db):
+    base = {
+        "reference_prof": "Prof",
+        "date": "06/03/2024",
+        "enter_sys": "08:00",
+        "enter_inf": "08:00",
+        "left_sys": None,
+        "left_inf": None,
+        "observations": "",
+        "encaminhamento": None,
+        "desjejum": 0,
+        "lunch": 0,
+        "snack": 0,
+        "dinner": 0,
+        "start_time": None,
+        "end_time": None,
+        "archived_ai": 0,
+    }
+    for name, demands in [("bia", "AN Entrou"), ("Ana", "A"), ("Élio", "AN Saiu"), ("caio", "C")]:
+        registro_pac.add_record({**base, "patient_name": name, "demands": demands})
+
+    rows = registro_pac.day_rows("06/03/2024")
+    keys = {r[0]: registro_pac.parse_demands(r[2]) for r in rows}
+
+    by_name = registro_pac.sort_day_rows(rows, "", 1)
+    with sqlite3.connect(temp_db) as c:
+        expected = [
+            n for (n,) in c.execute(
+                "SELECT patient_name FROM records ORDER BY patient_name COLLATE NOCASE"
+            )
+        ]
+    assert [r[1] for r in by_name] == expected
+
+    assert [r[1] for r in rows if registro_pac.demand_matches(keys[r[0]], "AN")] == [
+        "bia",
+        "Élio",
+    ]
+    assert [
+        r[1] for r in rows if registro_pac.demand_matches(keys[r[0]], "AN Entrou")
+    ] == ["bia"]
+
+    # filtro da tela (proxies): mesmas regras, sem nenhuma consulta
+    conn = infra.connection()
+    seen = []
+    conn.set_trace_callback(seen.append)
+    try:
+        accept = registro_pac.day_row_filter("AN", "")
+        assert [r.patient_name for r in rows if accept(r)] == ["bia", "Élio"]
+        accept = registro_pac.day_row_filter("", "eli")          # sem acento/caixa
+        assert [r.patient_name for r in rows if accept(r)] == ["Élio"]
+        accept = registro_pac.day_row_filter("AN", "prof")
+        assert [r.patient_name for r in rows if accept(r)] == ["bia", "Élio"]
+        assert registro_pac.day_row_filter("", "  ") is None
+    finally:
+        conn.set_trace_callback(None)
+    assert seen == []
+
+
+def test_day_queries_use_partial_indexes(temp_db, sample_record):
+    conn = infra.connection()
+    seen = []
+    conn.set_trace_callback(seen.append)
+    try:
+        registro_pac.Main.fetch(type("Dummy", (), {})(), "01/01/2024", "AND left_sys IS NULL")
+        for col in infra.MEAL_COLS:
+            registro_pac.meal_rows("01/01/2024", col)
+        registro_pac.Main._fetch_acolh(None, "01/01/2024")
+    finally:
+        conn.set_trace_callback(None)
+
+    plans = {}
+    for sql in seen:
+        if sql.lstrip().upper().startswith("SELECT"):
+            plans[sql] = " | ".join(r[3] for r in conn.execute("EXPLAIN QUERY PLAN " + sql))
+
+    expected = ["idx_records_active_day"]
+    expected += [f"idx_records_{short}_day" for short in infra.MEAL_COLS.values()]
+    expected += ["idx_records_acolh_day"]
+    assert len(plans) == len(expected)
+    for (sql, plan), index in zip(plans.items(), expected):
+        assert index in plan, (sql, plan)
+        assert "SCAN records" not in plan, (sql, plan)
+        assert "TEMP B-TREE" not in plan, (sql, plan)
+
+
+def test_record_cursor_rows_are_slotted_and_tuple_compatible(temp_db, sample_record):
+    rows = registro_pac.day_rows("01/01/2024")
+    row = rows[0]
+
+    assert row.patient_name == "Paciente" and row[1] == row.patient_name
+    assert row._fields == registro_pac.DAY_COLS
+    assert tuple(row) == tuple(getattr(row, f) for f in registro_pac.DAY_COLS)
+    assert not hasattr(row, "__dict__")
+    # mesma projeção → mesma classe (nada de type() por linha)
+    assert type(registro_pac.day_rows("01/01/2024")[0]) is type(row)
+    assert registro_pac.TAB_ROW(row) == tuple(row)[:8]
+    # slots: o mesmo custo por linha de uma tupla, sem dict por instância
+    assert sys.getsizeof(row) <= sys.getsizeof(tuple(row)) + 16
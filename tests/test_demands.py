@@ -0,0 +1,102 @@
+"""
+Parser de demandas (demands.py).
+
+O micro-benchmark mede o custo por linha nos caminhos do refresh()
+(tokens + chaves do combo) e das métricas do dia, com o cache frio e
+quente. Rode com
+    pytest --run-slow --log-cli-level=INFO tests/test_demands.py -k benchmark
+para ver os números.
+"""
+import logging
+import random
+import sys
+import time
+
+import pytest
+
+from demands import (
+    Demand,
+    demand_keys,
+    demand_matches,
+    parse_demands,
+)
+
+
+def test_parse_demands_splits_code_variant_and_interval():
+    assert parse_demands("AN Entrou, C (10:00-12:30),, AI") == (
+        Demand("AN Entrou", "AN", "Entrou", None, None),
+        Demand("C (10:00-12:30)", "C", None, "10:00", "12:30"),
+        Demand("AI", "AI", None, None, None),
+    )
+    assert parse_demands(None) == parse_demands("") == ()
+
+
+def test_parse_demands_is_memoized_and_interned():
+    first = parse_demands("RM, AN Saiu")
+    again = parse_demands("RM, AN Saiu")
+    assert again is first
+    assert first[1].variant is sys.intern("Saiu")
+    assert parse_demands.cache_info().maxsize is not None     # cache limitado
+
+
+def test_keys_and_matching_follow_filter_rules():
+    tokens = parse_demands("AN Entrou, C (09:00-10:00), AN Entrou")
+    assert demand_keys("AN Entrou, C (09:00-10:00), AN Entrou") == ("AN Entrou", "C")
+    assert demand_matches(tokens, "AN")
+    assert demand_matches(tokens, "AN Entrou")
+    assert not demand_matches(tokens, "AN Saiu")
+    assert demand_matches(tokens, "C")
+    assert not demand_matches(parse_demands("RM"), "R")
+
+
+# ------------------------------------------------------------
+#  Micro-benchmark: custo por linha (refresh / métricas)
+# ------------------------------------------------------------
+ROWS = 20000
+
+
+def _day_strings():
+    rnd = random.Random(5)
+    pool = ["A", "R", "M", "C", "RM", "AN", "AN Entrou", "AN Saiu", "AI", "REA",
+            "Grupos/Eventos", "Outros", "C (10:00-12:30)", "C (13:00-17:00)"]
+    return [", ".join(rnd.sample(pool, rnd.randint(1, 3))) for _ in range(ROWS)]
+
+
+def _refresh_path(strings):
+    tokens = [parse_demands(s) for s in strings]
+    return {t.key for toks in tokens for t in toks}
+
+
+def _metrics_path(strings):
+    counts = {}
+    for s in strings:
+        for code in {t.code for t in parse_demands(s) if t.key != "AN Saiu"}:
+            counts[code] = counts.get(code, 0) + 1
+    return counts
+
+
+def _per_row_us(run, strings, *, cold, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        if cold:
+            parse_demands.cache_clear()
+        t0 = time.perf_counter()
+        run(strings)
+        best = min(best, time.perf_counter() - t0)
+    return best / len(strings) * 1e6
+
+
+@pytest.mark.slow
+def test_benchmark_parser_per_row_cost():
+    strings = _day_strings()
+    results = {}
+    for name, run in (("refresh", _refresh_path), ("métricas", _metrics_path)):
+        results[name] = (_per_row_us(run, strings, cold=True),
+                         _per_row_us(run, strings, cold=False))
+
+    log = logging.getLogger(__name__)
+    for name, (cold, warm) in results.items():
+        log.info("%s: frio %.2f µs/linha, quente %.2f µs/linha", name, cold, warm)
+
+    info = parse_demands.cache_info()
+    assert info.hits > info.misses        # poucas strings distintas, muitas linhas
@@ -0,0 +1,87 @@
+"""
+QueryExecutor (ui/executor.py): consultas fora da thread da tela.
+"""
+import sqlite3
+import threading
+
+import pytest
+
+pytest.importorskip("PyQt5")
+
+import infra
+from ui.executor import QueryExecutor
+
+
+@pytest.fixture
+def temp_db(monkeypatch, tmp_path):
+    monkeypatch.setattr(infra, "DB_PATH", tmp_path / "patients.db")
+    infra.init_db()
+    yield
+    infra.close_connections()
+
+
+def test_results_come_back_on_the_gui_thread(qapp, temp_db):
+    ex = QueryExecutor()
+    got, busy = [], []
+    ex.busy.connect(busy.append)
+
+    def query():
+        got.append(threading.current_thread() is threading.main_thread())
+        c = infra.connection()
+        return c.execute("SELECT COUNT(*) FROM records").fetchone()[0]
+
+    ex.submit("day", query, on_result=lambda n: got.append(
+        (n, threading.current_thread() is threading.main_thread())))
+    assert ex.pending("day")
+    ex.wait()
+    assert got == [False, (0, True)]
+    assert busy == [True, False] and not ex.pending()
+
+
+def test_newer_submit_drops_the_older_result(qapp, temp_db):
+    ex = QueryExecutor(max_threads=1)
+    gate = threading.Event()
+    got = []
+    ex.submit("day", gate.wait, 5, on_result=lambda _: got.append("bloqueado"))
+    ex.submit("day", lambda: "velho", on_result=got.append)   # ainda na fila
+    ex.submit("day", lambda: "novo", on_result=got.append)
+    ex.submit("search", lambda: "busca", on_result=got.append)
+    gate.set()
+    ex.wait()
+    assert got == ["novo", "busca"]
+
+
+def test_cancel_interrupts_running_sql_and_errors_are_reported(qapp, temp_db):
+    ex = QueryExecutor()
+    started = threading.Event()
+    got, errors = [], []
+
+    def slow():
+        c = infra.connection()
+        c.create_function("wait_started", 0, lambda: started.set() or 0)
+        return c.execute("""
+            WITH RECURSIVE n(i) AS (SELECT wait_started() UNION ALL SELECT i + 1 FROM n)
+            SELECT COUNT(*) FROM n
+        """).fetchone()
+
+    ex.submit("day", slow, on_result=got.append, on_error=errors.append)
+    assert started.wait(5)
+    ex.cancel("day")
+    assert ex.wait(5000) and got == errors == []
+
+    ex.submit("day", infra.connection().execute, "SELECT * FROM tabela_nao_existe",
+              on_result=got.append, on_error=errors.append)
+    ex.wait()
+    assert got == [] and isinstance(errors[0], sqlite3.OperationalError)
+
+
+def test_pool_threads_keep_their_connection(qapp, temp_db):
+    ex = QueryExecutor(max_threads=1)
+    conns = []
+    for _ in range(3):          # sem wait(): no Qt 5 ele encerra as threads do pool
+        ex.submit("day", infra.connection, on_result=conns.append)
+        while ex.pending():
+            qapp.processEvents()
+    ex.wait()
+    assert len(conns) == 3 and conns[0] is conns[1] is conns[2]
+    assert conns[0] is not infra.connection()
@@ -0,0 +1,251 @@
+"""
+Regressão de planos de consulta.
+
+HOT_QUERIES nomeia cada caminho quente do app e como exercitá-lo. O teste
+roda todos contra um banco semeado com anos de histórico, captura o SQL
+realmente executado (inclusive o montado em f-string: fetch(extra=…),
+_query_by_filters, UPDATE do importador) e passa cada comando por
+EXPLAIN QUERY PLAN. Qualquer SCAN em records / meal_log / demand_log
+reprova, com nome, SQL e plano na mensagem. O banco é pequeno (o plano
+não depende de milhares de linhas) e semeado uma vez por módulo, então
+roda na rodada padrão.
+"""
+import random
+import re
+
+import pytest
+
+import infra
+
+pytest.importorskip("PyQt5")
+
+try:
+    import registro_pac
+except Exception as exc:  # pragma: no cover - environment guard
+    pytest.skip(f"registro_pac import failed: {exc}", allow_module_level=True)
+
+HOT_TABLES = ("records", "meal_log", "demand_log")
+
+DAYS = 120                     # alguns meses: a busca de março é uma fração
+PER_DAY = 12
+DAY = "15/03/2024"             # dia no meio do histórico semeado
+NEXT_DAY = "16/03/2024"
+
+
+class _Combo:
+    """Substitui QComboBox nos métodos que só leem a seleção."""
+
+    def __init__(self, data="", index=0):
+        self._data, self._index = data, index
+
+    def currentData(self):
+        return self._data
+
+    def currentIndex(self):
+        return self._index
+
+
+def _main(dmd="", order=0):
+    main = registro_pac.Main.__new__(registro_pac.Main)
+    main.cmb_dmd_filter = _Combo(dmd)
+    main.cmb_order = _Combo(index=order)
+    return main
+
+
+def _filters(**kw):
+    base = {"d_ini": "01/03/2024", "d_end": "31/03/2024", "adv": False, "name": "",
+            "prof": "", "obs": "", "dmd": "", "enc": None,
+            "b": False, "l": False, "s": False, "d": False, "active_only": False}
+    return {**base, **kw}
+
+
+def _first_active_id():
+    # sem `with`: o context manager da conexão faria COMMIT da transação aberta
+    return infra.connection().execute(
+        "SELECT id FROM records WHERE date_iso=? AND left_sys IS NULL AND archived_ai=0",
+        (infra.to_iso_date(DAY),),
+    ).fetchone()[0]
+
+
+def _get_or_create():
+    with infra.transaction() as c:
+        registro_pac.Main._get_or_create(None, "Ana Souza", DAY, c.cursor())
+
+
+def _import_update():
+    with infra.transaction() as c:
+        registro_pac.update_record_fields(
+            c, _first_active_id(), {"lunch": 1, "enter_inf": "09:00", "enter_sys": "09:00"}
+        )
+
+
+def _rollover():
+    # o rollover só roda para hoje: NEXT_DAY faz o papel de hoje
+    today = registro_pac.QDate.fromString(NEXT_DAY, "dd/MM/yyyy")
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(registro_pac.QDate, "currentDate", staticmethod(lambda: today))
+        registro_pac.Main._rollover_an(None, NEXT_DAY)
+
+
+def _demand_filter_combo():
+    from PyQt5.QtCore import QDate
+    from PyQt5.QtWidgets import QComboBox, QDateEdit
+
+    main = registro_pac.Main.__new__(registro_pac.Main)
+    main.cmb_dmd_filter = QComboBox()
+    main.date = QDateEdit()
+    main.date.setDate(QDate.fromString(DAY, "dd/MM/yyyy"))
+    registro_pac.Main._update_demand_filter_combo(main)
+
+
+# nome → como exercitar o caminho real do app
+HOT_QUERIES = {
+    # abas do dia / refresh()
+    "day_rows": lambda: registro_pac.day_rows(DAY),
+    "edited_ids": lambda: registro_pac.edited_ids(range(1, 3000)),
+    "has_edit_log": lambda: registro_pac.has_edit_log(1),
+    "consolidado": registro_pac.consolidated_metrics,
+    "rollover": _rollover,
+    "filtro_demandas_dia": _demand_filter_combo,
+    # consultas por predicado do dia
+    "meal_rows": lambda: [registro_pac.meal_rows(DAY, col) for col in infra.MEAL_COLS],
+    "fetch_acolh": lambda: registro_pac.Main._fetch_acolh(None, DAY),
+    "fetch_ativos": lambda: _main().fetch(DAY, "AND left_sys IS NULL"),
+    "fetch_demanda_c": lambda: _main("C").fetch(DAY, "AND left_sys IS NULL"),
+    "fetch_an_entrou_nome": lambda: _main("AN Entrou", 1).fetch(DAY),
+    # pesquisa
+    "busca_simples": lambda: _main()._query_by_filters(_filters(name="ana")),
+    "busca_fts": lambda: _main()._query_by_filters(
+        _filters(adv=True, name="jo sil", prof="mar")),
+    "busca_observacoes": lambda: _main()._query_by_filters(_filters(obs="document")),
+    "busca_filtros": lambda: _main()._query_by_filters(
+        _filters(dmd="AN Entrou", enc="CAPS", l=True, active_only=True)),
+    "combos_busca": lambda: registro_pac.SearchDialog(),
+    "historico_paciente": lambda: registro_pac.patient_history("Ana Souza"),
+    # escrita
+    "get_or_create": _get_or_create,
+    "importacao_update": _import_update,
+    "update_meals": lambda: registro_pac.update_meals(_first_active_id(), 1, 0, 1, 0),
+    "update_demands": lambda: registro_pac.update_demands(_first_active_id(), "A, M"),
+}
+
+
+def _seed(c):
+    rnd = random.Random(7)
+    first = ["Ana", "José", "João", "Maria", "Joana", "Pedro", "Luíza", "Carlos"]
+    last = ["Souza", "Silva", "Lima", "Conceição", "Pereira", "Alves"]
+    demands = ["A", "R", "M", "C", "RM", "AN", "AN Entrou", "AN Saiu",
+               "AI", "REA", "Grupos/Eventos", "Outros", "C (10:00-12:30)"]
+    start = registro_pac.QDate.fromString(DAY, "dd/MM/yyyy").addDays(-DAYS // 2)
+    rows = []
+    for day in range(DAYS):
+        date = start.addDays(day).toString("dd/MM/yyyy")
+        for _ in range(PER_DAY):
+            left = rnd.random() < 0.4
+            rows.append((
+                f"{rnd.choice(first)} {rnd.choice(last)}",
+                ", ".join(rnd.sample(demands, rnd.randint(1, 3))),
+                rnd.choice(["Maria", "Conceição", "Pedro"]), date,
+                "08:00", "08:00",
+                "10:00" if left else None, "10:00" if left else None,
+                rnd.choice(["", "", "trouxe documentos"]),
+                rnd.choice([None, None, "CAPS", "UBS"]),
+                rnd.randint(0, 1), rnd.randint(0, 1), rnd.randint(0, 1), rnd.randint(0, 1),
+                None, None, int(rnd.random() < 0.05),
+            ))
+    c.executemany(
+        f"INSERT INTO records ({', '.join(registro_pac.EXPECTED_COLS)}) "
+        f"VALUES ({', '.join('?' * len(registro_pac.EXPECTED_COLS))})",
+        rows,
+    )
+    for rid, name, dmd in c.execute(
+        "SELECT id, patient_name, demands FROM records"
+    ).fetchall():
+        infra.sync_demands(c, rid, dmd)
+        c.execute("UPDATE records SET patient_id=? WHERE id=?",
+                  (infra.patient_id_for(c, name), rid))
+    c.executemany(
+        "INSERT INTO meal_log (record_id, ts, old_b, new_b) VALUES (?, '', 0, 1)",
+        [(rid,) for rid in range(1, len(rows), 9)],
+    )
+    c.executemany(
+        "INSERT INTO demand_log (record_id, ts, old_demands, new_demands) "
+        "VALUES (?, '', 'A', 'M')",
+        [(rid,) for rid in range(1, len(rows), 13)],
+    )
+    infra.rebuild_daily_metrics(c)
+    c.execute("INSERT INTO rollover_log (date_iso) VALUES ('2024-03-15')")
+
+
+@pytest.fixture(scope="module", params=[False, True], ids=["sem-analyze", "com-analyze"])
+def big_db(request, tmp_path_factory, qapp):
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(
+            registro_pac.QTime,
+            "currentTime",
+            staticmethod(lambda: registro_pac.QTime.fromString("09:00", "HH:mm")),
+        )
+        mp.setattr(infra, "DB_PATH", tmp_path_factory.mktemp("plans") / "patients.db")
+        registro_pac.init_db()
+        with infra.transaction() as c:
+            _seed(c)
+            if request.param:          # estatísticas como no banco em produção
+                c.execute("ANALYZE")
+        yield
+        infra.close_connections()
+
+
+def _hot_names(sql):
+    """Tabelas quentes citadas no comando + seus apelidos (records r …)."""
+    names = set()
+    for table in HOT_TABLES:
+        if re.search(rf"\b{table}\b", sql):
+            names.add(table)
+            for alias in re.findall(rf"\b{table}\s+(?:AS\s+)?(\w+)", sql, re.IGNORECASE):
+                if alias.upper() not in {"WHERE", "JOIN", "ON", "SET", "VALUES",
+                                         "ORDER", "GROUP", "LEFT", "INNER", "WITH"}:
+                    names.add(alias)
+    return names
+
+
+def _explain(conn, sql):
+    return [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql)]
+
+
+def test_hot_queries_never_scan_hot_tables(big_db):
+    conn = infra.connection()
+    failures, checked = [], 0
+
+    for name, run in HOT_QUERIES.items():
+        seen = []
+        conn.set_trace_callback(seen.append)
+        try:
+            run()
+        finally:
+            conn.set_trace_callback(None)
+
+        statements = [
+            sql for sql in seen
+            if re.match(r"\s*(SELECT|WITH|INSERT|UPDATE|DELETE)\b", sql, re.IGNORECASE)
+        ]
+        assert statements, f"{name}: nenhum SQL capturado"
+
+        for sql in statements:
+            checked += 1
+            plan = _explain(conn, sql)
+            bad = _hot_names(sql)
+            scans = [step for step in plan
+                     if re.match(r"SCAN (\w+)", step)
+                     and re.match(r"SCAN (\w+)", step).group(1) in bad]
+            if scans:
+                failures.append(f"{name}: {' '.join(sql.split())}\n    " + "\n    ".join(plan))
+
+    assert checked >= len(HOT_QUERIES)
+    assert not failures, "consultas quentes varrendo tabela:\n" + "\n".join(failures)
+
+
+def test_harness_detects_a_full_scan(big_db):
+    # salvaguarda do próprio harness: LIKE '%x%' tem de ser pego
+    sql = "SELECT id FROM records WHERE patient_name LIKE '%ana%'"
+    plan = _explain(infra.connection(), sql)
+    assert any(step.startswith("SCAN records") for step in plan)
@@ -0,0 +1,217 @@
+"""
+Perfil de desempenho do SQLite (settings.json → "sqlite").
+
+O benchmark compara os presets com os padrões do SQLite nos dois caminhos
+que a recepção sente: refresh() do dia e a pesquisa. Rode com
+    pytest --run-slow --log-cli-level=INFO tests/test_sqlite_profile.py -k benchmark
+para ver as latências.
+"""
+import json
+import logging
+import random
+import statistics
+import time
+
+import pytest
+
+import infra
+
+pytest.importorskip("PyQt5")
+
+try:
+    import registro_pac
+except Exception as exc:  # pragma: no cover - environment guard
+    pytest.skip(f"registro_pac import failed: {exc}", allow_module_level=True)
+
+
+# o que o SQLite usa quando ninguém mexe (comportamento antigo do get_conn)
+SQLITE_DEFAULTS = {
+    "profile": "padrão", "cache_size": -2000, "mmap_size": 0,
+    "synchronous": "FULL", "temp_store": "DEFAULT", "page_size": 4096,
+}
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.setattr(infra, "DB_PATH", tmp_path / "patients.db")
+    monkeypatch.setattr(infra, "CONFIG_FILE", tmp_path / "settings.json")
+    yield tmp_path
+    infra.close_connections()
+
+
+def test_default_profile_is_applied_to_new_database(db):
+    registro_pac.init_db()
+    diag = infra.sqlite_diagnostics()
+    preset = infra.SQLITE_PROFILES[infra.DEFAULT_SQLITE_PROFILE]
+
+    assert diag["profile"] == infra.DEFAULT_SQLITE_PROFILE
+    assert diag["journal_mode"] == "wal"
+    assert diag["synchronous"] == "NORMAL"
+    assert diag["temp_store"] == "MEMORY"
+    assert diag["cache_size"] == preset["cache_size"]
+    assert diag["page_size"] == preset["page_size"]
+
+
+def test_settings_choose_preset_and_override_keys(db):
+    (db / "settings.json").write_text(
+        json.dumps({"sqlite": {"profile": "ssd", "cache_size": -4096, "typo": 1}}),
+        encoding="utf-8",
+    )
+    registro_pac.init_db()
+    diag = infra.sqlite_diagnostics()
+
+    assert infra.sqlite_profile()["profile"] == "ssd"
+    assert "typo" not in infra.sqlite_profile()
+    assert diag["cache_size"] == -4096
+    assert diag["page_size"] == infra.SQLITE_PROFILES["ssd"]["page_size"]
+
+
+def test_invalid_overrides_fall_back_to_preset(db, caplog):
+    (db / "settings.json").write_text(json.dumps({"sqlite": {
+        "cache_size": "muito", "mmap_size": -1, "page_size": 3000,
+        "temp_store": "MEMORY x", "synchronous": "FAST",
+    }}), encoding="utf-8")
+    preset = infra.SQLITE_PROFILES[infra.DEFAULT_SQLITE_PROFILE]
+
+    assert infra.sqlite_profile() == {"profile": infra.DEFAULT_SQLITE_PROFILE, **preset}
+    assert caplog.text.count("inválido") == 5
+    registro_pac.init_db()                                  # o app ainda abre
+    assert infra.sqlite_diagnostics()["temp_store"] == preset["temp_store"]
+
+    (db / "settings.json").write_text(json.dumps({"sqlite": {
+        "cache_size": "-2048", "synchronous": "full", "temp_store": " file ",
+    }}), encoding="utf-8")
+    prof = infra.sqlite_profile()
+    assert (prof["cache_size"], prof["synchronous"], prof["temp_store"]) == (-2048, "FULL", "FILE")
+
+
+def test_page_size_is_kept_on_existing_database(db):
+    registro_pac.init_db()
+    infra.close_connections()
+    (db / "settings.json").write_text(
+        json.dumps({"sqlite": {"page_size": 16384}}), encoding="utf-8"
+    )
+    # só muda com VACUUM; abrir com outro perfil não pode corromper nada
+    assert infra.sqlite_diagnostics()["page_size"] == infra.SQLITE_PROFILES[
+        infra.DEFAULT_SQLITE_PROFILE]["page_size"]
+
+
+def test_diagnostics_dialog_lists_effective_values(db, qapp):
+    from ui.dialogs import DIAG_LABELS, DiagnosticsDialog
+    from ui.executor import QueryExecutor
+
+    registro_pac.init_db()
+    dlg = DiagnosticsDialog(QueryExecutor())
+    assert set(DIAG_LABELS) <= set(dlg.values)
+
+
+def test_diagnostics_conversion_uses_the_shared_executor(db, qapp, monkeypatch):
+    import sqlite3
+
+    from PyQt5.QtCore import Qt
+    from PyQt5.QtWidgets import QMessageBox
+
+    from ui.dialogs import DiagnosticsDialog
+    from ui.executor import QueryExecutor
+
+    with sqlite3.connect(db / "patients.db") as old:      # banco de antes do auto_vacuum
+        old.execute("CREATE TABLE legado (x)")
+    registro_pac.init_db()
+    monkeypatch.setattr(QMessageBox, "question", lambda *a: QMessageBox.Yes)
+    queries = QueryExecutor()
+    dlg = DiagnosticsDialog(queries)
+    assert dlg.testAttribute(Qt.WA_DeleteOnClose)
+    assert dlg.findChildren(QueryExecutor) == []          # nenhum pool próprio
+    dlg.show()
+    assert dlg.btn_vacuum.isVisible()
+
+    dlg._convert()
+    assert queries.pending("vacuum")
+    dlg.reject()                                          # não fecha no meio
+    assert dlg.isVisible()
+    queries.wait()
+    assert dlg.values["auto_vacuum"] == 2 and not dlg.btn_vacuum.isVisible()
+    dlg.reject()
+    assert not dlg.isVisible()
+
+
+# ------------------------------------------------------------
+#  Benchmark: refresh e pesquisa com cada perfil
+# ------------------------------------------------------------
+DAYS, PER_DAY, REPS = 200, 30, 7
+DAY = "15/03/2023"
+
+
+def _seed(c):
+    rnd = random.Random(3)
+    names = ["Ana Souza", "José Silva", "Maria Lima", "João Alves", "Luíza Pereira"]
+    start = registro_pac.QDate(2023, 1, 1)
+    rows = []
+    for day in range(DAYS):
+        date = start.addDays(day).toString("dd/MM/yyyy")
+        for _ in range(PER_DAY):
+            rows.append((
+                rnd.choice(names), rnd.choice(["A", "M, C", "AN", "R"]), "Maria",
+                date, "08:00", "08:00", None, None,
+                rnd.choice(["", "trouxe documentos"]), rnd.choice([None, "CAPS"]),
+                1, 0, 1, 0, None, None, 0,
+            ))
+    c.executemany(
+        f"INSERT INTO records ({', '.join(registro_pac.EXPECTED_COLS)}) "
+        f"VALUES ({', '.join('?' * len(registro_pac.EXPECTED_COLS))})",
+        rows,
+    )
+    for rid, name, dmd in c.execute("SELECT id, patient_name, demands FROM records").fetchall():
+        infra.sync_demands(c, rid, dmd)
+        c.execute("UPDATE records SET patient_id=? WHERE id=?",
+                  (infra.patient_id_for(c, name), rid))
+    infra.rebuild_daily_metrics(c)
+
+
+def _refresh():
+    registro_pac.day_rows(DAY)
+    registro_pac.consolidated_metrics()
+
+
+def _search():
+    main = registro_pac.Main.__new__(registro_pac.Main)
+    main._query_by_filters({
+        "d_ini": "01/01/2023", "d_end": "31/12/2023", "adv": True, "name": "jo",
+        "prof": "", "obs": "document", "dmd": "", "enc": None,
+        "b": False, "l": False, "s": False, "d": False, "active_only": False,
+    })
+
+
+def _median_ms(run):
+    samples = []
+    for _ in range(REPS):
+        infra.close_connections()          # conexão nova: cache frio do SQLite
+        t0 = time.perf_counter()
+        run()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(samples)
+
+
+@pytest.mark.slow
+def test_benchmark_profiles_refresh_and_search(tmp_path, monkeypatch):
+    profiles = {"padrão": SQLITE_DEFAULTS,
+                **{name: {"profile": name, **p} for name, p in infra.SQLITE_PROFILES.items()}}
+    results = {}
+    for name, prof in profiles.items():
+        monkeypatch.setattr(infra, "DB_PATH", tmp_path / name / "patients.db")
+        monkeypatch.setattr(infra, "sqlite_profile", lambda prof=prof: prof)
+        infra.DB_PATH.parent.mkdir()
+        registro_pac.init_db()
+        t0 = time.perf_counter()
+        with infra.transaction() as c:
+            _seed(c)
+        seed_ms = (time.perf_counter() - t0) * 1000
+        results[name] = (seed_ms, _median_ms(_refresh), _median_ms(_search))
+        infra.close_connections()
+
+    log = logging.getLogger(__name__)
+    for name, (seed_ms, refresh_ms, search_ms) in results.items():
+        log.info("%s: carga %.1f ms, refresh %.2f ms, pesquisa %.2f ms",
+                 name, seed_ms, refresh_ms, search_ms)
+
+    assert set(results) == set(profiles)
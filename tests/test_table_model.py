@@ -0,0 +1,128 @@
+"""
+RowTableModel / RowTableView (abas de pacientes e resultado da busca).
+"""
+
+import pytest
+
+pytest.importorskip("PyQt5")
+
+from PyQt5.QtCore import QModelIndex, Qt
+
+from ui.models import (
+    EDITED_MARK,
+    ROW_ID_ROLE,
+    RowFilterProxy,
+    RowTableModel,
+)
+
+HEADERS = ["ID", "Paciente", "Demanda", "Prof.", "Enc.", "Clone?"]
+
+
+def _row(pid, name="P", clone=0):
+    return (pid, name, "A", "Prof", None, clone)
+
+
+def _record_signals(model):
+    seen = []
+    model.rowsInserted.connect(lambda _p, a, b: seen.append(("ins", a, b)))
+    model.rowsRemoved.connect(lambda _p, a, b: seen.append(("rem", a, b)))
+    model.dataChanged.connect(lambda tl, br, *_: seen.append(("chg", tl.row(), br.row())))
+    model.modelReset.connect(lambda: seen.append(("reset",)))
+    return seen
+
+
+def test_set_rows_emits_fine_grained_signals(qapp):
+    model = RowTableModel(HEADERS)
+    model.set_rows([_row(5), _row(4), _row(3), _row(2)])
+    seen = _record_signals(model)
+
+    model.set_rows([_row(5), _row(4, "Novo"), _row(3), _row(2)])
+    assert seen == [("chg", 1, 1)]
+
+    seen.clear()
+    model.set_rows([_row(6), _row(5), _row(4, "Novo"), _row(2)])
+    assert seen == [("rem", 0, 2), ("ins", 0, 2)]
+    assert [model.index(r, 0).data(ROW_ID_ROLE) for r in range(4)] == [6, 5, 4, 2]
+
+    seen.clear()
+    model.set_rows([_row(6), _row(5), _row(4, "Novo"), _row(2)], edited={5})
+    assert seen == [("chg", 1, 1)]
+    assert model.index(1, 1).data() == "P" + EDITED_MARK
+
+
+def test_counts_treat_missing_parent_as_root(qapp):
+    model = RowTableModel(HEADERS)
+    model.set_rows([_row(1), _row(2)])
+    assert model.rowCount() == model.rowCount(QModelIndex()) == 2
+    assert model.columnCount() == model.columnCount(QModelIndex()) == len(HEADERS)
+    assert model.rowCount(model.index(0, 0)) == 0      # tabela plana
+
+
+def test_clone_rows_are_grey_and_not_selectable(qapp):
+    model = RowTableModel(HEADERS, muted_col=5)
+    model.set_rows([_row(1), _row(2, clone=1)])
+
+    assert model.flags(model.index(0, 0)) & Qt.ItemIsSelectable
+    assert model.flags(model.index(1, 0)) == Qt.NoItemFlags
+    assert model.index(1, 0).data(Qt.ForegroundRole) is not None
+    assert model.index(0, 4).data() == ""                    # None → célula vazia
+
+
+def test_proxy_filters_and_sorts_loaded_rows(qapp):
+    model = RowTableModel(HEADERS)
+    model.set_rows([_row(3, "caio"), _row(2, "Ana"), _row(1, "bia")])
+    proxy = RowFilterProxy(model)
+
+    def shown():
+        return [proxy.index(r, 0).data(ROW_ID_ROLE) for r in range(proxy.rowCount())]
+
+    assert shown() == [3, 2, 1]                              # ordem de origem
+    proxy.set_view(sort_key=lambda r: r[1].lower())
+    assert shown() == [2, 1, 3]
+    proxy.set_view(accept=lambda r: r[0] != 2, sort_key=lambda r: r[1].lower())
+    assert shown() == [1, 3]
+
+    # linhas novas na origem entram já filtradas e no lugar certo
+    model.set_rows([_row(4, "bel"), _row(3, "caio"), _row(2, "Ana"), _row(1, "bia")])
+    assert shown() == [4, 1, 3]
+    proxy.set_view()
+    assert shown() == [4, 3, 2, 1]
+
+
+def test_proxy_stays_sorted_when_head_and_tail_change(qapp):
+    from PyQt5.QtWidgets import QTableView
+
+    model = RowTableModel(HEADERS)
+    old = [_row(i, "b") for i in range(0, 36, 2)] + [_row(37, "b")]     # 19 linhas
+    model.set_rows(old)
+    proxy = RowFilterProxy(model)
+    view = QTableView()                 # lê o proxy a cada invalidate()
+    view.setModel(proxy)
+    proxy.set_view(sort_key=lambda r: r[1])
+
+    # cabeça (0, 2) e cauda (37) mudam de chave, o miolo é trocado
+    new = ([_row(0, "a"), _row(2, "c")] + [_row(i, "b") for i in range(5, 29, 2)]
+           + [_row(i, "b") for i in range(30, 36, 2)] + [_row(37, "a")])
+    model.set_rows(new)
+    names = [proxy.index(r, 1).data() for r in range(proxy.rowCount())]
+    assert names == sorted(names)
+
+    proxy.set_view()                                         # volta à origem
+    qapp.processEvents()
+    assert [proxy.index(r, 0).data(ROW_ID_ROLE)
+            for r in range(proxy.rowCount())] == [r[0] for r in new]
+
+
+def test_view_selection_reports_ids(qapp):
+    from ui.widgets import RowTableView
+
+    model = RowTableModel(HEADERS)
+    model.set_rows([_row(9), _row(7), _row(3)])
+    proxy = RowFilterProxy(model)
+    proxy.set_view(sort_key=lambda r: r[0])
+    view = RowTableView(proxy)
+
+    assert view.select_id(7)
+    assert view.selected_ids() == [7]
+    assert view.currentIndex().row() == 1                    # linha do proxy
+    assert not view.select_id(42)
@@ -1,15 +1,28 @@
-from PyQt5.QtCore import QDate
+from functools import lru_cache
+
+from PyQt5.QtCore import QDate, Qt, QTimer
 from PyQt5.QtWidgets import (
     QCheckBox,
     QComboBox,
     QDateEdit,
     QDialog,
     QFormLayout,
+    QLabel,
     QLineEdit,
+    QMessageBox,
+    QProgressDialog,
     QPushButton,
 )
 
-from infra import get_conn
+from infra import (
+    change_stamp,
+    connection,
+    enable_incremental_vacuum,
+    sqlite_diagnostics,
+)
+
+# espera o usuário parar de mexer nas datas antes de recarregar as listas
+SEARCH_DEBOUNCE_MS = 250
 
 
 class SimpleTimeDialog(QDialog):
@@ -17,8 +30,8 @@ class SimpleTimeDialog(QDialog):
         super().__init__(parent)
         self.setWindowTitle(title)
         lay = QFormLayout(self)
-        from PyQt5.QtWidgets import QTimeEdit
         from PyQt5.QtCore import QTime
+        from PyQt5.QtWidgets import QTimeEdit
 
         self.t = QTimeEdit(displayFormat="HH:mm")
         self.t.setTime(QTime.currentTime())
@@ -69,6 +82,30 @@ class EncaminhamentoDialog(QDialog):
         return self.cmb.currentText()
 
 
+@lru_cache(maxsize=64)
+def search_options(stamp, d0: str, d1: str) -> tuple:
+    """
+    (códigos de demanda, encaminhamentos) com registros entre d0 e d1
+    (AAAA-MM-DD). Só registros que a busca encontra (clones arquivados
+    ficam de fora, como em _query_by_filters). Os códigos vêm de
+    record_demands: daily_metrics não conta "AN Saiu", e um AN só de
+    saída sumiria da lista. Encaminhamentos vêm de daily_metrics (uma
+    linha por dia/chave). `stamp` = infra.change_stamp(): qualquer escrita
+    muda a chave e a entrada antiga simplesmente deixa de ser usada.
+    """
+    c = connection()
+    codes = sorted(code for (code,) in c.execute("""
+        SELECT DISTINCT d.code
+          FROM records r JOIN record_demands d ON d.record_id = r.id
+         WHERE r.date_iso BETWEEN ? AND ? AND r.archived_ai = 0
+    """, (d0, d1)))
+    encs = sorted(key for (key,) in c.execute("""
+        SELECT DISTINCT key FROM daily_metrics
+         WHERE date_iso BETWEEN ? AND ? AND kind = 'enc'
+    """, (d0, d1)))
+    return codes, encs
+
+
 class SearchDialog(QDialog):
     """Diálogo de pesquisa avançada com listas DINÂMICAS."""
 
@@ -77,11 +114,13 @@ class SearchDialog(QDialog):
         self.setWindowTitle("Buscar registros 🔍")
         lay = QFormLayout(self)
 
-        # —— texto livre (nome / profissional) ————————————————
+        # —— texto livre (nome / profissional / observações) ——————
         self.txt_name = QLineEdit()
         self.txt_prof = QLineEdit()
         lay.addRow("Nome do paciente contém:", self.txt_name)
         lay.addRow("Profissional contém:", self.txt_prof)
+        self.txt_obs = QLineEdit()
+        lay.addRow("Observações contêm:", self.txt_obs)
 
         # —— combos vazios (serão populados mais abaixo) ————————
         self.cmb_dmd = QComboBox()
@@ -93,9 +132,11 @@ class SearchDialog(QDialog):
         self.d_ini.setDate(QDate.currentDate().addMonths(-1))
         self.d_end.setDate(QDate.currentDate())
 
-        # quando mudar qualquer data → recarrega listas
-        self.d_ini.dateChanged.connect(lambda _: self._populate_combos())
-        self.d_end.dateChanged.connect(lambda _: self._populate_combos())
+        # quando mudar qualquer data → recarrega listas (só a última mudança)
+        self._debounce = QTimer(self, singleShot=True, interval=SEARCH_DEBOUNCE_MS)
+        self._debounce.timeout.connect(self._populate_combos)
+        self.d_ini.dateChanged.connect(lambda _: self._debounce.start())
+        self.d_end.dateChanged.connect(lambda _: self._debounce.start())
 
         lay.addRow("Tipo de atendimento:", self.cmb_dmd)
         lay.addRow("Tipo de encaminhamento:", self.cmb_enc)
@@ -111,7 +152,7 @@ class SearchDialog(QDialog):
             lay.addRow(w)
 
         # —— modo avançado (tokenizar texto) ————————————————
-        self.chk_adv = QCheckBox("Busca avançada (tokenizar nome/prof.)")
+        self.chk_adv = QCheckBox("Busca avançada (início das palavras, sem acento)")
         lay.addRow(self.chk_adv)
 
         # —— filtro de usuários ativos ———————————————————————
@@ -124,64 +165,31 @@ class SearchDialog(QDialog):
         self._populate_combos()
 
     def _date_iso_range(self):
-        to_iso = lambda qdate: qdate.toString("yyyyMMdd")
+        to_iso = lambda qdate: qdate.toString("yyyy-MM-dd")
         return to_iso(self.d_ini.date()), to_iso(self.d_end.date())
 
     def _populate_combos(self):
         """Recarrega opções de demanda/encaminhamento segundo intervalo de datas."""
-        d0, d1 = self._date_iso_range()
-
-        # ----- Demanda ------------------------------------------------
-        self.cmb_dmd.blockSignals(True)
-        self.cmb_dmd.clear()
-        self.cmb_dmd.addItem("— Qualquer —", "")
-
-        seen = set()
-        with get_conn() as c:
-            for (demands,) in c.execute(
-                """
-                 SELECT DISTINCT demands FROM records
-                  WHERE (substr(date,7,4)||substr(date,4,2)||substr(date,1,2))
-                        BETWEEN ? AND ? AND demands IS NOT NULL
-                """,
-                (d0, d1),
-            ):
-                for tok in demands.split(","):
-                    tok = tok.strip()
-                    if not tok:
-                        continue
-                    code = tok.split(" ")[0]      # pega só “C”, “AN”, “AI”… (1ª palavra)
-                    seen.add(code)
-
-        for code in sorted(seen):
-            self.cmb_dmd.addItem(code, code)
-        self.cmb_dmd.blockSignals(False)
-
-        # — Encaminhamento —
-        self.cmb_enc.blockSignals(True)
-        self.cmb_enc.clear()
-        self.cmb_enc.addItem("— Qualquer —", "")
-        with get_conn() as c:
-            encs = [
-                e
-                for (e,) in c.execute(
-                    """
-                    SELECT DISTINCT encaminhamento FROM records
-                     WHERE encaminhamento IS NOT NULL
-                       AND (substr(date,7,4)||substr(date,4,2)||substr(date,1,2))
-                           BETWEEN ? AND ?
-                    """,
-                    (d0, d1),
-                )
-            ]
-        for enc in sorted(encs):
-            self.cmb_enc.addItem(enc, enc)
-        self.cmb_enc.blockSignals(False)
+        self._debounce.stop()
+        codes, encs = search_options(change_stamp(), *self._date_iso_range())
+
+        for cmb, values in ((self.cmb_dmd, codes), (self.cmb_enc, encs)):
+            old_sel = cmb.currentData()
+            cmb.blockSignals(True)
+            cmb.clear()
+            cmb.addItem("— Qualquer —", "")
+            for value in values:
+                cmb.addItem(value, value)
+            # mantém a escolha se ela ainda existir no novo intervalo
+            i = cmb.findData(old_sel)
+            cmb.setCurrentIndex(i if i != -1 else 0)
+            cmb.blockSignals(False)
 
     def filters(self):
         return dict(
             name=self.txt_name.text().strip(),
             prof=self.txt_prof.text().strip(),
+            obs=self.txt_obs.text().strip(),
             dmd=self.cmb_dmd.currentData(),   # "" se “Qualquer”
             enc=self.cmb_enc.currentData(),
             d_ini=self.d_ini.date().toString("dd/MM/yyyy"),
@@ -193,3 +201,81 @@ class SearchDialog(QDialog):
             adv=self.chk_adv.isChecked(),
             active_only=self.chk_active.isChecked(),
         )
+
+
+# rótulos do DiagnosticsDialog, na ordem da tela (chaves de sqlite_diagnostics)
+DIAG_LABELS = {
+    "profile": "Perfil (settings.json):",
+    "sqlite_version": "Versão do SQLite:",
+    "journal_mode": "journal_mode:",
+    "synchronous": "synchronous:",
+    "temp_store": "temp_store:",
+    "cache_size": "cache_size:",
+    "mmap_size": "mmap_size:",
+    "page_size": "page_size:",
+    "page_count": "Páginas:",
+    "freelist_count": "Páginas livres:",
+    "auto_vacuum": "auto_vacuum:",
+    "user_version": "Versão do esquema:",
+    "db_mb": "Banco (MB):",
+    "wal_mb": "WAL (MB):",
+}
+
+
+class DiagnosticsDialog(QDialog):
+    """
+    Valores efetivos do SQLite (perfil de desempenho, tamanho do banco…).
+    `queries` é o QueryExecutor da janela principal (a conversão roda nele);
+    o diálogo se apaga ao fechar.
+    """
+
+    def __init__(self, queries, parent=None):
+        super().__init__(parent)
+        self.setAttribute(Qt.WA_DeleteOnClose)
+        self.setWindowTitle("Diagnóstico do banco 🩺")
+        lay = QFormLayout(self)
+        self.values = sqlite_diagnostics()
+        self.value_lbls = {}
+        for key, label in DIAG_LABELS.items():
+            self.value_lbls[key] = QLabel(str(self.values.get(key, "")))
+            lay.addRow(label, self.value_lbls[key])
+
+        # banco antigo: a manutenção só devolve páginas depois de converter
+        self.btn_vacuum = QPushButton("Ativar vacuum incremental…", clicked=self._convert)
+        self.btn_vacuum.setVisible(self.values["auto_vacuum"] != 2)
+        lay.addRow("", self.btn_vacuum)
+        lay.addRow("", QPushButton("Fechar", clicked=self.accept))
+        self._queries = queries
+        self._progress = None
+
+    def done(self, result):
+        # o VACUUM ainda roda e devolve o resultado a este diálogo
+        if not self._queries.pending("vacuum"):
+            super().done(result)
+
+    def _convert(self):
+        ok = QMessageBox.question(
+            self, "Vacuum incremental",
+            f"O banco ({self.values['db_mb']} MB) será reescrito por inteiro; "
+            "pode levar alguns minutos. Continuar?",
+        )
+        if ok != QMessageBox.Yes:
+            return
+        self.btn_vacuum.setEnabled(False)
+        self._progress = QProgressDialog("Reescrevendo o banco (VACUUM)…", None, 0, 0, self)
+        self._progress.setWindowModality(Qt.WindowModal)
+        self._progress.show()
+        self._queries.submit("vacuum", enable_incremental_vacuum,
+                             on_result=self._converted, on_error=self._convert_failed)
+
+    def _converted(self, _=None):
+        self._progress.close()
+        self.values = sqlite_diagnostics()
+        for key, lbl in self.value_lbls.items():
+            lbl.setText(str(self.values.get(key, "")))
+        self.btn_vacuum.setVisible(self.values["auto_vacuum"] != 2)
+
+    def _convert_failed(self, exc):
+        self._progress.close()
+        self.btn_vacuum.setEnabled(True)
+        QMessageBox.critical(self, "Vacuum incremental", f"Falha ao converter:\n{exc}")
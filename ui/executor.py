@@ -0,0 +1,132 @@
+import logging
+import threading
+
+from PyQt5.QtCore import (
+    QCoreApplication,
+    QObject,
+    QRunnable,
+    QThreadPool,
+    pyqtSignal,
+    pyqtSlot,
+)
+
+import infra
+
+# threads de consulta: uma presa no busy_timeout não segura as outras
+QUERY_THREADS = 4
+
+
+class _Job(QRunnable):
+    """Uma chamada fn(*args) numa thread do pool, com a conexão SQLite dela."""
+
+    def __init__(self, channel, fn, args, on_result, on_error, finished):
+        super().__init__()
+        self.setAutoDelete(False)        # o executor guarda a referência
+        self.channel = channel
+        self.on_result, self.on_error = on_result, on_error
+        self.cancelled = False
+        self._fn, self._args = fn, args
+        self._finished = finished
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def run(self):
+        with self._lock:
+            if not self.cancelled:
+                self._conn = infra.connection()      # a mesma que fn vai usar
+        result = error = None
+        if self._conn is not None:
+            try:
+                result = self._fn(*self._args)
+            except Exception as exc:     # noqa: BLE001 - vai para o on_error
+                error = exc
+            finally:
+                with self._lock:
+                    self._conn = None
+        self._finished.emit(self, result, error)
+
+    def cancel(self) -> None:
+        with self._lock:
+            self.cancelled = True
+            if self._conn is not None:
+                self._conn.interrupt()           # aborta o SQL em andamento
+
+
+class QueryExecutor(QObject):
+    """
+    Roda consultas num QThreadPool para a tela não congelar enquanto o
+    SQLite espera disco lento ou lock (até o busy_timeout). Cada thread
+    usa a própria conexão do ConnectionManager.
+
+    submit(canal, fn, *args, on_result=…, on_error=…): o resultado volta
+    na thread da tela. Um novo submit no mesmo canal (ex.: "day" quando a
+    data muda de novo) cancela o anterior: se ainda estava na fila, nem
+    roda; se já rodava, o SQL é interrompido e o resultado descartado.
+    `busy` avisa quando há consulta em andamento (indicador de carga).
+    """
+
+    busy = pyqtSignal(bool)
+    _finished = pyqtSignal(object, object, object)      # job, resultado, erro
+
+    def __init__(self, parent=None, max_threads=QUERY_THREADS):
+        super().__init__(parent)
+        self._pool = QThreadPool(self)
+        self._pool.setMaxThreadCount(max_threads)
+        # threads nunca expiram: a conexão de cada uma é reaproveitada
+        self._pool.setExpiryTimeout(-1)
+        self._jobs = {}          # canal → job atual
+        self._started = set()    # todos os jobs ainda não devolvidos
+        self._finished.connect(self._on_finished)
+
+    def submit(self, channel, fn, *args, on_result, on_error=None) -> None:
+        was_busy = bool(self._jobs)
+        old = self._jobs.pop(channel, None)
+        if old is not None:
+            self._drop(old)
+        job = _Job(channel, fn, args, on_result, on_error, self._finished)
+        self._jobs[channel] = job
+        self._started.add(job)
+        self._pool.start(job)
+        if not was_busy:
+            self.busy.emit(True)
+
+    def cancel(self, channel) -> None:
+        job = self._jobs.pop(channel, None)
+        if job is None:
+            return
+        self._drop(job)
+        if not self._jobs:
+            self.busy.emit(False)
+
+    def cancel_all(self) -> None:
+        for channel in list(self._jobs):
+            self.cancel(channel)
+
+    def pending(self, channel=None) -> bool:
+        return bool(self._jobs) if channel is None else channel in self._jobs
+
+    def wait(self, msecs: int = -1) -> bool:
+        """Espera o pool esvaziar e entrega os resultados (encerramento, testes)."""
+        done = self._pool.waitForDone(msecs)
+        QCoreApplication.sendPostedEvents(self)
+        return done
+
+    def _drop(self, job) -> None:
+        job.cancel()
+        if self._pool.tryTake(job):                # ainda na fila
+            self._started.discard(job)
+
+    @pyqtSlot(object, object, object)       # recebido pelo próprio executor (ver wait)
+    def _on_finished(self, job, result, error):
+        self._started.discard(job)
+        if job.cancelled or self._jobs.get(job.channel) is not job:
+            return                                 # cancelado / substituído
+        del self._jobs[job.channel]
+        if not self._jobs:
+            self.busy.emit(False)
+        if error is None:
+            job.on_result(result)
+        elif job.on_error is not None:
+            job.on_error(error)
+        else:
+            logging.getLogger(__name__).warning("Consulta falhou: %s", error)
@@ -0,0 +1,156 @@
+from itertools import chain
+from operator import itemgetter
+
+from PyQt5.QtCore import QAbstractTableModel, QModelIndex, QSortFilterProxyModel, Qt
+from PyQt5.QtGui import QColor
+
+# id do registro de qualquer célula (funciona também através de proxies)
+ROW_ID_ROLE = Qt.UserRole
+
+EDITED_MARK = "🖊️"
+
+
+class RowTableModel(QAbstractTableModel):
+    """
+    Tabela somente-leitura sobre uma lista de linhas em memória.
+
+    As linhas ficam como vieram (tuplas ou Record); `columns(row)` dá as
+    células exibidas e `key(row)` o id (None → a própria linha).
+    set_rows() compara com o conteúdo anterior pelo id: linhas que
+    saíram/entraram viram remove/insert, as que ficaram e mudaram viram
+    um único dataChanged (da primeira à última alterada) — a view só
+    repinta o que mudou e só pede data() das células visíveis.
+      • `mark_col`  : recebe 🖊️ quando o id está em `edited`
+      • `muted_col` : valor verdadeiro → linha cinza, não selecionável (clones)
+    """
+
+    def __init__(self, headers, parent=None, *, columns=tuple, key=itemgetter(0),
+                 mark_col=1, muted_col=None):
+        super().__init__(parent)
+        self._headers = list(headers)
+        self._rows = []
+        self._edited = frozenset()
+        self._columns = columns
+        self._key = key or tuple
+        self._mark_col = mark_col
+        self._muted_col = muted_col
+
+    # ----------------------------------------------------------- leitura
+    # parent=None é a raiz (tabela plana: só a raiz tem linhas)
+    def rowCount(self, parent=None):
+        return 0 if parent is not None and parent.isValid() else len(self._rows)
+
+    def columnCount(self, parent=None):
+        return 0 if parent is not None and parent.isValid() else len(self._headers)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return self._headers[section]
+        return super().headerData(section, orientation, role)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row = self._rows[index.row()]
+        if role == Qt.DisplayRole:
+            val = self._columns(row)[index.column()]
+            text = "" if val is None else str(val)
+            if index.column() == self._mark_col and self._key(row) in self._edited:
+                text += EDITED_MARK
+            return text
+        if role == ROW_ID_ROLE:
+            return self._key(row)
+        if role == Qt.ForegroundRole and self._muted(row):
+            return QColor(Qt.gray)
+        return None
+
+    def flags(self, index):
+        if not index.isValid() or self._muted(self._rows[index.row()]):
+            return Qt.NoItemFlags
+        return Qt.ItemIsSelectable | Qt.ItemIsEnabled
+
+    def rows(self) -> list:
+        return self._rows
+
+    def row_at(self, row: int):
+        return self._rows[row]
+
+    def row_of(self, row_id) -> int:
+        """Linha do id (ou -1)."""
+        return next((i for i, r in enumerate(self._rows) if self._key(r) == row_id), -1)
+
+    # ----------------------------------------------------------- escrita
+    def set_rows(self, rows, edited=()) -> None:
+        new = list(rows)
+        old = self._rows
+        old_edited, self._edited = self._edited, frozenset(edited)
+
+        # prefixo/sufixo com os mesmos ids ficam no lugar; o miolo é trocado
+        n = min(len(old), len(new))
+        head = 0
+        while head < n and self._key(old[head]) == self._key(new[head]):
+            head += 1
+        tail = 0
+        while tail < n - head and self._key(old[-1 - tail]) == self._key(new[-1 - tail]):
+            tail += 1
+        mid_old = len(old) - head - tail
+        mid_new = len(new) - head - tail
+
+        if mid_old:
+            self.beginRemoveRows(QModelIndex(), head, head + mid_old - 1)
+            self._rows = old[:head] + old[head + mid_old:]
+            self.endRemoveRows()
+        if mid_new:
+            self.beginInsertRows(QModelIndex(), head, head + mid_new - 1)
+            self._rows = old[:head] + new[head:head + mid_new] + old[head + mid_old:]
+            self.endInsertRows()
+
+        kept = self._rows
+        self._rows = new
+        changed = [
+            i for i in chain(range(head), range(len(new) - tail, len(new)))
+            if kept[i] != new[i]
+            or (self._key(new[i]) in old_edited) != (self._key(new[i]) in self._edited)
+        ]
+        # um sinal só: o proxy ordenado reposiciona todas as linhas alteradas
+        # de uma vez. Um por bloco faria a cabeça ser reposicionada enquanto a
+        # cauda, já com o valor novo, ainda está no lugar antigo (busca
+        # binária sobre lista fora de ordem).
+        if changed:
+            self.dataChanged.emit(self.index(changed[0], 0),
+                                  self.index(changed[-1], self.columnCount() - 1))
+
+    def _muted(self, row) -> bool:
+        return self._muted_col is not None and bool(self._columns(row)[self._muted_col])
+
+
+class RowFilterProxy(QSortFilterProxyModel):
+    """
+    Filtro e ordem da tela sobre um RowTableModel, em Python: trocar o
+    filtro não consulta o banco. `accept(row)` decide se a linha aparece
+    e `sort_key(row)` ordena (None → ordem de origem). Com o filtro
+    dinâmico, linhas novas da origem já entram filtradas e no lugar.
+    """
+
+    def __init__(self, source, parent=None):
+        super().__init__(parent)
+        self._accept = None
+        self._sort_key = None
+        self.setSourceModel(source)
+        self.setDynamicSortFilter(True)
+
+    def set_view(self, accept=None, sort_key=None) -> None:
+        # sort(-1) antes: invalidate() com a coluna de ordem ainda ativa
+        # chamaria lessThan() já com _sort_key=None
+        self.sort(-1)
+        self._accept, self._sort_key = accept, sort_key
+        self.invalidate()
+        if sort_key:
+            self.sort(0)
+
+    def filterAcceptsRow(self, source_row, source_parent):
+        return self._accept is None or self._accept(self.sourceModel().row_at(source_row))
+
+    def lessThan(self, left, right):
+        rows = self.sourceModel()
+        return self._sort_key(rows.row_at(left.row())) < self._sort_key(rows.row_at(right.row()))
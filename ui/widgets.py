@@ -1,5 +1,13 @@
 from PyQt5.QtCore import Qt, pyqtSignal
-from PyQt5.QtWidgets import QLabel, QLineEdit
+from PyQt5.QtWidgets import (
+    QAbstractItemView,
+    QHeaderView,
+    QLabel,
+    QLineEdit,
+    QTableView,
+)
+
+from ui.models import ROW_ID_ROLE
 
 
 class ClickLabel(QLabel):
@@ -14,3 +22,27 @@ class MyLineEdit(QLineEdit):
         super().keyPressEvent(e)
         if e.key() in (Qt.Key_Return, Qt.Key_Enter):
             self.focusNextChild()
+
+
+class RowTableView(QTableView):
+    """Tabela de registros: só leitura, seleção por linha, altura fixa (sem medir linhas)."""
+
+    def __init__(self, model, parent=None):
+        super().__init__(parent)
+        self.setModel(model)
+        self.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+
+    def selected_ids(self) -> list:
+        """ids das linhas selecionadas, na ordem da tela."""
+        rows = sorted(self.selectionModel().selectedRows(), key=lambda i: i.row())
+        return [i.data(ROW_ID_ROLE) for i in rows]
+
+    def select_id(self, row_id) -> bool:
+        model = self.model()
+        hits = model.match(model.index(0, 0), ROW_ID_ROLE, row_id, 1, Qt.MatchExactly)
+        if hits:
+            self.selectRow(hits[0].row())
+        return bool(hits)